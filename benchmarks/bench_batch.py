@@ -0,0 +1,51 @@
+"""
+Time to redirect many bibcode lists one call each and in one batch
+
+    $ python benchmarks/bench_batch.py
+
+50 lists of 1000 bibcodes are posted to /redirect one by one and to
+/redirect/batch at once, against a local stand-in vault answering in 50 ms
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import json
+import time
+
+from tugboat.app import create_app
+from tugboat.tests.fake_vault import FakeVault
+
+
+def lists(n, size, offset):
+    return [['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000)
+             for i in range(offset + j * size, offset + (j + 1) * size)] for j in range(n)]
+
+
+if __name__ == '__main__':
+    n, size = 50, 1000
+    vault = FakeVault(latency=lambda: 0.05)
+    app = create_app()
+    app.config['VAULT_QUERY_URL'] = vault.url + '/query'
+    client = app.test_client()
+
+    start = time.time()
+    for bibcodes in lists(n, size, 0):
+        r = client.post('/redirect', data=json.dumps(bibcodes))
+        assert r.status_code == 200, r.data
+    one_by_one = time.time() - start
+
+    # other bibcodes, so none of the qids is cached
+    batch = [{'name': str(i), 'bibcodes': bibcodes} for i, bibcodes in enumerate(lists(n, size, n * size))]
+    start = time.time()
+    r = client.post('/redirect/batch', data=json.dumps(batch))
+    assert all(result['status_code'] == 200 for result in json.loads(r.data)['results']), r.data
+    batched = time.time() - start
+
+    print('{} lists of {} bibcodes  one call each {:6.2f} s  one batch ({} concurrent) {:6.2f} s'.format(
+        n, size, one_by_one, app.config['BATCH_CONCURRENCY'], batched))
+    app.extensions['client'].session.close()
+    vault.close()
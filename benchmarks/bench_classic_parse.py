@@ -0,0 +1,72 @@
+"""
+Per-request cost of building the classic view and parsing its parameters
+
+    $ python benchmarks/bench_classic_parse.py
+
+reports the latency of ClassicSearchRedirectView().parse(request) for a
+typical fielded classic query, with the compiled webargs schema and with the
+fast parser (CLASSIC_FAST_PARSER), and the number of container objects each
+request leaves behind for the cyclic garbage collector
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import gc
+import timeit
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from tugboat.views import ClassicSearchRedirectView
+
+
+class FakeRequest(object):
+    """the parts of a flask request that the classic view parses"""
+    def __init__(self, args):
+        self.args = args
+        self.mimetype = None
+        self.json = None
+
+
+REQUEST = FakeRequest(MultiDict([('author', 'Huchra,+John;Macri,+Lucas+M.'), ('aut_logic', 'OR'),
+                                 ('start_year', '1990'), ('db_key', 'AST'), ('sort', 'NDATE'),
+                                 ('aut_syn', 'YES'), ('ttl_syn', 'YES'), ('txt_syn', 'YES'),
+                                 ('aut_wt', '1.0'), ('obj_wt', '1.0'), ('ttl_wt', '0.3'), ('txt_wt', '3.0'),
+                                 ('aut_wgt', 'YES'), ('obj_wgt', 'YES'), ('ttl_wgt', 'YES'), ('txt_wgt', 'YES'),
+                                 ('ttl_sco', 'YES'), ('txt_sco', 'YES')]))
+
+
+def parse_once():
+    ClassicSearchRedirectView().parse(REQUEST)
+
+
+def garbage_per_request(n=1000):
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        for _ in range(n):
+            parse_once()
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+        gc.collect()
+    return (after - before) / float(n)
+
+
+def report(label):
+    n = 2000
+    best = min(timeit.repeat(parse_once, number=n, repeat=5)) / n
+    print('{:<16} view + parse: {:8.1f} us/request, gc objects: {:5.1f} per request'.format(
+        label, best * 1e6, garbage_per_request()))
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    for fast in (False, True):
+        app.config['CLASSIC_FAST_PARSER'] = fast
+        with app.app_context():
+            report('fast parser' if fast else 'webargs schema')
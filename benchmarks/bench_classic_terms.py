@@ -0,0 +1,63 @@
+"""
+Cost of tokenizing and encoding huge classic author/object fields
+
+    $ python benchmarks/bench_classic_terms.py
+
+reports the time to turn a field of 10, 1k and 50k entries into the encoded
+bumblebee search clause with classic_terms, with the loop classic_field_to_array
+used to run and with a regex driven generator that builds no list of terms
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import re
+import timeit
+import urllib
+
+from tugboat.translator import classic_term, classic_terms, quote_join
+
+
+def classic_field_to_array(value):
+    """the loop classic_field_to_array used to run, for comparison"""
+    value = urllib.unquote(value)
+    value = value.replace('\r\n', ';')
+    values = value.split(';')
+    for i in range(0, len(values)):
+        values[i] = values[i].replace('+', ' ')
+        if ' ' in values[i] and (values[i].startswith('"') and values[i].endswith('"')) is False:
+            values[i] = '"' + values[i] + '"'
+    return values
+
+
+_term_separator = re.compile(r';|\r\n')
+
+
+def classic_terms_generator(value):
+    """terms sliced between the separators found by a regex scan, for comparison"""
+    value = urllib.unquote(value).replace('+', ' ')
+    start = 0
+    for separator in _term_separator.finditer(value):
+        yield classic_term(value[start:separator.start()])
+        start = separator.end()
+    yield classic_term(value[start:])
+
+
+def field(n):
+    """author field as classic sends it, quoted names separated by line breaks"""
+    return urllib.quote('\r\n'.join('Author{},+A.+B.'.format(i) for i in range(n)))
+
+
+if __name__ == '__main__':
+    for n in (10, 1000, 50000):
+        value = field(n)
+        number = max(1, 20000 // n)
+        expected = quote_join(classic_terms(value), ' AND ')
+        for name, tokenize in (('split', classic_terms), ('loop', classic_field_to_array),
+                               ('generator', classic_terms_generator)):
+            assert quote_join(tokenize(value), ' AND ') == expected
+            best = min(timeit.repeat(lambda: quote_join(tokenize(value), ' AND '), number=number, repeat=5)) / number
+            print('{:>6} entries {:<10} {:10.1f} us/field'.format(n, name, best * 1e6))
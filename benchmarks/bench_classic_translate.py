@@ -0,0 +1,51 @@
+"""
+Per-request cost of translating classic queries to bumblebee
+
+    $ python benchmarks/bench_classic_translate.py
+
+reports the latency of ClassicSearchRedirectView().translate(request) for a
+short and a fully featured classic query
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import timeit
+from werkzeug.datastructures import MultiDict
+
+from tugboat.views import ClassicSearchRedirectView
+
+
+class FakeRequest(object):
+    """the parts of a flask request that the classic view parses"""
+    def __init__(self, args):
+        self.args = args
+        self.mimetype = None
+        self.json = None
+
+
+DEFAULT_WEIGHTS = [('aut_syn', 'YES'), ('ttl_syn', 'YES'), ('txt_syn', 'YES'),
+                   ('aut_wt', '1.0'), ('obj_wt', '1.0'), ('ttl_wt', '0.3'), ('txt_wt', '3.0'),
+                   ('aut_wgt', 'YES'), ('obj_wgt', 'YES'), ('ttl_wgt', 'YES'), ('txt_wgt', 'YES'),
+                   ('ttl_sco', 'YES'), ('txt_sco', 'YES')]
+
+QUERIES = {
+    'short': [('author', 'Huchra,+John'), ('db_key', 'AST')] + DEFAULT_WEIGHTS,
+    'full': [('author', 'Huchra,+John;Macri,+Lucas+M.'), ('aut_logic', 'OR'), ('object', 'M31'),
+             ('title', 'redshift+survey'), ('text', 'large+scale+structure'), ('start_year', '1990'),
+             ('end_year', '2000'), ('db_key', 'AST'), ('jou_pick', 'NO'), ('data_and', 'YES'),
+             ('article', 'YES'), ('group_and', 'NO'), ('group_sel', 'CfA'), ('group_sel', 'HST'),
+             ('sort', 'NDATE'), ('arxiv_sel', 'astro-ph'), ('ref_stems', 'ApJ..,AJ...'),
+             ('article_sel', 'YES'), ('sim_query', 'YES')] + DEFAULT_WEIGHTS,
+}
+
+
+if __name__ == '__main__':
+    n = 2000
+    for name in sorted(QUERIES):
+        request = FakeRequest(MultiDict(QUERIES[name]))
+        best = min(timeit.repeat(lambda: ClassicSearchRedirectView().translate(request), number=n, repeat=5)) / n
+        print('{:<6} translate: {:8.1f} us/request'.format(name, best * 1e6))
@@ -0,0 +1,42 @@
+"""
+Time and memory of the json codecs on /redirect request bodies
+
+    $ python benchmarks/bench_codec.py
+
+reports the peak memory growth and the time to turn 10k and 500k bibcodes
+posted as a json list into the bigquery text: read in chunks by the
+streaming parser of tugboat/upload.py, and decoded whole by each installed
+codec of tugboat/codec.py, as batch uploads are. Each run is in a forked
+process so the peaks do not mix
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+from bench_upload import measure, streamed
+from tugboat.codec import DECODERS
+from tugboat.upload import BibcodeUpload
+
+
+def decoded(loads):
+    """the bigquery text from the body decoded at once"""
+    def read(body):
+        bibcodes = loads(body.read())
+        upload = BibcodeUpload(spool_size=1024 * 1024)
+        upload.extend([bibcode.encode('utf-8') for bibcode in bibcodes])
+        size = len(upload.bigquery())
+        upload.close()
+        return size
+    return read
+
+
+if __name__ == '__main__':
+    runs = [('streamed', streamed)] + [(name, decoded(loads)) for name, loads in sorted(DECODERS.items())]
+    for n in (10000, 500000):
+        for name, read in runs:
+            size, peak, elapsed = measure(read, n)
+            print('{:>8} bibcodes {:<10} {:6.1f} MB body {:8.1f} MB peak growth {:6.3f} s'.format(
+                n, name, size, peak, elapsed))
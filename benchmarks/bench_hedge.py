@@ -0,0 +1,59 @@
+"""
+Latency of storing bibcode lists with and without hedged vault requests
+
+    $ python benchmarks/bench_hedge.py
+
+a local stand-in vault answers in about 10 ms and in 300 ms for 3% of the
+requests, the p50 and p99 of 400 store_query calls are reported with the
+number of requests vault received
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import random
+import time
+
+from tugboat.app import create_app
+from tugboat.upload import BibcodeUpload
+from tugboat.vault import store_query
+from tugboat.tests.fake_vault import FakeVault
+
+
+def latency(rng=random.Random(0)):
+    return 0.3 if rng.random() < 0.03 else rng.uniform(0.008, 0.012)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+if __name__ == '__main__':
+    n = 400
+    vault = FakeVault(latency=latency)
+    upload = BibcodeUpload(spool_size=1024 * 1024)
+    upload.extend(['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000) for i in range(100)])
+    for hedge in (False, True):
+        app = create_app()
+        app.config['VAULT_QUERY_URL'] = vault.url + '/query'
+        app.config['VAULT_HEDGE'] = hedge
+        received = len(vault.received)
+        times = []
+        with app.test_request_context():
+            for i in range(n):
+                start = time.time()
+                store_query(upload)
+                times.append(time.time() - start)
+        stats = app.extensions['vault_hedger'].stats()
+        print('hedge {:<5}  p50 {:6.1f} ms  p99 {:6.1f} ms  vault requests {}  hedged {}  hedge wins {}  delay {:.1f} ms'.format(
+            hedge, percentile(times, 50) * 1e3, percentile(times, 99) * 1e3, len(vault.received) - received,
+            stats['hedged'], stats['hedge_wins'], (stats['delay'] or 0) * 1e3))
+        # let the attempts that lost finish before the connections are closed
+        time.sleep(0.5)
+        app.extensions['client'].session.close()
+    upload.close()
+    vault.close()
@@ -0,0 +1,105 @@
+"""
+Throughput of /redirect with sync and gevent gunicorn workers
+
+    $ python benchmarks/bench_redirect_workers.py
+
+serves the application with 6 sync workers, as resources/gunicorn.conf.py,
+and with 2 gevent workers, as resources/gunicorn_redirect.conf.py, against
+a local stand-in vault that answers after 200 ms, and reports requests per
+second and latencies for increasing numbers of concurrent clients
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import itertools
+import json
+import socket
+import subprocess
+import threading
+import time
+import requests
+
+from tugboat.app import create_app
+
+if 'BENCH_VAULT_URL' in os.environ:
+    # loaded by gunicorn
+    application = create_app()
+    application.config['VAULT_QUERY_URL'] = os.environ['BENCH_VAULT_URL']
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def serve(vault_url, *args):
+    """start gunicorn and return it once it answers"""
+    port = free_port()
+    env = dict(os.environ, BENCH_VAULT_URL=vault_url, PYTHONPATH=os.pathsep.join(sys.path))
+    server = subprocess.Popen(
+        [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()', '--bind', '127.0.0.1:{}'.format(port),
+         '--preload', '--log-level', 'warning'] + list(args) + ['bench_redirect_workers:application'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    url = 'http://127.0.0.1:{}'.format(port)
+    for i in range(100):
+        try:
+            requests.get(url + '/metrics')
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn did not start')
+
+
+def run(url, clients, n, lists):
+    """post n lists from clients threads, return the seconds taken and the latencies"""
+    latencies = []
+    errors = []
+
+    def client():
+        session = requests.Session()
+        for bibcodes in iter(lambda: next(lists, None), None):
+            start = time.time()
+            r = session.post(url + '/redirect', data=json.dumps(bibcodes))
+            latencies.append(time.time() - start)
+            if r.status_code != 200:
+                errors.append(r.status_code)
+
+    lists = iter(list(itertools.islice(lists, n)))
+    start = time.time()
+    threads = [threading.Thread(target=client) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError('{} requests failed: {}'.format(len(errors), errors[:5]))
+    return time.time() - start, sorted(latencies)
+
+
+if __name__ == '__main__':
+    from tugboat.tests.fake_vault import FakeVault
+
+    vault = FakeVault(latency=lambda: 0.2)
+    # a new list for every request, so none is answered from the qid cache
+    lists = (['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000 + j) for j in range(3)]
+             for i in itertools.count(0, 3))
+    for name, args in (('sync x6', ['--workers', '6']),
+                       ('gevent x2', ['--workers', '2', '--worker-class', 'gevent', '--worker-connections', '200'])):
+        server, url = serve(vault.url + '/query', *args)
+        try:
+            for clients in (6, 24, 96, 192):
+                seconds, latencies = run(url, clients, clients * 5, lists)
+                print('{:<10} {:4d} clients  {:6.1f} requests/s  p50 {:6.0f} ms  p99 {:6.0f} ms'.format(
+                    name, clients, len(latencies) / seconds, latencies[len(latencies) // 2] * 1e3,
+                    latencies[int(len(latencies) * 0.99)] * 1e3))
+        finally:
+            server.terminate()
+            server.wait()
+    vault.close()
@@ -0,0 +1,96 @@
+"""
+Memory and time to read a huge bibcode list posted to /redirect
+
+    $ python benchmarks/bench_upload.py
+
+reports the body size, the peak memory growth and the time to turn 100k and 1M
+bibcodes into the bigquery text: a json list read with json.loads of the whole body
+as request.get_json used to do, and json or newline separated text, plain or gzip
+encoded, read in chunks by tugboat/upload.py. Each run is in a forked process so
+the peaks do not mix
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import io
+import gzip
+import json
+import resource
+import time
+
+from tugboat.upload import iter_json_batches, iter_text_batches, decompress, read_stream, BibcodeUpload
+
+
+def loaded(body):
+    """the bigquery text from the whole body, for comparison"""
+    bibcodes = json.loads(body.read())
+    return len('bibcode\n' + '\n'.join(bibcodes).encode('utf-8'))
+
+
+def streamed(body, batches=iter_json_batches, encoding=None):
+    upload = BibcodeUpload(spool_size=1024 * 1024)
+    chunks = read_stream(body, sys.maxsize)
+    if encoding:
+        chunks = decompress(chunks, encoding, sys.maxsize)
+    for bibcodes in batches(chunks):
+        upload.extend(bibcodes)
+    size = len(upload.bigquery())
+    upload.close()
+    return size
+
+
+def request_body(n, text=False, encoding=None):
+    """
+    n distinct bibcodes as a json list or one per line, written item by item
+    so building the body does not raise the peak
+    """
+    body = io.BytesIO()
+    out = gzip.GzipFile(fileobj=body, mode='wb') if encoding == 'gzip' else body
+    out.write('' if text else '[')
+    for i in range(n):
+        bibcode = '{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000)
+        out.write(bibcode + '\n' if text else '{}"{}"'.format(', ' if i else '', bibcode))
+    out.write('' if text else ']')
+    if out is not body:
+        out.close()
+    body.seek(0)
+    return body
+
+
+def measure(read, n, text=False, encoding=None):
+    """run read in a child, return the body size and its peak memory growth in MB and its time"""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        body = request_body(n, text, encoding)
+        size = len(body.getvalue()) / 1024.0 / 1024
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        read(body)
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(wfd, '{} {} {}'.format(size, (peak - before) / 1024.0, elapsed))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 100)
+    os.waitpid(pid, 0)
+    return [float(x) for x in result.split()]
+
+
+if __name__ == '__main__':
+    runs = (
+        ('json.loads', loaded, False, None),
+        ('json', streamed, False, None),
+        ('text', lambda body: streamed(body, iter_text_batches), True, None),
+        ('json gzip', lambda body: streamed(body, encoding='gzip'), False, 'gzip'),
+        ('text gzip', lambda body: streamed(body, iter_text_batches, 'gzip'), True, 'gzip'),
+    )
+    for n in (100000, 1000000):
+        for name, read, text, encoding in runs:
+            size, peak, elapsed = measure(read, n, text, encoding)
+            print('{:>8} bibcodes {:<10} {:6.1f} MB body {:8.1f} MB peak growth {:6.2f} s'.format(
+                n, name, size, peak, elapsed))
@@ -0,0 +1,43 @@
+"""
+Bytes and cpu time to serialize the bigquery posted to vault/query
+
+    $ python benchmarks/bench_vault_upload.py
+
+prepares the post of 100k bibcodes in every VAULT_TRANSPORT, plain and gzip
+encoded, and reports the body size and the time to build and read it, the
+work done in the worker besides the network transfer
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import timeit
+import requests
+
+from tugboat.upload import BibcodeUpload
+from tugboat.vault import bigquery_request
+
+
+def body_size(upload, config):
+    """size of the body requests would send"""
+    prepared = requests.Request('POST', 'http://vault/query', **bigquery_request(upload, config)).prepare()
+    if isinstance(prepared.body, str):
+        return len(prepared.body)
+    return sum(len(chunk) for chunk in prepared.body)
+
+
+if __name__ == '__main__':
+    n = 100000
+    upload = BibcodeUpload(spool_size=1024 * 1024)
+    upload.extend(['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000) for i in range(n)])
+    for transport in ('form', 'multipart', 'raw'):
+        for level in (0, 1, 6):
+            config = {'VAULT_TRANSPORT': transport, 'VAULT_GZIP_LEVEL': level}
+            size = body_size(upload, config)
+            best = min(timeit.repeat(lambda: body_size(upload, config), number=3, repeat=3)) / 3
+            print('{} bibcodes {:<10} gzip {}  {:7.2f} MB  {:7.1f} ms'.format(
+                n, transport, level, size / 1024.0 / 1024, best * 1e3))
+    upload.close()
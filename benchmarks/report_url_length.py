@@ -0,0 +1,80 @@
+"""
+Length of the bumblebee redirect urls in the verbose and compact output modes
+
+    $ python benchmarks/report_url_length.py [number of queries]
+
+translates a seeded random corpus of classic search forms and reports url
+length statistics and how many urls exceed common browser/proxy limits
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(PROJECT_HOME)
+
+import random
+import urllib
+
+from tugboat.translator import translate, WEIGHT_DEFAULTS
+
+REDIRECT_PREFIX = 'https://ui.adsabs.harvard.edu/#search/'
+URL_LIMITS = (2048, 8192)
+
+AUTHORS = ['Huchra, John', 'Macri, Lucas M.', 'Kurtz, Michael J.', 'Accomazzi, Alberto', 'Grant, Carolyn S.',
+           'Eichhorn, Guenther', 'Murray, Stephen S.', 'Henneken, Edwin A.']
+WORDS = ['dark', 'matter', 'redshift', 'survey', 'galaxy', 'cluster', 'M31', 'NGC 224', 'supernova', 'lensing']
+GROUPS = ['ARI', 'CfA', 'CFHT', 'Chandra', 'ESO/Lib', 'HST', 'Keck', 'Spitzer', 'XMM']
+ARXIV = ['astro-ph', 'cs', 'gr-qc', 'hep-th', 'physics']
+DATA_ENTRIES = ['article_link', 'gif_link', 'article', 'toc_link', 'ref_link', 'citation_link', 'simb_obj', 'abstract']
+
+
+def classic_form(rng):
+    """parameters of a random classic search form submission"""
+    form = list(WEIGHT_DEFAULTS.items())
+    form.append(('author', ';'.join(rng.sample(AUTHORS, rng.randint(1, len(AUTHORS))))))
+    form.append(('aut_logic', rng.choice(['OR', 'AND'])))
+    for field in ('object', 'title', 'text'):
+        if rng.random() < 0.5:
+            form.append((field, ' '.join(rng.sample(WORDS, rng.randint(1, 4)))))
+    if rng.random() < 0.5:
+        form.extend([('start_year', str(rng.randint(1980, 2000))), ('end_year', str(rng.randint(2001, 2018)))])
+    form.append(('db_key', rng.choice(['AST', 'PHY', 'GEN'])))
+    form.append(('jou_pick', rng.choice(['ALL', 'NO', 'EXCL'])))
+    form.extend((name, 'YES') for name in ('article_sel', 'data_link', 'open_link', 'preprint_link')
+                if rng.random() < 0.4)
+    if rng.random() < 0.5:
+        form.append(('data_and', rng.choice(['NO', 'YES'])))
+        form.extend((name, 'YES') for name in rng.sample(DATA_ENTRIES, rng.randint(1, 4)))
+    if rng.random() < 0.5:
+        form.append(('group_and', rng.choice(['NO', 'YES'])))
+        form.extend(('group_sel', group) for group in rng.sample(GROUPS, rng.randint(1, 4)))
+    if rng.random() < 0.3:
+        form.extend(('arxiv_sel', keyword) for keyword in rng.sample(ARXIV, rng.randint(1, 3)))
+    if rng.random() < 0.3:
+        form.append(('ref_stems', 'ApJ..,AJ...,MNRAS'))
+    form.append(('sort', rng.choice(['SCORE', 'SCORE', 'NDATE', 'CITATIONS'])))
+    return urllib.urlencode(form)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(2018)
+    forms = [classic_form(rng) for i in range(n)]
+    lengths = {}
+    for compact in (False, True):
+        lengths[compact] = sorted(len(REDIRECT_PREFIX + translate(form, compact=compact)) for form in forms)
+
+    print('{} classic forms, redirect url length in bytes'.format(n))
+    print('{:<8} {:>8} {:>8} {:>8} {:>8}'.format('mode', 'mean', 'median', 'p95', 'max') +
+          ''.join(' {:>8}'.format('>' + str(limit)) for limit in URL_LIMITS))
+    for compact in (False, True):
+        values = lengths[compact]
+        print('{:<8} {:8.0f} {:8d} {:8d} {:8d}'.format('compact' if compact else 'verbose', float(sum(values)) / n,
+                                                        percentile(values, 0.5), percentile(values, 0.95), values[-1]) +
+              ''.join(' {:8d}'.format(sum(1 for value in values if value > limit)) for limit in URL_LIMITS))
+    print('compact urls are {:.1%} shorter on average'.format(1 - float(sum(lengths[True])) / sum(lengths[False])))
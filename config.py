@@ -2,6 +2,78 @@
 VAULT_QUERY_URL = 'https://devapi.adsabs.harvard.edu/v1/vault/query'
 BUMBLEBEE_URL = 'https://devui.adsabs.harvard.edu'
 
+# translations of classic queries, date dependent ones expire when the day/month ends
+CLASSIC_CACHE_SIZE = 10000
+CLASSIC_CACHE_TTL = 24 * 60 * 60
+# parse classic parameters without webargs
+CLASSIC_FAST_PARSER = False
+# shorter redirect urls: filters on the same facet merged, default sort dropped, minimal percent-encoding
+CLASSIC_COMPACT_URLS = False
+
+# connection pool to vault, per worker: number of hosts and connections kept per host
+CLIENT_POOL_CONNECTIONS = 2
+CLIENT_POOL_MAXSIZE = 10
+# seconds to wait for a connection to vault and then for its response
+CLIENT_CONNECT_TIMEOUT = 3.05
+CLIENT_READ_TIMEOUT = 30
+# qids of stored bibcode lists, the ttl must not exceed how long vault keeps a query
+QID_CACHE_SIZE = 10000
+QID_CACHE_TTL = 24 * 60 * 60
+# bibcode lists up to this size redirect to a bibcode:(...) search instead of a stored vault query, 0 disables,
+# unless the redirect url would be longer than the maximum length
+DIRECT_REDIRECT_MAX_BIBCODES = 0
+DIRECT_REDIRECT_MAX_URL_LENGTH = 2000
+# limits of a bibcode list posted to /redirect, larger uploads get a 413,
+# the list is kept in memory up to the spool size and in a temporary file beyond it
+UPLOAD_MAX_BYTES = 64 * 1024 * 1024
+UPLOAD_MAX_BIBCODES = 2000000
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+# entries that are not bibcodes are dropped, the first ones are listed in the response
+UPLOAD_MAX_REJECTED = 100
+# seconds a /redirect request may take before vault is given up on with a 504
+VAULT_DEADLINE = 10
+# vault is not called for BREAKER_OPEN_SECONDS once BREAKER_FAILURE_RATE of at least BREAKER_MIN_CALLS calls
+# in BREAKER_WINDOW seconds failed, meanwhile lists of up to BREAKER_FALLBACK_MAX_BIBCODES get a bibcode:(...)
+# search redirect and larger ones a 503
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_MIN_CALLS = 10
+BREAKER_WINDOW = 30
+BREAKER_OPEN_SECONDS = 30
+BREAKER_FALLBACK_MAX_BIBCODES = 100
+# uploads to /redirect are shed with a 503 and Retry-After ADMISSION_RETRY_AFTER when their payload bytes, or their
+# call to vault, do not fit in what is in flight in the worker and in all workers, 0 disables a limit
+ADMISSION_MAX_BYTES = 512 * 1024 * 1024
+ADMISSION_WORKER_MAX_BYTES = 256 * 1024 * 1024
+ADMISSION_MAX_VAULT_CALLS = 64
+ADMISSION_WORKER_MAX_VAULT_CALLS = 32
+ADMISSION_RETRY_AFTER = 1
+# send a vault call again when it has not answered after the VAULT_HEDGE_PERCENTILE latency of recent calls,
+# at least VAULT_HEDGE_MIN_DELAY seconds, for at most VAULT_HEDGE_MAX_FRACTION of the calls
+VAULT_HEDGE = False
+VAULT_HEDGE_PERCENTILE = 95
+VAULT_HEDGE_MIN_DELAY = 0.05
+VAULT_HEDGE_MAX_FRACTION = 0.1
+# how the bigquery is posted to vault: 'form' urlencoded, or streamed as 'multipart' or 'raw' text/plain,
+# gzip compressed at this level when above 0; vault must accept the chosen transport
+VAULT_TRANSPORT = 'form'
+VAULT_GZIP_LEVEL = 0
+# library decoding batch uploads and vault responses: 'json', 'simplejson', 'ujson' or 'auto' for the fastest installed
+JSON_CODEC = 'auto'
+# lists of at least DEFERRED_MIN_BIBCODES posted with Prefer: respond-async get a 202 and are stored in vault by
+# DEFERRED_WORKERS threads per worker within DEFERRED_DEADLINE seconds, 0 disables; at most DEFERRED_MAX_JOBS
+# jobs are kept for DEFERRED_JOB_TTL seconds and polled every DEFERRED_POLL_SECONDS
+DEFERRED_MIN_BIBCODES = 10000
+DEFERRED_WORKERS = 4
+DEFERRED_DEADLINE = 300
+DEFERRED_MAX_JOBS = 1000
+DEFERRED_JOB_TTL = 600
+DEFERRED_POLL_SECONDS = 1
+# named bibcode lists in one /redirect/batch call, the vault calls made concurrently for them per worker,
+# which should not exceed CLIENT_POOL_MAXSIZE, and the seconds after which lists not stored yet get a 504
+BATCH_MAX_LISTS = 1000
+BATCH_CONCURRENCY = 8
+BATCH_DEADLINE = 60
+
 TUGBOAT_CORS = [
     'adsabs.harvard.edu',
     'astrobib.u-strasbg.fr',
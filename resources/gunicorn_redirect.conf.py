@@ -0,0 +1,20 @@
+import os
+
+APP_NAME = 'tugboat_redirect'
+LOG_DIR = '/tmp'
+
+# /redirect spends its time waiting on vault, gevent workers serve
+# worker_connections requests each while the calls are in flight
+bind = "unix:/app/gunicorn_redirect.sock"
+workers = 2
+worker_class = "gevent"
+worker_connections = 200
+max_requests = 2000
+max_requests_jitter = 150
+preload_app = True
+chdir = os.path.dirname(__file__)
+daemon = False
+debug = False
+errorlog = '{}/{}.error.log'.format(LOG_DIR, APP_NAME)
+accesslog = '{}/{}.access.log'.format(LOG_DIR, APP_NAME)
+loglevel = "info"
@@ -0,0 +1,3 @@
+#!/bin/bash
+pushd /app
+exec gunicorn -c gunicorn_redirect.conf.py wsgi:application
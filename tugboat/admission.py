@@ -0,0 +1,131 @@
+"""
+Admission control of /redirect: budgets of payload bytes and vault calls in flight
+"""
+
+import os
+import multiprocessing
+
+from workers import process_alive
+
+BYTES, VAULT_CALLS = 0, 1
+KIND_NAMES = {BYTES: 'bytes', VAULT_CALLS: 'vault_calls'}
+
+# shared counters, then one (pid, bytes, vault calls) slot per worker
+_SHED_BYTES, _SHED_VAULT_CALLS, _ADMITTED = range(3)
+_HEADER = 3
+_SLOT = 3
+
+
+class Overloaded(Exception):
+    """
+    a request is shed because its budget is exhausted
+    """
+    def __init__(self, kind, retry_after):
+        super(Overloaded, self).__init__('{} budget exhausted'.format(KIND_NAMES[kind]))
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class AdmissionControl(object):
+    """
+    Budgets of payload bytes and vault calls in flight, per worker and across workers
+
+    a request is admitted when what it needs fits in both budgets, otherwise it
+    is shed at once rather than queued. It is always admitted when nothing of
+    its kind is in flight, so one upload larger than a budget still goes
+    through. A limit of 0 disables it.
+
+    Each worker counts what it has in flight in a slot of shared memory, a
+    control created before gunicorn forks its workers (preload_app) is shared
+    by all of them. The slots of workers that exited are reclaimed when a
+    budget seems exhausted, so a killed worker does not hold on to its share.
+    """
+
+    def __init__(self, max_bytes=0, worker_max_bytes=0, max_vault_calls=0, worker_max_vault_calls=0,
+                 retry_after=1, slots=128):
+        """
+        Constructor
+        :param max_bytes: payload bytes in flight in all workers
+        :param worker_max_bytes: payload bytes in flight in one worker
+        :param max_vault_calls: vault calls in flight in all workers
+        :param worker_max_vault_calls: vault calls in flight in one worker
+        :param retry_after: seconds a shed client is told to wait
+        :param slots: most workers counted at a time
+        """
+        self.limits = {BYTES: (max_bytes, worker_max_bytes), VAULT_CALLS: (max_vault_calls, worker_max_vault_calls)}
+        self.retry_after = retry_after
+        self.slots = slots
+        self._shared = multiprocessing.RawArray('d', _HEADER + _SLOT * slots)
+        self._lock = multiprocessing.Lock()
+        self._pid = None
+        self._slot = None
+
+    def _own_slot(self):
+        """offset of this worker's slot, claimed on first use; call with the lock held"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._slot
+        shared = self._shared
+        for reclaim in (False, True):
+            if reclaim:
+                self._reclaim()
+            for offset in range(_HEADER, len(shared), _SLOT):
+                if not shared[offset]:
+                    shared[offset] = pid
+                    shared[offset + 1 + BYTES] = shared[offset + 1 + VAULT_CALLS] = 0
+                    self._pid, self._slot = pid, offset
+                    return offset
+        return None
+
+    def _reclaim(self):
+        """free the slots of workers that exited; call with the lock held"""
+        shared = self._shared
+        for offset in range(_HEADER, len(shared), _SLOT):
+            if shared[offset] and not process_alive(int(shared[offset])):
+                shared[offset] = shared[offset + 1 + BYTES] = shared[offset + 1 + VAULT_CALLS] = 0
+
+    def _total(self, kind):
+        shared = self._shared
+        return sum(shared[offset + 1 + kind] for offset in range(_HEADER, len(shared), _SLOT))
+
+    def acquire(self, kind, amount=1):
+        """
+        count amount of kind in flight
+        :raises Overloaded: when it does not fit in the budgets
+        """
+        limit, worker_limit = self.limits[kind]
+        with self._lock:
+            shared = self._shared
+            slot = self._own_slot()
+            if slot is None:
+                admitted = False
+            else:
+                mine = shared[slot + 1 + kind]
+                admitted = not worker_limit or not mine or mine + amount <= worker_limit
+                if admitted and limit and self._total(kind) + amount > limit:
+                    self._reclaim()
+                    total = self._total(kind)
+                    admitted = not total or total + amount <= limit
+            if not admitted:
+                shared[_SHED_BYTES if kind == BYTES else _SHED_VAULT_CALLS] += 1
+                raise Overloaded(kind, self.retry_after)
+            shared[slot + 1 + kind] += amount
+            shared[_ADMITTED] += 1
+
+    def release(self, kind, amount=1):
+        """count amount of kind acquired earlier as done"""
+        with self._lock:
+            slot = self._own_slot()
+            self._shared[slot + 1 + kind] -= amount
+
+    def stats(self):
+        """in flight and shed counters for monitoring"""
+        with self._lock:
+            shared = self._shared
+            return {
+                'bytes': int(self._total(BYTES)),
+                'vault_calls': int(self._total(VAULT_CALLS)),
+                'admitted': int(shared[_ADMITTED]),
+                'shed_bytes': int(shared[_SHED_BYTES]),
+                'shed_vault_calls': int(shared[_SHED_VAULT_CALLS])
+            }
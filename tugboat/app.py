@@ -1,4 +1,5 @@
 
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.serving import run_simple
 
 from flask_discoverer import Discoverer
@@ -6,7 +7,15 @@ from flask_restful import Api, Resource
 
 from adsmutils import ADSFlask
 
-from tugboat.views import IndexView, BumblebeeView, ClassicSearchRedirectView, SimpleClassicView, ComplexClassicView
+from tugboat.admission import AdmissionControl
+from tugboat.breaker import CircuitBreaker
+from tugboat.cache import LRUCache, SingleFlight
+from tugboat.codec import decoder
+from tugboat.hedge import Hedger
+from tugboat.jobs import JobStore
+from tugboat.client import Client
+from tugboat.views import IndexView, BumblebeeView, ClassicSearchRedirectView, SimpleClassicView, ComplexClassicView, \
+    MetricsView, RedirectJobView, BatchRedirectView
 
 def create_app(**config):
     """
@@ -21,13 +30,63 @@ def create_app(**config):
 
     app.url_map.strict_slashes = False
 
+    # json of batch uploads and vault responses, fails at startup when JSON_CODEC is not installed
+    app.extensions['json_decoder'] = decoder(app.config['JSON_CODEC'])
+
+    app.extensions['classic_translation_cache'] = LRUCache(
+        app.config['CLASSIC_CACHE_SIZE'],
+        ttl=app.config['CLASSIC_CACHE_TTL']
+    )
+    # qids of recently stored bibcode lists
+    app.extensions['qid_cache'] = LRUCache(
+        app.config['QID_CACHE_SIZE'],
+        ttl=app.config['QID_CACHE_TTL']
+    )
+    # identical bibcode lists stored concurrently share one call to vault
+    app.extensions['vault_single_flight'] = SingleFlight()
+    # state shared by the workers, which are forked after the app is created
+    app.extensions['vault_breaker'] = CircuitBreaker(
+        failure_rate=app.config['BREAKER_FAILURE_RATE'],
+        min_calls=app.config['BREAKER_MIN_CALLS'],
+        window=app.config['BREAKER_WINDOW'],
+        open_seconds=app.config['BREAKER_OPEN_SECONDS']
+    )
+    # payload bytes and vault calls in flight, per worker and shared by the workers
+    app.extensions['admission'] = AdmissionControl(
+        max_bytes=app.config['ADMISSION_MAX_BYTES'],
+        worker_max_bytes=app.config['ADMISSION_WORKER_MAX_BYTES'],
+        max_vault_calls=app.config['ADMISSION_MAX_VAULT_CALLS'],
+        worker_max_vault_calls=app.config['ADMISSION_WORKER_MAX_VAULT_CALLS'],
+        retry_after=app.config['ADMISSION_RETRY_AFTER']
+    )
+    # latencies of vault, per worker
+    app.extensions['vault_hedger'] = Hedger(
+        percentile=app.config['VAULT_HEDGE_PERCENTILE'],
+        min_delay=app.config['VAULT_HEDGE_MIN_DELAY'],
+        max_fraction=app.config['VAULT_HEDGE_MAX_FRACTION']
+    )
+    # lists stored in vault in the background, the jobs are shared by the workers,
+    # the executor starts its threads on the first job, after the workers fork
+    app.extensions['deferred_jobs'] = JobStore(
+        size=app.config['DEFERRED_MAX_JOBS'],
+        ttl=app.config['DEFERRED_JOB_TTL']
+    )
+    app.extensions['deferred_executor'] = ThreadPoolExecutor(max_workers=app.config['DEFERRED_WORKERS'])
+    # vault calls of the lists of batch redirects, at most BATCH_CONCURRENCY at a time per worker
+    app.extensions['batch_executor'] = ThreadPoolExecutor(max_workers=app.config['BATCH_CONCURRENCY'])
+    # pooled session for vault, no connection is opened before the workers fork
+    app.extensions['client'] = Client(app.config)
+
     # Add end points
     api = Api(app)
     api.add_resource(IndexView, '/index')
     api.add_resource(ClassicSearchRedirectView, '/classicSearchRedirect')
     api.add_resource(BumblebeeView, '/redirect')
+    api.add_resource(BatchRedirectView, '/redirect/batch')
+    api.add_resource(RedirectJobView, '/redirect/<string:token>')
     api.add_resource(SimpleClassicView, '/ads')
     api.add_resource(ComplexClassicView, '/adsabs')
+    api.add_resource(MetricsView, '/metrics', '/redirect/metrics')
 
     Discoverer(app)
 
@@ -0,0 +1,104 @@
+"""
+Circuit breaker around calls to vault, shared by the workers
+"""
+
+import time
+import multiprocessing
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: 'closed', OPEN: 'open', HALF_OPEN: 'half_open'}
+
+# slots of the shared state
+_STATE, _CHANGED, _WINDOW_START, _CALLS, _FAILURES, _OPENED, _REJECTED = range(7)
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a failing service for a while
+
+    calls and failures are counted over fixed windows of window seconds, once
+    at least min_calls were made and failure_rate of them failed the breaker
+    opens and calls are rejected for open_seconds. Then one probe call is let
+    through, half open, its success closes the breaker and its failure opens
+    it again.
+
+    The state lives in shared memory, a breaker created before gunicorn forks
+    its workers (preload_app) is shared by all of them.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=30, open_seconds=30, clock=time.time):
+        """
+        Constructor
+        :param failure_rate: fraction of failed calls in a window that opens the breaker
+        :param min_calls: calls in a window before the failure rate is considered
+        :param window: seconds over which calls and failures are counted
+        :param open_seconds: seconds calls are rejected before a probe, and a probe
+            is waited for before another one is let through
+        :param clock: function returning the current time in seconds
+        """
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self._shared = multiprocessing.RawArray('d', 7)
+        self._lock = multiprocessing.Lock()
+
+    def allow(self):
+        """
+        whether a call may be made now, while half open only the probe is allowed
+        """
+        now = self.clock()
+        with self._lock:
+            shared = self._shared
+            if shared[_STATE] == CLOSED:
+                return True
+            if now - shared[_CHANGED] < self.open_seconds:
+                shared[_REJECTED] += 1
+                return False
+            # open long enough, or the probe never reported back
+            shared[_STATE] = HALF_OPEN
+            shared[_CHANGED] = now
+            return True
+
+    def record(self, success):
+        """count the outcome of an allowed call"""
+        now = self.clock()
+        with self._lock:
+            shared = self._shared
+            if shared[_STATE] == HALF_OPEN:
+                if success:
+                    shared[_STATE] = CLOSED
+                    shared[_WINDOW_START] = now
+                    shared[_CALLS] = shared[_FAILURES] = 0
+                else:
+                    self._open(now)
+                return
+            if shared[_STATE] == OPEN:
+                # a call started before the breaker opened
+                return
+            if now - shared[_WINDOW_START] >= self.window:
+                shared[_WINDOW_START] = now
+                shared[_CALLS] = shared[_FAILURES] = 0
+            shared[_CALLS] += 1
+            if not success:
+                shared[_FAILURES] += 1
+            if shared[_CALLS] >= self.min_calls and shared[_FAILURES] >= self.failure_rate * shared[_CALLS]:
+                self._open(now)
+
+    def _open(self, now):
+        self._shared[_STATE] = OPEN
+        self._shared[_CHANGED] = now
+        self._shared[_OPENED] += 1
+
+    def retry_after(self):
+        """seconds until a call may be let through again"""
+        return max(0, int(round(self._shared[_CHANGED] + self.open_seconds - self.clock())))
+
+    def stats(self):
+        """counters for monitoring"""
+        with self._lock:
+            shared = self._shared[:]
+        return {'state': STATE_NAMES[int(shared[_STATE])], 'calls': int(shared[_CALLS]),
+                'failures': int(shared[_FAILURES]), 'opened': int(shared[_OPENED]),
+                'rejected': int(shared[_REJECTED])}
@@ -0,0 +1,152 @@
+"""
+Bounded in-process caches and call coalescing
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Least recently used cache holding at most max_size entries
+
+    Entries expire ttl seconds after they are set, or at an explicit expiry
+    timestamp passed to set. Hit, miss, eviction and expiration counters are
+    kept for monitoring. Safe to share between threads.
+    """
+
+    def __init__(self, max_size, ttl=None, clock=time.time):
+        """
+        Constructor
+        :param max_size: maximum number of entries, 0 disables the cache
+        :param ttl: default lifetime of an entry in seconds, None for no expiry
+        :param clock: function returning the current time in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """return cached value and mark it most recently used"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data[key] = entry
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires=None):
+        """
+        store value, evicting the least recently used entry when full
+        :param expires: timestamp after which the entry is stale, the earlier
+            of this and the default ttl is used
+        """
+        if self.max_size <= 0:
+            return
+        if self.ttl is not None:
+            default_expires = self.clock() + self.ttl
+            expires = default_expires if expires is None else min(expires, default_expires)
+        with self._lock:
+            self._data.pop(key, None)
+            while len(self._data) >= self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._data[key] = (value, expires)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """counters for monitoring"""
+        return {'size': len(self._data), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class WaitTimeout(Exception):
+    """
+    a caller gave up waiting for a call in flight with the same key
+    """
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls with the same key into one
+
+    the first caller runs the function, callers arriving while it runs wait,
+    at most their own timeout, and get its result or exception, also one that
+    is not an Exception such as the GreenletExit of a killed greenlet. Counters
+    of the calls made, of the calls collapsed into them and of the waits that
+    timed out are kept for monitoring. Safe to share between threads.
+    """
+
+    class Call(object):
+        """one call in flight"""
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+        self.timed_out = 0
+
+    def do(self, key, function, timeout=None):
+        """
+        return function(), shared with concurrent calls with the same key
+        :param timeout: seconds to wait for a call with the same key already in flight, None waits until it is done
+        :raises WaitTimeout: the call in flight was not done within timeout
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self.Call()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timed_out += 1
+                raise WaitTimeout('call in flight not done after {} seconds'.format(timeout))
+            if call.error is not None:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.value
+        try:
+            call.value = function()
+            return call.value
+        except BaseException:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """counters for monitoring"""
+        return {'calls': self.calls, 'collapsed': self.collapsed, 'timed_out': self.timed_out,
+                'in_flight': len(self._calls)}
@@ -1,8 +1,41 @@
-
 import requests
+from requests.adapters import HTTPAdapter
 from flask import current_app
 
-client = lambda: Client(current_app.config).session
+client = lambda: current_app.extensions['client'].session
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    Connection pooling adapter that applies a default timeout to every request
+    """
+    def __init__(self, timeout=None, **kwargs):
+        """
+        Constructor
+        :param timeout: (connect, read) timeout in seconds used when a request does not set one
+        """
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, timeout=timeout, **kwargs)
+
+    def stats(self):
+        """
+        counters summed over the connection pools still held by the adapter,
+        reused is the number of requests sent over an already open connection
+        """
+        connections = requests_sent = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return {'pools': len(pools), 'connections': connections, 'requests': requests_sent,
+                'reused': requests_sent - connections}
 
 
 class Client:
@@ -10,6 +43,9 @@ class Client:
     The Client class is a thin wrapper around requests; Use it as a centralized
     place to set application specific parameters, such as the oauth2
     authorization header
+
+    One client is created per application, its session keeps connections
+    alive and reuses them across requests
     """
     def __init__(self, config):
         """
@@ -18,3 +54,14 @@ class Client:
         """
 
         self.session = requests.Session()
+        self.adapter = TimeoutHTTPAdapter(
+            timeout=(config.get('CLIENT_CONNECT_TIMEOUT'), config.get('CLIENT_READ_TIMEOUT')),
+            pool_connections=config.get('CLIENT_POOL_CONNECTIONS', 10),
+            pool_maxsize=config.get('CLIENT_POOL_MAXSIZE', 10),
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def stats(self):
+        """connection pool counters for monitoring"""
+        return self.adapter.stats()
@@ -0,0 +1,38 @@
+"""
+JSON decoding of request bodies and vault responses
+
+simplejson and ujson are used when installed, they decode large documents
+faster than the standard library; JSON_CODEC selects one by name, 'auto'
+takes the fastest installed
+"""
+
+import json
+
+DECODERS = {'json': json.loads}
+try:
+    import simplejson
+    DECODERS['simplejson'] = simplejson.loads
+except ImportError:
+    pass
+try:
+    import ujson
+    DECODERS['ujson'] = ujson.loads
+except ImportError:
+    pass
+
+# fastest first
+PREFERENCE = ('ujson', 'simplejson', 'json')
+
+
+def decoder(name='auto'):
+    """
+    loads function of the named library, all raise ValueError on invalid json
+    :param name: 'json', 'simplejson', 'ujson' or 'auto' for the fastest installed
+    :raises ValueError: when the library is unknown or not installed
+    """
+    if name == 'auto':
+        name = next(name for name in PREFERENCE if name in DECODERS)
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError('JSON codec {} is not installed, available: {}'.format(name, ', '.join(sorted(DECODERS))))
@@ -0,0 +1,142 @@
+"""
+Hedged calls: a slow call is started a second time and the first answer is used
+"""
+
+import sys
+import time
+import threading
+import Queue
+from collections import deque
+
+
+class Hedger(object):
+    """
+    Starts a second attempt of a call that has not returned after a delay
+
+    the delay is the given percentile of the latencies of recent successful
+    attempts, so about 100 - percentile percent of the calls are hedged. Each
+    call earns max_fraction of a hedge, up to burst, and each hedge spends one,
+    which caps the hedges at max_fraction of the calls. A hedge the caller's
+    admit function refuses is skipped. The first attempt to succeed wins, the
+    other one finishes in the background and is ignored.
+    Safe to share between threads.
+    """
+
+    def __init__(self, percentile=95, min_delay=0.05, max_fraction=0.1, burst=10, window=1000, min_samples=20,
+                 clock=time.time, sleep=time.sleep):
+        """
+        Constructor
+        :param percentile: percentile of recent latencies after which a call is hedged
+        :param min_delay: shortest delay in seconds before a hedge
+        :param max_fraction: most hedges per call
+        :param burst: most hedges that can be saved up
+        :param window: number of recent latencies kept
+        :param min_samples: latencies needed before calls are hedged
+        :param clock: function returning the current time in seconds
+        :param sleep: function waiting the given seconds before a hedge
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_fraction = max_fraction
+        self.burst = burst
+        self.min_samples = min_samples
+        self.clock = clock
+        self.sleep = sleep
+        self._latencies = deque(maxlen=window)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def delay(self):
+        """seconds after which a call is hedged, None until enough latencies are known"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))
+        return max(self.min_delay, latencies[index])
+
+    def _attempt(self, function, number, results):
+        start = self.clock()
+        try:
+            value = function()
+        except Exception:
+            results.put((number, False, sys.exc_info()))
+            return
+        with self._lock:
+            self._latencies.append(self.clock() - start)
+        results.put((number, True, value))
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _hedge(self, function, delay, results, state, admit, release):
+        """
+        start the second attempt after delay seconds, unless the call is done, no hedge
+        is left or admit refuses it
+        """
+        # time.sleep is precise where the timeouts of threading waits poll
+        self.sleep(delay)
+        with self._lock:
+            if state['done'] or self._tokens < 1:
+                return
+            if admit is not None and not admit():
+                self.skipped += 1
+                return
+            self._tokens -= 1
+            self.hedged += 1
+            state['attempts'] += 1
+        try:
+            self._attempt(function, 1, results)
+        finally:
+            if release is not None:
+                release()
+
+    def call(self, function, admit=None, release=None):
+        """
+        return function(), started a second time in another thread when the first
+        attempt has not returned after delay(), when all attempts fail the exception
+        of the one that failed first is raised
+        :param admit: function returning whether a second attempt may be started
+        :param release: function called once an admitted second attempt is done
+        """
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.burst, self._tokens + self.max_fraction)
+        delay = self.delay()
+        if delay is None:
+            start = self.clock()
+            value = function()
+            with self._lock:
+                self._latencies.append(self.clock() - start)
+            return value
+
+        results = Queue.Queue()
+        state = {'attempts': 1, 'done': False}
+        self._start(self._attempt, function, 0, results)
+        self._start(self._hedge, function, delay, results, state, admit, release)
+        error = None
+        while True:
+            number, success, value = results.get()
+            with self._lock:
+                state['attempts'] -= 1
+                if success:
+                    state['done'] = True
+                    if number == 1:
+                        self.hedge_wins += 1
+                    return value
+                error = error or value
+                if not state['attempts']:
+                    state['done'] = True
+                    break
+        raise error[0], error[1], error[2]
+
+    def stats(self):
+        """counters for monitoring"""
+        return {'calls': self.calls, 'hedged': self.hedged, 'hedge_wins': self.hedge_wins, 'skipped': self.skipped,
+                'delay': self.delay()}
@@ -0,0 +1,141 @@
+"""
+State of deferred vault calls, shared by the workers
+"""
+
+import os
+import time
+import uuid
+import ctypes
+import multiprocessing
+
+from workers import process_alive
+
+PENDING, DONE, FAILED = 1, 2, 3
+STATE_NAMES = {PENDING: 'pending', DONE: 'done', FAILED: 'failed'}
+
+
+class _Job(ctypes.Structure):
+    _fields_ = [
+        ('token', ctypes.c_char * 32),
+        ('state', ctypes.c_int),
+        ('created', ctypes.c_double),
+        ('pid', ctypes.c_int),
+        ('status_code', ctypes.c_int),
+        # qid once done, error message once failed
+        ('value', ctypes.c_char * 256),
+    ]
+
+
+class JobStore(object):
+    """
+    Fixed number of job slots, each expiring ttl seconds after it was created
+
+    A job is pending until the worker running it finishes or fails it, its
+    token names its slot so any worker can look it up. Creating a job takes
+    an empty or expired slot, or the oldest finished one; when every slot
+    holds a pending job none is created. A pending job whose worker exited
+    is reported as failed.
+
+    The slots live in shared memory, a store created before gunicorn forks
+    its workers (preload_app) is shared by all of them.
+    """
+
+    def __init__(self, size=1000, ttl=600, clock=time.time):
+        """
+        Constructor
+        :param size: number of jobs kept
+        :param ttl: seconds a job is kept after it was created
+        :param clock: function returning the current time in seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._jobs = multiprocessing.RawArray(_Job, size)
+        self._lock = multiprocessing.Lock()
+
+    def create(self):
+        """
+        token of a new pending job run by this process, None when the store is full
+        """
+        now = self.clock()
+        with self._lock:
+            free = None
+            for index, job in enumerate(self._jobs):
+                if not job.state or job.created + self.ttl <= now:
+                    free = index
+                    break
+                if job.state != PENDING and (free is None or job.created < self._jobs[free].created):
+                    free = index
+            if free is None:
+                return None
+            token = '{}-{}'.format(free, uuid.uuid4().hex[:16])
+            job = self._jobs[free]
+            job.token = token
+            job.state = PENDING
+            job.created = now
+            job.pid = os.getpid()
+            job.status_code = 0
+            job.value = ''
+        return token
+
+    def _find(self, token):
+        """the slot of a job that has not expired, or None"""
+        try:
+            index = int(token.split('-', 1)[0])
+        except (AttributeError, ValueError):
+            return None
+        if not 0 <= index < self.size:
+            return None
+        job = self._jobs[index]
+        if job.token != token or job.created + self.ttl <= self.clock():
+            return None
+        return job
+
+    def finish(self, token, qid):
+        """record the qid of a job"""
+        qid = str(qid)
+        if len(qid) >= _Job.value.size:
+            raise ValueError('qid longer than {} bytes'.format(_Job.value.size - 1))
+        with self._lock:
+            job = self._find(token)
+            if job is not None:
+                job.state = DONE
+                job.status_code = 200
+                job.value = qid
+
+    def fail(self, token, status_code, error):
+        """record the failure of a job, the error message is truncated"""
+        with self._lock:
+            job = self._find(token)
+            if job is not None:
+                job.state = FAILED
+                job.status_code = status_code
+                job.value = error.encode('utf-8')[:_Job.value.size - 1]
+
+    def get(self, token):
+        """
+        dict with state, status_code and qid or error of a job, None for an unknown or expired token
+        """
+        with self._lock:
+            job = self._find(token)
+            if job is None:
+                return None
+            state, pid, status_code, value = job.state, job.pid, job.status_code, job.value
+        if state == PENDING and not process_alive(pid):
+            state, status_code, value = FAILED, 500, 'job lost'
+        result = {'state': STATE_NAMES[state], 'status_code': status_code}
+        if state == DONE:
+            result['qid'] = value
+        elif state == FAILED:
+            result['error'] = value.decode('utf-8', 'replace')
+        return result
+
+    def stats(self):
+        """number of jobs in each state"""
+        now = self.clock()
+        counts = dict.fromkeys(STATE_NAMES.values(), 0)
+        with self._lock:
+            for job in self._jobs:
+                if job.state and job.created + self.ttl > now:
+                    counts[STATE_NAMES[job.state]] += 1
+        return counts
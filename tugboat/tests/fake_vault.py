@@ -0,0 +1,111 @@
+"""
+Local stand-in for vault/query
+
+Accepts the bigquery in every VAULT_TRANSPORT, plain or gzip encoded, with a
+Content-Length or chunked, and records what it received. Latency can be injected
+with a function returning the seconds to wait before answering
+
+    vault = FakeVault()
+    app.config['VAULT_QUERY_URL'] = vault.url + '/query'
+    ...
+    vault.received[0]['bigquery']
+    vault.close()
+"""
+
+import cgi
+import io
+import json
+import threading
+import time
+import urlparse
+import zlib
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+
+class VaultHandler(BaseHTTPRequestHandler):
+    """stores every posted bigquery and answers with a new qid"""
+    protocol_version = 'HTTP/1.1'
+
+    def read_body(self):
+        """the request body as sent over the wire"""
+        if self.headers.getheader('transfer-encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(';')[0], 16)
+            if size == 0:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        # trailer
+        while self.rfile.readline() not in ('\r\n', '\n', ''):
+            pass
+        return ''.join(chunks)
+
+    def do_POST(self):
+        wire = self.read_body()
+        body = wire
+        if self.headers.getheader('content-encoding', '').lower() == 'gzip':
+            body = zlib.decompress(wire, 16 + zlib.MAX_WBITS)
+        url = urlparse.urlparse(self.path)
+        content_type, options = cgi.parse_header(self.headers.getheader('content-type', ''))
+        if content_type == 'application/x-www-form-urlencoded':
+            fields = dict((key, values[0]) for key, values in urlparse.parse_qs(body).items())
+        elif content_type == 'multipart/form-data':
+            fields = dict((key, values[0]) for key, values in cgi.parse_multipart(io.BytesIO(body), options).items())
+        else:
+            fields = dict((key, values[0]) for key, values in urlparse.parse_qs(url.query).items())
+            fields['bigquery'] = body
+
+        received = self.server.received
+        received.append({
+            'path': url.path,
+            'headers': dict(self.headers.items()),
+            'bytes': len(wire),
+            'q': fields.get('q'),
+            'fq': fields.get('fq'),
+            'bigquery': fields.get('bigquery')
+        })
+        if self.server.latency is not None:
+            time.sleep(self.server.latency())
+        response = json.dumps({'qid': 'qid{}'.format(len(received)), 'query': 'q', 'numfound': 1})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """one thread per connection, so connections kept alive by the client do not block shutdown"""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # clients may abandon a request while sending it
+        pass
+
+
+class FakeVault(object):
+    """vault/query served from a thread on a free local port"""
+
+    def __init__(self, latency=None):
+        """
+        Constructor
+        :param latency: function returning the seconds to wait before each answer
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), VaultHandler)
+        self.server.received = self.received = []
+        self.server.latency = latency
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,214 @@
+"""
+Test admission control
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import itertools
+import json
+import threading
+import time
+import unittest
+from unittest import TestCase
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from tugboat.admission import AdmissionControl, Overloaded, BYTES, VAULT_CALLS
+from tugboat.app import create_app
+from tugboat.tests.fake_vault import FakeVault
+
+
+class TestAdmissionControl(TestCase):
+    """
+    Test admitting and shedding
+    """
+
+    def setUp(self):
+        self.admission = AdmissionControl(max_bytes=100, worker_max_bytes=60, max_vault_calls=2)
+
+    def test_budgets(self):
+        self.admission.acquire(BYTES, 50)
+        with self.assertRaises(Overloaded) as context:
+            self.admission.acquire(BYTES, 20)
+        self.assertEqual((BYTES, 1), (context.exception.kind, context.exception.retry_after))
+        self.admission.acquire(BYTES, 10)
+        self.admission.acquire(VAULT_CALLS)
+        self.admission.acquire(VAULT_CALLS)
+        with self.assertRaises(Overloaded):
+            self.admission.acquire(VAULT_CALLS)
+        self.admission.release(VAULT_CALLS)
+        self.admission.acquire(VAULT_CALLS)
+        self.admission.release(BYTES, 60)
+        self.assertEqual({'bytes': 0, 'vault_calls': 2, 'admitted': 5, 'shed_bytes': 1, 'shed_vault_calls': 1},
+                         self.admission.stats())
+
+    def test_larger_than_budget(self):
+        # admitted alone
+        self.admission.acquire(BYTES, 1000)
+        with self.assertRaises(Overloaded):
+            self.admission.acquire(BYTES, 1)
+        self.admission.release(BYTES, 1000)
+        self.admission.acquire(BYTES, 1)
+
+    def test_shared_with_forked_workers(self):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            self.admission.acquire(BYTES, 50)
+            self.admission.acquire(VAULT_CALLS)
+            os.write(wfd, 'x')
+            time.sleep(10)
+            os._exit(0)
+        os.read(rfd, 1)
+        # the worker holds 50 bytes and a call
+        with self.assertRaises(Overloaded):
+            self.admission.acquire(BYTES, 60)
+        self.admission.acquire(VAULT_CALLS)
+        with self.assertRaises(Overloaded):
+            self.admission.acquire(VAULT_CALLS)
+        self.assertEqual(2, self.admission.stats()['vault_calls'])
+        # its share is reclaimed once it is killed
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        self.admission.acquire(BYTES, 60)
+        self.admission.acquire(VAULT_CALLS)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """serves requests with a fixed number of threads, as a fixed number of sync workers would"""
+
+    def __init__(self, app, workers):
+        WSGIServer.__init__(self, ('127.0.0.1', 0), QuietHandler)
+        self.set_app(app)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.url = 'http://127.0.0.1:{}'.format(self.server_port)
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_pooled, request, client_address)
+
+    def process_pooled(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.pool.shutdown()
+
+
+class TestLoadShedding(TestCase):
+    """
+    Classic redirects are served while /redirect is saturated by uploads waiting on vault
+    """
+
+    CLASSIC = '/classicSearchRedirect?db_key=AST&author=Huchra,+John'
+
+    def setUp(self):
+        # vault answers once the test lets it, so uploads stay in flight as long as needed
+        self.answer = threading.Event()
+        self.vault = FakeVault(latency=self.blocked)
+        self.count = itertools.count(0, 3)
+
+    def blocked(self):
+        self.answer.wait(10)
+        return 0
+
+    def bibcodes(self):
+        """a new list for every post, so none is answered from the qid cache"""
+        i = next(self.count)
+        return ['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000 % 1000, i % 1000 + j) for j in range(3)]
+
+    def tearDown(self):
+        self.answer.set()
+        self.vault.close()
+
+    def wait_for(self, condition):
+        """wait until condition() holds, the timeout only guards against a hang"""
+        for i in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('timed out')
+
+    def saturate(self, worker_max_vault_calls, uploads=4):
+        """
+        a server of 4 threads and the threads of uploads clients, each posting one list to /redirect
+        and appending the status code to statuses
+        """
+        app = create_app()
+        app.config['VAULT_QUERY_URL'] = self.vault.url + '/query'
+        app.config['BREAKER_FALLBACK_MAX_BIBCODES'] = 0
+        app.extensions['admission'] = AdmissionControl(worker_max_vault_calls=worker_max_vault_calls)
+        server = PooledWSGIServer(app, workers=4)
+        statuses = []
+
+        def upload():
+            r = requests.post(server.url + '/redirect', data=json.dumps(self.bibcodes()),
+                              headers={'Content-Type': 'application/json'})
+            if r.status_code == 503:
+                self.assertEqual('1', r.headers['Retry-After'])
+            statuses.append(r.status_code)
+
+        self.assertEqual(302, requests.get(server.url + self.CLASSIC, allow_redirects=False).status_code)
+        threads = [threading.Thread(target=upload) for i in range(uploads)]
+        for thread in threads:
+            thread.start()
+        return app, server, threads, statuses
+
+    def test_classic_served(self):
+        app, server, threads, statuses = self.saturate(worker_max_vault_calls=2)
+        try:
+            # two uploads wait on vault, the others are shed at once and leave their threads free
+            self.wait_for(lambda: len(self.vault.received) == 2 and len(statuses) == 2)
+            self.assertEqual([503, 503], statuses)
+            for i in range(5):
+                r = requests.get(server.url + self.CLASSIC, allow_redirects=False, timeout=5)
+                self.assertEqual(302, r.status_code)
+            stats = app.extensions['admission'].stats()
+            self.assertEqual((2, 2), (stats['vault_calls'], stats['shed_vault_calls']))
+            self.answer.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.close()
+        self.assertEqual([200, 200, 503, 503], sorted(statuses))
+        self.assertEqual(2, len(self.vault.received))
+
+    def test_classic_waits_without_budget(self):
+        # the uploads take every thread and classic redirects wait for vault
+        app, server, threads, statuses = self.saturate(worker_max_vault_calls=0)
+        try:
+            self.wait_for(lambda: len(self.vault.received) == 4)
+            with self.assertRaises(requests.Timeout):
+                requests.get(server.url + self.CLASSIC, allow_redirects=False, timeout=0.5)
+            self.assertEqual([], statuses)
+            self.answer.set()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(302, requests.get(server.url + self.CLASSIC, allow_redirects=False).status_code)
+        finally:
+            server.close()
+        self.assertEqual([200] * 4, statuses)
+        self.assertEqual(0, app.extensions['admission'].stats()['shed_vault_calls'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,96 @@
+"""
+Test the circuit breaker
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import unittest
+from unittest import TestCase
+
+from tugboat.breaker import CircuitBreaker
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(TestCase):
+    """
+    Test opening, rejecting and probing
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=10, open_seconds=30, clock=self.clock)
+
+    def fail(self, n):
+        for i in range(n):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(False)
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record(True)
+        self.breaker.record(True)
+        self.fail(1)
+        self.assertEqual('closed', self.breaker.stats()['state'])
+        self.fail(1)
+        self.assertEqual('open', self.breaker.stats()['state'])
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 20
+        self.assertEqual(10, self.breaker.retry_after())
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual({'state': 'open', 'calls': 4, 'failures': 2, 'opened': 1, 'rejected': 2},
+                         self.breaker.stats())
+
+    def test_window(self):
+        self.fail(3)
+        self.clock.now += 10
+        self.fail(3)
+        self.assertEqual('closed', self.breaker.stats()['state'])
+
+    def test_probe(self):
+        self.fail(4)
+        self.clock.now += 30
+        # one probe, the other calls wait for its outcome
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual('half_open', self.breaker.stats()['state'])
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual('open', self.breaker.stats()['state'])
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual('closed', self.breaker.stats()['state'])
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(2, self.breaker.stats()['opened'])
+
+    def test_lost_probe(self):
+        self.fail(4)
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_shared_with_forked_workers(self):
+        pid = os.fork()
+        if pid == 0:
+            self.fail(4)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual('open', self.breaker.stats()['state'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
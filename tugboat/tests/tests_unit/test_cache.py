@@ -0,0 +1,171 @@
+"""
+Test the in-process caches
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import threading
+import unittest
+from unittest import TestCase
+
+from tugboat.cache import LRUCache, SingleFlight, WaitTimeout
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(TestCase):
+    """
+    Test the least recently used cache
+    """
+
+    def test_hit_and_miss(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual({'size': 1, 'max_size': 2, 'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0},
+                         cache.stats())
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # b is now the oldest
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_expiry(self):
+        clock = FakeClock()
+        cache = LRUCache(10, ttl=60, clock=clock)
+        cache.set('default', 1)
+        cache.set('early', 2, expires=clock.now + 10)
+        cache.set('late', 3, expires=clock.now + 600)  # ttl wins
+        clock.now += 30
+        self.assertIsNone(cache.get('early'))
+        self.assertEqual(1, cache.get('default'))
+        clock.now += 31
+        self.assertIsNone(cache.get('default'))
+        self.assertIsNone(cache.get('late'))
+        self.assertEqual(3, cache.stats()['expirations'])
+        self.assertEqual(0, len(cache))
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestSingleFlight(TestCase):
+    """
+    Test coalescing of concurrent calls
+    """
+
+    def run_concurrently(self, flight, key, function, n):
+        """n threads call function through flight, return their results or exceptions"""
+        results = []
+        def call():
+            try:
+                results.append(flight.do(key, function))
+            except BaseException as e:
+                results.append(e)
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_collapsed(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        def slow():
+            calls.append(1)
+            release.wait()
+            return 'qid'
+        threads, results = self.run_concurrently(flight, 'key', slow, 8)
+        while flight.collapsed < 7:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['qid'] * 8, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({'calls': 1, 'collapsed': 7, 'timed_out': 0, 'in_flight': 0}, flight.stats())
+
+        # later calls are not collapsed
+        self.assertEqual('qid', flight.do('key', slow))
+        self.assertEqual(2, len(calls))
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        def failing():
+            release.wait()
+            raise ValueError('vault down')
+        threads, results = self.run_concurrently(flight, 'key', failing, 4)
+        while flight.collapsed < 3:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(results))
+        self.assertTrue(all(isinstance(e, ValueError) for e in results))
+        self.assertEqual(0, flight.stats()['in_flight'])
+
+    def test_base_exception_shared(self):
+        """callers waiting on a call killed by an exception that is not an Exception do not get None"""
+        class Killed(BaseException):
+            pass
+        flight = SingleFlight()
+        release = threading.Event()
+        def killed():
+            release.wait()
+            raise Killed()
+        threads, results = self.run_concurrently(flight, 'key', killed, 4)
+        while flight.collapsed < 3:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(results))
+        self.assertTrue(all(isinstance(e, Killed) for e in results))
+        self.assertEqual(0, flight.stats()['in_flight'])
+
+    def test_wait_timeout(self):
+        """a caller waits for a slow call in flight at most its own timeout"""
+        flight = SingleFlight()
+        release = threading.Event()
+        def slow():
+            release.wait(5)
+            return 'qid'
+        threads, results = self.run_concurrently(flight, 'key', slow, 1)
+        while not flight.stats()['in_flight']:
+            release.wait(0.01)
+        with self.assertRaises(WaitTimeout):
+            flight.do('key', slow, 0.05)
+        release.set()
+        threads[0].join()
+        self.assertEqual(['qid'], results)
+        self.assertEqual({'calls': 1, 'collapsed': 1, 'timed_out': 1, 'in_flight': 0}, flight.stats())
+
+    def test_different_keys(self):
+        flight = SingleFlight()
+        self.assertEqual(1, flight.do('a', lambda: 1))
+        self.assertEqual(2, flight.do('b', lambda: 2))
+        self.assertEqual({'calls': 2, 'collapsed': 0, 'timed_out': 0, 'in_flight': 0}, flight.stats())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,71 @@
+"""
+Test the pooled http client
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import threading
+import time
+import unittest
+from unittest import TestCase
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+import requests
+
+from tugboat.client import Client
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """answers every request over a persistent connection, /slow answers late"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        if self.path == '/slow':
+            time.sleep(0.5)
+        body = '{"qid": "abc"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClient(TestCase):
+    """
+    Test connection reuse and timeouts against a local server
+    """
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        client = Client({'CLIENT_CONNECT_TIMEOUT': 1, 'CLIENT_READ_TIMEOUT': 1, 'CLIENT_POOL_MAXSIZE': 2})
+        for i in range(3):
+            r = client.session.post(self.url + '/query', data={'bigquery': ['bibcode\nbib1']})
+            self.assertEqual('abc', r.json()['qid'])
+        self.assertEqual({'pools': 1, 'connections': 1, 'requests': 3, 'reused': 2}, client.stats())
+
+    def test_read_timeout(self):
+        client = Client({'CLIENT_CONNECT_TIMEOUT': 1, 'CLIENT_READ_TIMEOUT': 0.1})
+        self.assertRaises(requests.exceptions.ReadTimeout, client.session.post, self.url + '/slow', data={})
+        # a timeout passed to the call takes precedence
+        self.assertEqual(200, client.session.post(self.url + '/slow', data={}, timeout=2).status_code)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
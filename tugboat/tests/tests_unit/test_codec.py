@@ -0,0 +1,40 @@
+# coding: utf-8
+"""
+Test the json codecs
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import json
+import unittest
+from unittest import TestCase
+
+from tugboat.codec import decoder, DECODERS, PREFERENCE
+
+
+class TestDecoder(TestCase):
+    """
+    Test choosing and using a json library
+    """
+
+    def test_choice(self):
+        self.assertIs(json.loads, decoder('json'))
+        self.assertIs(DECODERS[[name for name in PREFERENCE if name in DECODERS][0]], decoder('auto'))
+        with self.assertRaises(ValueError):
+            decoder('yajl')
+
+    def test_same_result(self):
+        body = json.dumps([{'name': u'liste é', 'bibcodes': ['2018A&A...610A..22B', u'bib–\\"1']},
+                           {'qid': 'abc', 'numfound': 12}])
+        for name, loads in DECODERS.items():
+            self.assertEqual(json.loads(body), loads(body), name)
+            with self.assertRaises(ValueError):
+                loads(body[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,108 @@
+"""
+Test hedged calls
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import itertools
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from tugboat.hedge import Hedger
+
+
+class SlowFirst(object):
+    """a call whose first attempt takes delay seconds and the others answer at once"""
+
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+        self.attempts = itertools.count()
+
+    def __call__(self):
+        attempt = next(self.attempts)
+        if attempt == 0:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error(attempt)
+        return attempt
+
+
+class TestHedger(TestCase):
+    """
+    Test hedging slow calls
+    """
+
+    def setUp(self):
+        self.hedger = Hedger(percentile=90, min_delay=0.01, max_fraction=0.5, burst=1, min_samples=5)
+        for i in range(5):
+            self.hedger.call(lambda: None)
+
+    def test_not_hedged_before_latencies_known(self):
+        hedger = Hedger(min_samples=5)
+        self.assertIsNone(hedger.delay())
+        self.assertEqual(0, hedger.call(SlowFirst(0.05)))
+        self.assertEqual(0, hedger.stats()['hedged'])
+
+    def test_hedge_wins(self):
+        start = time.time()
+        self.assertEqual(1, self.hedger.call(SlowFirst(0.5)))
+        self.assertLess(time.time() - start, 0.3)
+        stats = self.hedger.stats()
+        self.assertEqual((6, 1, 1), (stats['calls'], stats['hedged'], stats['hedge_wins']))
+
+    def test_fast_call_not_hedged(self):
+        self.assertEqual(0, self.hedger.call(SlowFirst(0)))
+        time.sleep(0.05)
+        self.assertEqual(0, self.hedger.stats()['hedged'])
+
+    def test_hedges_capped(self):
+        for i in range(6):
+            self.hedger.call(SlowFirst(0.05))
+        # 11 calls earned 5.5 hedges, at most 1 saved up at a time
+        self.assertLessEqual(self.hedger.stats()['hedged'], 3)
+        self.assertGreaterEqual(self.hedger.stats()['hedged'], 1)
+
+    def test_admitted(self):
+        released = []
+        self.assertEqual(1, self.hedger.call(SlowFirst(0.5), lambda: True, lambda: released.append(1)))
+        self.assertEqual([1], released)
+        self.hedger._tokens = 1
+        self.assertEqual(0, self.hedger.call(SlowFirst(0.05), lambda: False, lambda: released.append(2)))
+        stats = self.hedger.stats()
+        self.assertEqual((1, 1), (stats['hedged'], stats['skipped']))
+        self.assertEqual([1], released)
+
+    def test_first_error_raised(self):
+        with self.assertRaises(ValueError) as context:
+            self.hedger.call(SlowFirst(0.1, error=ValueError))
+        # the hedge failed first
+        self.assertEqual((1,), context.exception.args)
+        self.assertEqual(1, self.hedger.stats()['hedged'])
+
+    def test_threads(self):
+        errors = []
+
+        def call():
+            try:
+                self.assertEqual(1, self.hedger.call(SlowFirst(0.2)))
+            except Exception as e:
+                errors.append(e)
+        self.hedger.burst = self.hedger._tokens = 4
+        threads = [threading.Thread(target=call) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(4, self.hedger.stats()['hedge_wins'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,91 @@
+# coding: utf-8
+"""
+Test the deferred job store
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import unittest
+from unittest import TestCase
+
+from tugboat.jobs import JobStore
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestJobStore(TestCase):
+    """
+    Test creating, finishing and expiring jobs
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.jobs = JobStore(size=2, ttl=60, clock=self.clock)
+
+    def test_job(self):
+        token = self.jobs.create()
+        self.assertEqual({'state': 'pending', 'status_code': 0}, self.jobs.get(token))
+        self.jobs.finish(token, u'qid1')
+        self.assertEqual({'state': 'done', 'status_code': 200, 'qid': 'qid1'}, self.jobs.get(token))
+        token2 = self.jobs.create()
+        self.jobs.fail(token2, 504, u'Gateway Timeout – vault')
+        self.assertEqual({'state': 'failed', 'status_code': 504, 'error': u'Gateway Timeout – vault'},
+                         self.jobs.get(token2))
+        self.assertEqual({'pending': 0, 'done': 1, 'failed': 1}, self.jobs.stats())
+
+    def test_unknown_tokens(self):
+        token = self.jobs.create()
+        for unknown in ('', 'x', '5-' + token[2:], token[:-1], '-1' + token[1:], None):
+            self.assertIsNone(self.jobs.get(unknown))
+        self.jobs.finish(token[:-1], 'qid1')
+        self.assertEqual('pending', self.jobs.get(token)['state'])
+
+    def test_bounded(self):
+        token = self.jobs.create()
+        token2 = self.jobs.create()
+        # full of pending jobs
+        self.assertIsNone(self.jobs.create())
+        self.jobs.finish(token2, 'qid2')
+        self.clock.now += 1
+        self.jobs.finish(token, 'qid1')
+        # the oldest finished job is replaced
+        token3 = self.jobs.create()
+        self.assertIsNone(self.jobs.get(token))
+        self.assertEqual('qid2', self.jobs.get(token2)['qid'])
+        self.clock.now += 60
+        self.assertIsNone(self.jobs.get(token2))
+        self.assertIsNotNone(self.jobs.create())
+        self.assertIsNotNone(self.jobs.create())
+        self.assertIsNone(self.jobs.get(token3))
+
+    def test_shared_with_forked_workers(self):
+        token = self.jobs.create()
+        pid = os.fork()
+        if pid == 0:
+            self.jobs.finish(token, 'qid1')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual('qid1', self.jobs.get(token)['qid'])
+
+    def test_lost_job(self):
+        pid = os.fork()
+        if pid == 0:
+            self.jobs.create()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        token = self.jobs._jobs[0].token
+        self.assertEqual({'state': 'failed', 'status_code': 500, 'error': 'job lost'}, self.jobs.get(token))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -11,8 +11,11 @@ import urllib
 from unittest import TestCase
 from datetime import datetime
 from werkzeug.datastructures import MultiDict
+from flask import Flask
 
-from tugboat.views import ClassicSearchRedirectView
+from tugboat.views import ClassicSearchRedirectView, CLASSIC_SCHEMA
+from tugboat.translator import ClassicTranslator, canonical_query, date_dependency_expiry, WEIGHT_DEFAULTS, \
+    quote_join, ClassicArgs, TRANSLATION_RULES, RULE_INDEX, ALWAYS_RULES, CLASSIC_PARAMETERS
 
 class TestSearchParametersTranslation(TestCase):
     """
@@ -226,6 +229,11 @@ class TestSearchParametersTranslation(TestCase):
                          '&sort=' + urllib.quote('date desc, bibcode desc'),
                          search) # general only
 
+        req.args = MultiDict([('db_key', 'AST')])
+        req.args.update(self.append_default_weights())
+        self.assertEqual(search.replace('general', 'astronomy'), ClassicSearchRedirectView().translate(req))
+        self.assertEqual(search.replace('general', 'astronomy'), ClassicSearchRedirectView().translate(req))  # shared tables are unchanged
+
     def test_article_sel(self):
         """article_sel to property:article"""
         req = Request('get', 'http://test.test?')
@@ -838,5 +846,216 @@ class TestSearchParametersTranslation(TestCase):
                          '&fq_bibstem_facet=(' + urllib.quote('bibstem_facet:("ApJ" OR " AJ" OR " AAS")') + ')' +
                          '&sort=' + urllib.quote('date desc, bibcode desc'), search)
 
+
+class TestClassicSchema(TestCase):
+    """
+    Test the classic parameter schema that is compiled at import
+
+    """
+
+    def test_only_present_parameters(self):
+        """only parameters from the request that classic defines are returned"""
+        req = Request('get', 'http://test.test?')
+        req.args = MultiDict([('author', 'Huchra,+John'), ('start_year', 1990), ('not_classic', 'foo')])
+        args = CLASSIC_SCHEMA.parse(req)
+        self.assertEqual({'author': u'Huchra,+John', 'start_year': 1990}, args)
+        self.assertTrue(isinstance(args['author'], unicode))
+
+    def test_first_value_wins(self):
+        """repeated parameters keep the first value, query string before form"""
+        req = Request('get', 'http://test.test?')
+        req.args = MultiDict([('sort', 'NDATE'), ('sort', 'ODATE')])
+        req.form = MultiDict([('sort', 'AUTHOR'), ('db_key', 'AST')])
+        self.assertEqual({'sort': u'NDATE', 'db_key': u'AST'}, CLASSIC_SCHEMA.parse(req))
+
+    def test_webargs_order(self):
+        """parameters are added in the order webargs adds them, unprocessed ones are listed in the same order"""
+        unprocessed = urllib.quote('Parameters not processed: txt_wgt txt_logic ttl_wgt aut_wgt obj_wgt ttl_wt obj_wt '
+                                   'txt_sco ttl_syn ref_link ttl_sco aut_wt aut_syn txt_syn txt_wt')
+        for args in ([('ref_link', 'x'), ('txt_logic', 'OR')], [('txt_logic', 'OR'), ('ref_link', 'x')]):
+            req = Request('get', 'http://test.test?')
+            req.prepare()
+            req.args = MultiDict(args)
+            req.mimetype = None
+            self.assertTrue(ClassicSearchRedirectView().translate(req).endswith('&unprocessed_parameter=' + unprocessed))
+
+    def test_immutable(self):
+        """schema is shared by all requests and cannot be modified"""
+        with self.assertRaises(AttributeError):
+            CLASSIC_SCHEMA.names = frozenset()
+
+
+class TestCanonicalQuery(TestCase):
+    """
+    Test the cache key of classic queries
+
+    """
+
+    def append_default_weights(self):
+        return MultiDict(WEIGHT_DEFAULTS.items())
+
+    def test_equivalent_queries(self):
+        """parameter order, repeated group_sel and default weights do not matter"""
+        a = MultiDict([('group_sel', 'ARI'), ('group_sel', 'HST'), ('db_key', 'AST'), ('foo', 'bar')])
+        a.update(self.append_default_weights())
+        b = MultiDict([('db_key', 'AST'), ('group_sel', 'ARI,HST')])
+        b.update(self.append_default_weights())
+        self.assertEqual(canonical_query(a), canonical_query(b))
+        self.assertEqual((('db_key', 'AST'), ('group_sel', 'ARI,HST')), canonical_query(a))
+
+    def test_distinct_queries(self):
+        """changed or missing default weights change the translation"""
+        a = self.append_default_weights()
+        b = self.append_default_weights()
+        b['ttl_wt'] = '0.5'
+        self.assertNotEqual(canonical_query(a), canonical_query(b))
+        self.assertNotEqual(canonical_query(a), canonical_query(MultiDict()))
+
+    def test_date_dependency(self):
+        """open ended date searches expire when the month or day ends"""
+        now = datetime(2018, 12, 15, 10, 30)
+        self.assertIsNone(date_dependency_expiry((('end_year', '1990'),), now))
+        self.assertIsNone(date_dependency_expiry((('start_year', '1990'), ('end_year', '1991')), now))
+        self.assertEqual(datetime(2019, 1, 1),
+                         datetime.fromtimestamp(date_dependency_expiry((('start_year', '1990'),), now)))
+        self.assertEqual(datetime(2018, 12, 16),
+                         datetime.fromtimestamp(date_dependency_expiry((('start_year', '1990'),
+                                                                        ('start_entry_year', '2000')), now)))
+
+
+class TestQuoteJoin(TestCase):
+    """
+    Test the single pass fragment encoder
+
+    """
+
+    def test_same_as_quoting_joined_string(self):
+        terms = ['"Huchra, John"', 'M31', 'A&A', '"x=y"']
+        for connector in (' AND ', ' OR '):
+            self.assertEqual(urllib.quote(connector.join(terms)), quote_join(terms, connector))
+            self.assertEqual(urllib.quote_plus(connector.join(terms)), quote_join(terms, connector, urllib.quote_plus))
+        self.assertEqual('M31', quote_join(['M31'], ' AND '))
+
+    def test_long_author_list(self):
+        """thousands of authors translate like a short list"""
+        authors = ['Author{},+A.'.format(i) for i in range(5000)]
+        req = Request('get', 'http://test.test?')
+        req.prepare()
+        req.mimetype = None
+        req.args = MultiDict([('author', urllib.quote(';'.join(authors)))])
+        req.args.update(self.append_default_weights())
+        search = ClassicSearchRedirectView().translate(req)
+        expected = ' AND '.join('"Author{}, A."'.format(i) for i in range(5000))
+        self.assertEqual('q=' + urllib.quote('author:') + '(' + urllib.quote(expected) + ')' +
+                         '&sort=' + urllib.quote('date desc, bibcode desc'), search)
+
+    def append_default_weights(self):
+        return MultiDict(WEIGHT_DEFAULTS.items())
+
+
+class TestClassicArgs(TestCase):
+    """
+    Test the webargs-free parser
+
+    """
+
+    def test_parse(self):
+        req = Request('get', 'http://test.test?')
+        req.args = MultiDict([('author', 'Huchra,+John'), ('start_year', 1990), ('not_classic', 'foo'),
+                              ('group_sel', 'ARI'), ('group_sel', 'HST'), ('sort', 'NDATE'), ('sort', 'ODATE')])
+        args = ClassicArgs.parse(req.args)
+        # listed as a dict filled in CLASSIC_PARAMETERS order
+        expected = dict.fromkeys(name for name in CLASSIC_PARAMETERS if name in ('author', 'start_year', 'group_sel', 'sort'))
+        self.assertEqual(expected.keys(), args.keys())
+        self.assertEqual(u'Huchra,+John', args['author'])
+        self.assertTrue(isinstance(args['author'], unicode))
+        self.assertEqual(1990, args.get('start_year'))
+        self.assertEqual('ARI,HST', args['group_sel'])
+        self.assertEqual('NDATE', args['sort'])
+        self.assertFalse('title' in args)
+        self.assertRaises(KeyError, lambda: args['title'])
+
+        self.assertEqual('NDATE', args.pop('sort'))
+        self.assertEqual(None, args.pop('sort'))
+        args['aut_syn'] = ''
+        del expected['sort']
+        expected['aut_syn'] = None
+        self.assertEqual(expected.keys(), args.keys())
+
+    def test_same_translation(self):
+        """translations match the webargs parser"""
+        queries = [[('author', urllib.quote('Huchra,+John;Macri,+Lucas+M.')), ('aut_logic', 'OR')],
+                   [('group_and', 'NO'), ('group_sel', 'ARI'), ('group_sel', 'ESO/Lib'), ('db_key', 'AST')],
+                   [('start_year', '1990'), ('end_year', '1991'), ('sort', 'foo'), ('aff_logic', 'foo')],
+                   [('data_and', 'YES'), ('article', 'YES'), ('gif_link', 'YES'), ('arxiv_sel', 'cs')]]
+        app = Flask(__name__)
+        app.config['CLASSIC_FAST_PARSER'] = True
+        for query in queries:
+            req = Request('get', 'http://test.test?')
+            req.prepare()
+            req.mimetype = None
+            req.args = MultiDict(query)
+            req.args.update(MultiDict(WEIGHT_DEFAULTS.items()))
+            expected = ClassicSearchRedirectView().translate(req)
+            with app.app_context():
+                view = ClassicSearchRedirectView()
+                self.assertTrue(isinstance(view.parse(req), ClassicArgs))
+                self.assertEqual(expected, view.translate(req))
+
+    def test_same_unprocessed(self):
+        """unprocessed parameters are listed in the order of the webargs parser"""
+        query = [('ref_link', 'YES'), ('txt_logic', 'OR'), ('ttl_wt', '0.5'), ('obj_wgt', 'YES'), ('aut_syn', 'NO'),
+                 ('data_and', 'NO'), ('open_link', 'YES'), ('author', 'Huchra,+John')]
+        req = Request('get', 'http://test.test?')
+        req.prepare()
+        req.mimetype = None
+        req.args = MultiDict(query)
+        expected = ClassicSearchRedirectView().translate(req)
+        self.assertTrue('unprocessed_parameter=' in expected)
+        app = Flask(__name__)
+        app.config['CLASSIC_FAST_PARSER'] = True
+        with app.app_context():
+            self.assertEqual(expected, ClassicSearchRedirectView().translate(req))
+
+
+class TestTranslationRules(TestCase):
+    """
+    Test the compiled translation rule table
+
+    """
+
+    def test_index(self):
+        """every parameter a rule consumes triggers it"""
+        handlers = lambda name: [TRANSLATION_RULES[i][0] for i in RULE_INDEX[name]]
+        self.assertEqual(['translate_authors'], handlers('aut_xct'))
+        self.assertEqual(['translate_enum'], handlers('db_key'))
+        self.assertEqual(['translate_data_entries'], handlers('gif_link'))
+        self.assertEqual(['translate_simple'], handlers('txt_logic'))
+        self.assertEqual(set(['translate_enum', 'translate_weights']),
+                         set(TRANSLATION_RULES[i][0] for i in ALWAYS_RULES))
+
+    def test_only_triggered_rules_run(self):
+        """rules for absent parameters are skipped"""
+        class Translator(ClassicTranslator):
+            def translate_pubdate(self, args, translation):
+                raise AssertionError('pubdate rule should not run')
+
+        class View(ClassicSearchRedirectView):
+            def translate(self, request):
+                return Translator().translate(self.parse(request))
+
+        req = Request('get', 'http://test.test?')
+        req.prepare()
+        req.mimetype = None
+        req.args = MultiDict([('title', 'M31'), ('db_key', 'AST')])
+        req.args.update(MultiDict(WEIGHT_DEFAULTS.items()))
+        self.assertEqual('q=' + urllib.quote('title:') + '(' + urllib.quote('M31') + ')' +
+                         '&fq=%7B!type%3Daqp%20v%3D%24fq_database%7D&fq_database=(database%3A%22astronomy%22)' +
+                         '&sort=' + urllib.quote('date desc, bibcode desc'), View().translate(req))
+
+        req.args['start_year'] = '1990'
+        self.assertRaises(AssertionError, View().translate, req)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,159 @@
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import unittest
+import subprocess
+import random
+import threading
+import urllib
+from unittest import TestCase
+from werkzeug.datastructures import MultiDict
+
+from tugboat.translator import translate, ClassicArgs, WEIGHT_DEFAULTS, TRANSLATOR, Translation, compact_encoding, \
+    classic_terms, CLASSIC_PARAMETERS
+
+
+class TestTranslator(TestCase):
+    """
+    Test the translation engine used as a library
+
+    """
+
+    def test_query_string(self):
+        """query strings, MultiDicts and dicts translate the same"""
+        query = [('author', 'Huchra, John'), ('aut_logic', 'OR'), ('group_and', 'NO'),
+                 ('group_sel', 'ARI'), ('group_sel', 'HST'), ('db_key', 'AST')] + WEIGHT_DEFAULTS.items()
+        expected = translate(MultiDict(query))
+        self.assertEqual(expected, translate(urllib.urlencode(query)))
+        self.assertEqual(expected, translate('?' + urllib.urlencode(query)))
+        self.assertEqual(expected, translate(query))
+        self.assertEqual('q=' + urllib.quote('author:') + '(' + urllib.quote('"Huchra, John"') + ')' +
+                         '&fq=%7B!type%3Daqp%20v%3D%24fq_database%7D&fq_database=(database%3A%22astronomy%22)' +
+                         '&fq=%7B!type%3Daqp%20v%3D%24fq_bibgroup_facet%7D&fq_bibgroup_facet=(bibgroup_facet%3A%28%22ARI%22+OR+%22HST%22%29)' +
+                         '&sort=' + urllib.quote('date desc, bibcode desc'), expected)
+
+        params = dict(WEIGHT_DEFAULTS, title='M31', group_and='NO', group_sel=['ARI', 'HST'])
+        self.assertEqual(translate(MultiDict(params)), translate(params))
+
+    def test_parse_query_string(self):
+        args = ClassicArgs.parse('title=M%C3%A9szaros&start_year=1990&group_sel=ARI&group_sel=HST&foo=bar&text=')
+        expected = dict.fromkeys(name for name in CLASSIC_PARAMETERS if name in ('title', 'start_year', 'group_sel', 'text'))
+        self.assertEqual(expected.keys(), args.keys())
+        self.assertEqual(u'M\xe9szaros', args['title'])
+        self.assertEqual('ARI,HST', args['group_sel'])
+        self.assertEqual(u'', args['text'])
+
+    def test_no_web_stack(self):
+        """importing the translator does not import flask or webargs"""
+        code = 'import sys; import tugboat.translator; ' \
+               'print(" ".join(sorted(m for m in ("flask", "webargs", "werkzeug", "adsmutils") if m in sys.modules)))'
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=PROJECT_HOME)
+        self.assertEqual('', output.strip())
+
+    def test_immutable_result(self):
+        translation = TRANSLATOR.build(ClassicArgs.parse('title=M31&sort=foo&min_score=1&aff_logic=AND'))
+        self.assertTrue(isinstance(translation, Translation))
+        self.assertEqual(('title%3A(M31)',), translation.search)
+        self.assertEqual((urllib.quote('Invalid value for sort: foo'),), translation.error_message)
+        self.assertEqual(set(['aff_logic'] + WEIGHT_DEFAULTS.keys()), set(translation.unprocessed))
+        self.assertRaises(AttributeError, setattr, translation, 'sort', '')
+        self.assertRaises(AttributeError, setattr, translation, 'other', '')
+
+    def test_concurrent_translation(self):
+        """threads sharing the translator get the same translations as a single thread"""
+        rng = random.Random(8)
+        choices = [('author', ['Huchra, John', 'Huchra, John;Macri, Lucas']), ('aut_logic', ['OR', 'AND']),
+                   ('title', ['M31', 'dark matter']), ('text', ['galaxy']), ('start_year', ['1990', '']),
+                   ('end_year', ['1995']), ('db_key', ['AST', 'PHY', 'foo']), ('jou_pick', ['NO', 'bar']),
+                   ('sort', ['CITATIONS', 'baz']), ('data_and', ['YES', 'NO']), ('gif_link', ['YES', 'no']),
+                   ('group_and', ['NO', 'YES']), ('group_sel', ['ARI,HST', 'Keck']), ('arxiv_sel', ['cs', 'xx']),
+                   ('ref_stems', ['ApJ..,AJ...']), ('ttl_wt', ['0.3', '1.0']), ('min_score', ['1'])]
+        queries = []
+        for i in range(300):
+            query = [(name, rng.choice(values)) for name, values in choices if rng.random() < 0.4]
+            queries.append(urllib.urlencode(query))
+        expected = [translate(query) for query in queries]
+
+        results = []
+        def worker(seed):
+            order = range(len(queries))
+            random.Random(seed).shuffle(order)
+            for i in order * 3:
+                results.append((i, translate(queries[i])))
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(16)]
+        # switch threads as often as possible
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+
+        self.assertEqual(16 * 3 * len(queries), len(results))
+        for i, result in results:
+            self.assertEqual(expected[i], result)
+
+
+class TestClassicTerms(TestCase):
+    """
+    Test the classic field tokenizer
+
+    """
+
+    def test_terms(self):
+        self.assertEqual(['"Huchra, John"', '"Macri, Lucas M."', '"de Vaucouleurs, G"', ''],
+                         list(classic_terms(urllib.quote('Huchra,+John\r\nMacri, Lucas M.;"de Vaucouleurs, G";'))))
+        self.assertEqual(['"a b"', '', 'c\r', '"', '"\" x"'], list(classic_terms('a+b;;c\r;";" x')))
+        self.assertEqual([''], list(classic_terms('')))
+        self.assertEqual(['a', 'b'], list(classic_terms('a%3Bb')))
+
+    def test_many_terms(self):
+        value = urllib.quote('\r\n'.join('Author{}, A. B.'.format(i) for i in range(50000)))
+        terms = classic_terms(value)
+        self.assertEqual(50000, len(terms))
+        self.assertEqual('"Author0, A. B."', terms[0])
+        self.assertEqual('"Author49999, A. B."', terms[-1])
+
+
+class TestCompactOutput(TestCase):
+    """
+    Test the compact output mode
+
+    """
+
+    def test_merged_filters(self):
+        query = 'title=M31&article_sel=YES&data_link=YES&db_key=AST&sort=SCORE'
+        self.assertEqual('q=title:(M31)' +
+                         '&fq=%7B!type%3Daqp%20v%3D$fq_database%7D&fq_database=(database:%22astronomy%22)' +
+                         '&fq=%7B!type%3Daqp%20v%3D$fq_doctype%7D' +
+                         '&fq_doctype=((doctype:%22data%22)%20AND%20(doctype:%22article%22))' +
+                         '&unprocessed_parameter=Parameters%20not%20processed:%20' +
+                         urllib.quote(' '.join(TRANSLATOR.build(ClassicArgs.parse(query)).unprocessed)),
+                         translate(query, compact=True))
+        self.assertEqual(2, translate(query).count('fq_doctype%3D'))
+        self.assertTrue('&sort=date%20desc&' in translate(query.replace('SCORE', 'NDATE'), compact=True))
+
+    def test_same_values(self):
+        """without filters to merge, compact output decodes to the verbose output less the default sort"""
+        queries = ['author=Huchra,+John;Macri,+Lucas&aut_logic=OR&object=M31&text=x,y&start_year=1990&sort=NDATE',
+                   'group_and=NO&group_sel=ARI&group_sel=ESO/Lib&arxiv_sel=cs&arxiv_sel=hep-th&db_key=PHY',
+                   'ref_stems=ApJ..,A%26A..&data_and=YES&article=YES&gif_link=YES&sort=foo&bar=baz']
+        for query in queries:
+            verbose, compact = translate(query), translate(query, compact=True)
+            self.assertTrue(len(compact) < len(verbose))
+            self.assertEqual([urllib.unquote_plus(p) for p in verbose.split('&')
+                              if p != 'sort=' + urllib.quote('date desc, bibcode desc')],
+                             [urllib.unquote_plus(p) for p in compact.split('&')])
+
+    def test_compact_encoding(self):
+        self.assertEqual('a:(b,c)%20%26%3D%2B%253A', compact_encoding('a%3A%28b%2cc%29%20%26%3D%2B%253A'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
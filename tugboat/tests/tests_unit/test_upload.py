@@ -0,0 +1,140 @@
+# coding: utf-8
+"""
+Test reading uploaded bibcode lists
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import json
+import zlib
+import gzip
+import io
+import unittest
+from unittest import TestCase
+
+from tugboat.upload import iter_json_batches, iter_text_batches, decompress, BibcodeUpload
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def read(chunks, **kwargs):
+    return [item.decode('utf-8') for items in iter_json_batches(chunks, **kwargs) for item in items]
+
+
+class TestIterJsonBatches(TestCase):
+    """
+    Test the incremental json array reader
+    """
+
+    def test_any_chunk_boundary(self):
+        bibcodes = [u'2018ApJ...856..174K', u'', u'1996AJ....111..794H', u'a "quoted" \\ é \U0001f600', u'x,y]']
+        data = ' ' + json.dumps(bibcodes).replace('[', '[ ', 1).replace(', ', ' ,\n') + ' \n'
+        self.assertEqual(bibcodes, read([data]))
+        self.assertEqual([u'é', u'b'], read([u'["é", "b"]'.encode('utf-8')]))
+        for size in range(1, len(data) + 1):
+            self.assertEqual(bibcodes, read(chunked(data, size)), size)
+
+    def test_empty(self):
+        self.assertEqual([], read(['[]']))
+        self.assertEqual([], read(['[', ' ', ']']))
+
+    def test_invalid(self):
+        for data in ['', '{"a": "b"}', '["a" "b"]', '["a",]', '[1]', '["a"', '["a"] x', '["a\nb"]', '["a\\',
+                     '["a", "\xff"]', '["\xff", "a"]']:
+            for size in (1, 3, 100):
+                with self.assertRaises(ValueError):
+                    read(chunked(data, size))
+
+    def test_max_item_size(self):
+        data = json.dumps(['a' * 10, 'b' * 20, 'c'])
+        self.assertEqual(3, len(read(chunked(data, 4), max_item_size=30)))
+        for size in (4, 100):
+            with self.assertRaises(ValueError):
+                read(chunked(data, size), max_item_size=15)
+
+
+class TestIterTextBatches(TestCase):
+    """
+    Test the newline separated reader
+    """
+
+    def test_any_chunk_boundary(self):
+        data = 'bibcode\r\n2018ApJ...856..174K\r\n\n1996AJ....111..794H\n\xc3\xa9'
+        expected = ['2018ApJ...856..174K', '1996AJ....111..794H', '\xc3\xa9']
+        for size in range(1, len(data) + 1):
+            self.assertEqual(expected, [item for items in iter_text_batches(chunked(data, size)) for item in items])
+        self.assertEqual([['a', 'bibcode']], list(iter_text_batches(['\na\nbibcode\n'])))
+        self.assertEqual([], list(iter_text_batches(['bibcode\n', '\n'])))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            list(iter_text_batches(['a\n\xff\n']))
+        with self.assertRaises(ValueError):
+            list(iter_text_batches(['a\n', 'b' * 20], max_item_size=15))
+
+
+class TestDecompress(TestCase):
+    """
+    Test decompressing uploads
+    """
+
+    def test_encodings(self):
+        data = '\n'.join('bib{}'.format(i) for i in range(10000))
+        gzipped = io.BytesIO()
+        with gzip.GzipFile(fileobj=gzipped, mode='wb') as f:
+            f.write(data)
+        for encoding, compressed in (('gzip', gzipped.getvalue()), ('deflate', zlib.compress(data))):
+            self.assertEqual(data, ''.join(decompress(chunked(compressed, 100), encoding, len(data), chunk_size=1000)))
+            with self.assertRaises(ValueError):
+                list(decompress([compressed[:10] + 'x' * 20 + compressed[30:]], encoding, len(data)))
+
+    def test_too_large(self):
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from tugboat.app import create_app
+        with create_app().app_context():
+            with self.assertRaises(RequestEntityTooLarge):
+                list(decompress([zlib.compress('0' * 100000)], 'deflate', 99999))
+
+
+class TestBibcodeUpload(TestCase):
+    """
+    Test the bigquery text of an upload
+    """
+
+    def test_bigquery(self):
+        upload = BibcodeUpload(spool_size=16)
+        upload.extend(['2018ApJ...856..174K', '2017A&A...600A..10B'])
+        upload.extend(['2018ApJ...856..174K', ' 1996AJ....111..794H\t', '\xc3\xa9', '2017A&A...600A..10B'])
+        self.assertEqual('bibcode\n2018ApJ...856..174K\n2017A&A...600A..10B\n1996AJ....111..794H', upload.bigquery())
+        self.assertEqual(set(['2018ApJ...856..174K', '1996AJ....111..794H', '2017A&A...600A..10B']), upload.unique)
+        self.assertEqual(6, upload.count)
+        self.assertEqual([u'2018ApJ...856..174K', u'2017A&A...600A..10B', u'1996AJ....111..794H'],
+                         list(upload.iter_bibcodes()))
+        self.assertEqual(([u'\xe9'], 1), (upload.rejected, upload.rejected_count))
+        upload.close()
+
+    def test_rejected(self):
+        upload = BibcodeUpload(spool_size=1024, max_rejected=2)
+        upload.extend(['2018ApJ...856..174', '2018ApJ...856..174KX', 'bibcode', '', '2018 ApJ...856..174K',
+                       '2018ApJ...856..174K', '1996AJ....111..794H'])
+        self.assertEqual('bibcode\n2018ApJ...856..174K\n1996AJ....111..794H', upload.bigquery())
+        self.assertEqual(([u'2018ApJ...856..174', u'2018ApJ...856..174KX'], 5), (upload.rejected, upload.rejected_count))
+        upload.close()
+
+    def test_embedded_newline(self):
+        upload = BibcodeUpload(spool_size=1024)
+        upload.extend(['2018ApJ...856..174K\n1996AJ....111..794H', '2018ApJ...856..174K'])
+        self.assertEqual('bibcode\n2018ApJ...856..174K', upload.bigquery())
+        self.assertEqual(set(['2018ApJ...856..174K']), upload.unique)
+        self.assertEqual(([u'2018ApJ...856..174K\n1996AJ....111..794H'], 1), (upload.rejected, upload.rejected_count))
+        upload.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
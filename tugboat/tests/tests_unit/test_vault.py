@@ -0,0 +1,232 @@
+"""
+Test storing bibcode lists in vault
+"""
+
+import sys
+import os
+PROJECT_HOME = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.append(PROJECT_HOME)
+
+import itertools
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from werkzeug.exceptions import HTTPException
+
+from tugboat.admission import AdmissionControl
+from tugboat.app import create_app
+from tugboat.upload import BibcodeUpload
+from tugboat.vault import bibcode_digest, bibcode_search_url, store_query, query_id
+from tugboat.tests.fake_vault import FakeVault
+
+
+def wait_for(condition):
+    """wait until condition() holds, the timeout only guards against a hang"""
+    for i in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError('timed out')
+
+
+class PausedUpload(BibcodeUpload):
+    """the first reader of the bigquery waits for resume after its first chunk, chunks counts the chunks read"""
+
+    def __init__(self, spool_size):
+        BibcodeUpload.__init__(self, spool_size)
+        self.readers = itertools.count()
+        self.chunks = [0, 0]
+        self.resume = threading.Event()
+        self.finished = threading.Event()
+
+    def iter_bigquery(self, chunk_size=1024):
+        reader = next(self.readers)
+        try:
+            for chunk in BibcodeUpload.iter_bigquery(self, chunk_size):
+                if reader == 0 and self.chunks[0] == 1:
+                    self.resume.wait(5)
+                self.chunks[reader] += 1
+                yield chunk
+        finally:
+            if reader == 0:
+                self.finished.set()
+
+
+class TestBibcodeDigest(TestCase):
+    """
+    Test the key of bibcode lists
+    """
+
+    def test_same_set(self):
+        key = bibcode_digest([u'2018ApJ...856..174K', u'1996AJ....111..794H'])
+        self.assertEqual(key, bibcode_digest([u'1996AJ....111..794H ', u'2018ApJ...856..174K', u'1996AJ....111..794H']))
+        self.assertNotEqual(key, bibcode_digest([u'2018ApJ...856..174K']))
+        # vault receives the same bigquery
+        self.assertEqual(bibcode_digest([u'a', u'b']), bibcode_digest([u'a\nb']))
+        self.assertEqual(40, len(bibcode_digest([u'2018A&A...610A..22\xe9'])))
+
+
+class TestBibcodeSearchUrl(TestCase):
+    """
+    Test redirecting small bibcode lists without vault
+    """
+
+    def test_url(self):
+        bibcodes = [u'2018ApJ...856..174K', u'1996AJ....111..794H', u'2018ApJ...856..174K ']
+        self.assertEqual('http://bbb/#search/q=bibcode%3A%28%222018ApJ...856..174K%22%20OR%20%221996AJ....111..794H%22%29',
+                         bibcode_search_url(bibcodes, 'http://bbb', 2, 2000))
+
+    def test_limits(self):
+        bibcodes = [u'2018ApJ...856..174K', u'1996AJ....111..794H', u'2017A&A...600A..10B']
+        self.assertIsNone(bibcode_search_url(bibcodes, 'http://bbb', 2, 2000))
+        self.assertIsNone(bibcode_search_url(bibcodes, 'http://bbb', 3, 100))
+        self.assertIsNotNone(bibcode_search_url(bibcodes, 'http://bbb', 3, 200))
+        self.assertIsNone(bibcode_search_url(bibcodes, 'http://bbb', 0, 2000))
+        self.assertIsNone(bibcode_search_url([], 'http://bbb', 3, 2000))
+
+
+class TestStoreQuery(TestCase):
+    """
+    Test posting the bigquery to a local stand-in vault in every transport
+    """
+
+    def setUp(self):
+        self.vault = FakeVault()
+        self.app = create_app()
+        self.app.config['VAULT_QUERY_URL'] = self.vault.url + '/query'
+        self.upload = BibcodeUpload(spool_size=1024)
+        self.upload.extend(['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000, i % 1000) for i in range(5000)])
+        self.upload.extend(['2018A&A...610A..22B'])
+
+    def tearDown(self):
+        self.upload.close()
+        self.vault.close()
+
+    def test_transports(self):
+        bigquery = self.upload.bigquery()
+        for transport in ('form', 'multipart', 'raw'):
+            for level in (0, 1):
+                self.app.config['VAULT_TRANSPORT'] = transport
+                self.app.config['VAULT_GZIP_LEVEL'] = level
+                with self.app.test_request_context():
+                    qid = store_query(self.upload)
+                received = self.vault.received[-1]
+                self.assertEqual('qid{}'.format(len(self.vault.received)), qid)
+                self.assertEqual(('/query', '*:*', '{!bitset}', bigquery),
+                                 (received['path'], received['q'], received['fq'], received['bigquery']))
+        sizes = [received['bytes'] for received in self.vault.received]
+        # form urlencoding inflates the body, gzip shrinks it
+        self.assertGreater(sizes[0], 1.1 * len(bigquery))
+        self.assertLess(sizes[2], 1.1 * len(bigquery))
+        self.assertLess(sizes[4], 1.1 * len(bigquery))
+        for gzipped in sizes[1::2]:
+            self.assertLess(gzipped, len(bigquery) / 4)
+        self.assertEqual('gzip', self.vault.received[5]['headers']['content-encoding'])
+
+    def hedger(self):
+        """the hedger of the app with its delay known and a hedge saved up"""
+        self.app.config['VAULT_HEDGE'] = True
+        self.app.config['VAULT_TRANSPORT'] = 'raw'
+        hedger = self.app.extensions['vault_hedger']
+        hedger._latencies.extend([0.01] * hedger.min_samples)
+        hedger._tokens = hedger.burst
+        return hedger
+
+    def test_hedged(self):
+        hedger = self.hedger()
+        answer = threading.Event()
+        waiting = threading.Event()
+        requests = itertools.count()
+
+        def latency():
+            # the first request is answered once the test lets it, the hedge at once
+            if next(requests) == 0:
+                waiting.set()
+                answer.wait(5)
+            return 0
+        self.vault.server.latency = latency
+        # the hedge is sent once the first request waits in vault
+        hedger.sleep = lambda delay: waiting.wait(5)
+        with self.app.test_request_context():
+            qid = store_query(self.upload)
+        answer.set()
+        self.assertEqual('qid2', qid)
+        stats = hedger.stats()
+        self.assertEqual((1, 1), (stats['hedged'], stats['hedge_wins']))
+        self.assertEqual(self.upload.bigquery(), self.vault.received[1]['bigquery'])
+
+    def test_hedge_needs_vault_call(self):
+        hedger = self.hedger()
+        self.app.extensions['admission'] = AdmissionControl(worker_max_vault_calls=1)
+        waiting = threading.Event()
+        requests = itertools.count()
+
+        def latency():
+            # the first request is answered once its hedge was skipped
+            if next(requests) == 0:
+                waiting.set()
+                wait_for(lambda: hedger.skipped)
+            return 0
+        self.vault.server.latency = latency
+        hedger.sleep = lambda delay: waiting.wait(5)
+        with self.app.test_request_context():
+            self.assertEqual('qid1', store_query(self.upload))
+        # the call held the only vault call, the hedge was not sent
+        self.assertEqual(1, len(self.vault.received))
+        self.assertEqual((0, 1), (hedger.stats()['hedged'], hedger.stats()['skipped']))
+        self.assertEqual(0, self.app.extensions['admission'].stats()['vault_calls'])
+
+    def test_loser_cancelled(self):
+        hedger = self.hedger()
+        upload = PausedUpload(spool_size=1024)
+        upload.extend(['{}ApJ...{:03d}..{:03d}K'.format(1900 + i % 120, i // 1000, i % 1000) for i in range(5000)])
+        # the hedge is sent once the first attempt streamed a chunk, it then waits for the test
+        hedger.sleep = lambda delay: wait_for(lambda: upload.chunks[0])
+        try:
+            with self.app.test_request_context():
+                qid = store_query(upload)
+            upload.resume.set()
+            self.assertTrue(upload.finished.wait(5))
+            self.assertEqual('qid1', qid)
+            self.assertEqual(1, hedger.stats()['hedge_wins'])
+            # the first attempt stopped streaming the upload once the hedge was answered
+            self.assertEqual(2, upload.chunks[0])
+            self.assertGreater(upload.chunks[1], 50)
+            self.assertEqual([upload.bigquery()], [received['bigquery'] for received in self.vault.received])
+        finally:
+            upload.close()
+
+    def test_waits_until_own_deadline(self):
+        """a request waiting for a slow call of the same list, as a deferred job's, gets a 504 at its deadline"""
+        answer = threading.Event()
+        self.vault.server.latency = lambda: answer.wait(5) and 0
+        results = []
+
+        def leader():
+            with self.app.test_request_context():
+                results.append(query_id(self.upload, time.time() + 300))
+        thread = threading.Thread(target=leader)
+        thread.start()
+        try:
+            wait_for(lambda: self.vault.received)
+            with self.app.test_request_context():
+                with self.assertRaises(HTTPException) as context:
+                    query_id(self.upload, time.time() + 0.05)
+            self.assertEqual(504, context.exception.code)
+        finally:
+            answer.set()
+            thread.join()
+        self.assertEqual(['qid1'], results)
+        self.assertEqual(1, self.app.extensions['vault_single_flight'].stats()['timed_out'])
+
+    def test_unknown_transport(self):
+        self.app.config['VAULT_TRANSPORT'] = 'pigeon'
+        with self.app.test_request_context():
+            self.assertRaises(ValueError, store_query, self.upload)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -10,12 +10,21 @@ PROJECT_HOME = os.path.abspath(
 sys.path.append(PROJECT_HOME)
 
 import json
+import time
+import zlib
+import urlparse
 import unittest
+import requests
 
 from flask import url_for
 from flask.ext.testing import TestCase
 from httmock import urlmatch, HTTMock
 from tugboat.app import create_app
+from tugboat.admission import AdmissionControl, BYTES, VAULT_CALLS
+
+
+BIBCODES = ['2018ApJ...856..174K', '1996AJ....111..794H', '2017A&A...600A..10B', '2019MNRAS.482.1093J',
+            '2016Natur.530..168A']
 
 
 @urlmatch(netloc=r'fakeapi\.query$')
@@ -34,6 +43,11 @@ def vault_500(url, request):
     }
 
 
+@urlmatch(netloc=r'fakeapi\.query$')
+def vault_timeout(url, request):
+    raise requests.exceptions.ReadTimeout('read timed out')
+
+
 class TestBumblebeeView(TestCase):
     """
     A basic base class for all of the tests here
@@ -55,7 +69,7 @@ class TestBumblebeeView(TestCase):
         a redirect status code
         """
         url = url_for('bumblebeeview')
-        bibcodes = ['bib1', 'bib2', 'bib3', 'bib4']
+        bibcodes = BIBCODES[:4]
 
         with HTTMock(store_200):
             r = self.client.post(url, data=json.dumps(bibcodes))
@@ -74,18 +88,451 @@ class TestBumblebeeView(TestCase):
         r = self.client.post(url, data={'fake': 'data'})
         self.assertStatus(r, 400)
 
+    def test_upload_limits(self):
+        """
+        Lists over the byte or bibcode limit are rejected before vault is contacted
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['UPLOAD_MAX_BYTES'] = 100
+        self.app.config['UPLOAD_MAX_BIBCODES'] = 3
+        calls = []
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            calls.append(request.body)
+            return {'status_code': 200, 'content': {'qid': 'qid1'}}
+
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:5]))
+            r2 = self.client.post(url, data=json.dumps(BIBCODES[:4]))
+            r3 = self.client.post(url, data=json.dumps([BIBCODES[0], BIBCODES[1], BIBCODES[0]]))
+
+        self.assertStatus(r, 413)
+        self.assertStatus(r2, 413)
+        self.assertStatus(r3, 200)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['bibcode\n' + '\n'.join(BIBCODES[:2])], urlparse.parse_qs(calls[0])['bigquery'])
+
+    def test_upload_formats(self):
+        """
+        Newline separated and compressed lists are stored like the json list
+        """
+        url = url_for('bumblebeeview')
+        calls = []
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            calls.append(request.body)
+            return {'status_code': 200, 'content': {'qid': 'qid{}'.format(len(calls))}}
+
+        with HTTMock(store):
+            r = self.client.post(url, data='bibcode\n{}\n{}\n'.format(*BIBCODES), content_type='text/plain')
+            r2 = self.client.post(url, data=zlib.compress(json.dumps([BIBCODES[1], BIBCODES[0]])),
+                                  headers={'Content-Encoding': 'deflate'})
+            r3 = self.client.post(url, data=zlib.compress('\r\n'.join(BIBCODES[2:4])),
+                                  content_type='text/plain; charset=utf-8', headers={'Content-Encoding': 'deflate'})
+            r4 = self.client.post(url, data=BIBCODES[0], content_type='text/plain', headers={'Content-Encoding': 'br'})
+            r5 = self.client.post(url, data=BIBCODES[0], content_type='text/plain', headers={'Content-Encoding': 'gzip'})
+
+        self.assertStatus(r, 200)
+        self.assertEqual(r.json, r2.json)
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qid2', r3.json['redirect'])
+        self.assertEqual(['bibcode\n' + '\n'.join(BIBCODES[:2])], urlparse.parse_qs(calls[0])['bigquery'])
+        self.assertEqual(['bibcode\n' + '\n'.join(BIBCODES[2:4])], urlparse.parse_qs(calls[1])['bigquery'])
+        self.assertStatus(r4, 415)
+        self.assertStatus(r5, 400)
+
+    def test_rejected_entries(self):
+        """
+        Entries that are not bibcodes are left out and listed in the response
+        """
+        url = url_for('bumblebeeview')
+        calls = []
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            calls.append(request.body)
+            return {'status_code': 200, 'content': {'qid': 'qid1'}}
+
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps([' ' + BIBCODES[0], 'bib1', BIBCODES[0], BIBCODES[1]]))
+            r2 = self.client.post(url, data=json.dumps(['bib1', 'bib2']))
+
+        self.assertStatus(r, 200)
+        self.assertEqual({'redirect': self.bumblebee_url + '/#search/q=*%3A*&__qid=qid1',
+                          'rejected': ['bib1'], 'rejected_count': 1}, r.json)
+        self.assertEqual(['bibcode\n' + '\n'.join(BIBCODES[:2])], urlparse.parse_qs(calls[0])['bigquery'])
+        self.assertStatus(r2, 400)
+        self.assertEqual(['bib1', 'bib2'], r2.json['rejected'])
+
     def test_when_vault_query_sends_non_200(self):
         """
         When vault/query returns a non-200 status code
         """
         url = url_for('bumblebeeview')
-        bibcodes = ['bib1', 'bib2', 'bib3', 'bib4']
+        bibcodes = BIBCODES[:4]
 
         with HTTMock(vault_500):
             r = self.client.post(url, data=json.dumps(bibcodes))
 
         self.assertStatus(r, 500)
 
+    def test_when_vault_query_times_out(self):
+        """
+        When vault/query does not respond within the read timeout
+        """
+        url = url_for('bumblebeeview')
+        bibcodes = BIBCODES[:4]
+
+        with HTTMock(vault_timeout):
+            r = self.client.post(url, data=json.dumps(bibcodes))
+
+        self.assertStatus(r, 504)
+
+    def test_vault_invalid_json(self):
+        """
+        When vault/query returns a body that is not json
+        """
+        url = url_for('bumblebeeview')
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            return {'status_code': 200, 'content': '<html>'}
+
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+
+        self.assertStatus(r, 502)
+
+    def test_qid_cache(self):
+        """
+        A list of bibcodes sent again is not stored in vault again
+        """
+        url = url_for('bumblebeeview')
+        calls = []
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            calls.append(request.body)
+            return {'status_code': 200, 'content': {'qid': 'qid{}'.format(len(calls))}}
+
+        with HTTMock(vault_500):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+        self.assertStatus(r, 500)
+
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+            r2 = self.client.post(url, data=json.dumps([BIBCODES[1], BIBCODES[0], BIBCODES[1]]))
+            r3 = self.client.post(url, data=json.dumps([BIBCODES[0], BIBCODES[2]]))
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qid1', r.json['redirect'])
+        self.assertEqual(r.json, r2.json)
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qid2', r3.json['redirect'])
+        metrics = self.client.get(url_for('metricsview')).json
+        self.assertEqual(1, metrics['qid_cache']['hits'])
+        self.assertEqual(2, metrics['qid_cache']['size'])
+        self.assertEqual({'calls': 3, 'collapsed': 0, 'timed_out': 0, 'in_flight': 0}, metrics['vault_single_flight'])
+
+    def test_direct_redirect(self):
+        """
+        Small lists of bibcodes are searched for directly without vault
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['DIRECT_REDIRECT_MAX_BIBCODES'] = 2
+
+        with HTTMock(vault_500):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+            r2 = self.client.post(url, data=json.dumps(BIBCODES[:3]))
+
+        self.assertStatus(r, 200)
+        self.assertEqual(
+            r.json['redirect'],
+            self.bumblebee_url + '/#search/q=bibcode%3A%28%222018ApJ...856..174K%22%20OR%20%221996AJ....111..794H%22%29'
+        )
+        self.assertStatus(r2, 500)
+
+    def test_breaker_open(self):
+        """
+        While vault is failing it is not called, short lists are searched for directly
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['BREAKER_FALLBACK_MAX_BIBCODES'] = 2
+        breaker = self.app.extensions['vault_breaker']
+        for i in range(breaker.min_calls):
+            breaker.record(False)
+
+        with HTTMock(store_200):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+            r2 = self.client.post(url, data=json.dumps(BIBCODES[:3]))
+
+        self.assertStatus(r, 200)
+        self.assertEqual(
+            r.json['redirect'],
+            self.bumblebee_url + '/#search/q=bibcode%3A%28%222018ApJ...856..174K%22%20OR%20%221996AJ....111..794H%22%29'
+        )
+        self.assertStatus(r2, 503)
+        self.assertEqual(str(breaker.open_seconds), r2.headers['Retry-After'])
+        stats = self.client.get(url_for('metricsview')).json['vault_breaker']
+        self.assertEqual({'state': 'open', 'rejected': 2}, {'state': stats['state'], 'rejected': stats['rejected']})
+
+    def test_shed(self):
+        """
+        Uploads and vault calls over the admission budgets get a 503, short lists are searched for directly
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['BREAKER_FALLBACK_MAX_BIBCODES'] = 2
+        admission = self.app.extensions['admission'] = AdmissionControl(
+            worker_max_bytes=100, worker_max_vault_calls=1, retry_after=2)
+        admission.acquire(VAULT_CALLS)
+
+        with HTTMock(store_200):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+            r2 = self.client.post(url, data=json.dumps(BIBCODES[:3]))
+            admission.acquire(BYTES, 50)
+            r3 = self.client.post(url, data=json.dumps(BIBCODES[:3]))
+            r4 = self.client.post(url_for('batchredirectview'), data=json.dumps([{'bibcodes': BIBCODES[:3]}]))
+
+        self.assertStatus(r, 200)
+        self.assertEqual(
+            r.json['redirect'],
+            self.bumblebee_url + '/#search/q=bibcode%3A%28%222018ApJ...856..174K%22%20OR%20%221996AJ....111..794H%22%29'
+        )
+        self.assertStatus(r2, 503)
+        self.assertEqual('2', r2.headers['Retry-After'])
+        self.assertStatus(r3, 503)
+        self.assertEqual({'error': 'overloaded'}, r3.json)
+        self.assertStatus(r4, 503)
+        # as the redirect pool reports them behind nginx
+        stats = self.client.get('/redirect/metrics').json['admission']
+        self.assertEqual({'bytes': 50, 'vault_calls': 1, 'admitted': 4, 'shed_bytes': 2, 'shed_vault_calls': 2},
+                         stats)
+
+    def test_deadline(self):
+        """
+        vault is not called once the request deadline passed
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['VAULT_DEADLINE'] = 0
+        with HTTMock(vault_500):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2]))
+        self.assertStatus(r, 504)
+
+    def test_deferred(self):
+        """
+        Clients that prefer it get a 202 and poll for the redirect while vault stores the list
+        """
+        url = url_for('bumblebeeview')
+        self.app.config['DEFERRED_MIN_BIBCODES'] = 2
+        calls = []
+        admission = self.app.extensions['admission']
+        held = []
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            calls.append(request.body)
+            held.append(admission.stats()['bytes'])
+            return {'status_code': 200 if len(calls) < 4 else 500, 'content': {'qid': 'qid{}'.format(len(calls))}}
+
+        def poll(status_url):
+            for i in range(100):
+                r = self.client.get(status_url)
+                if r.status_code != 202:
+                    return r
+                self.assertEqual('1', r.headers['Retry-After'])
+                time.sleep(0.01)
+
+        prefer = {'Prefer': 'respond-async'}
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps(BIBCODES[:2] + ['bib1']), headers=prefer)
+            self.assertStatus(r, 202)
+            self.assertEqual({'rejected': ['bib1'], 'rejected_count': 1}, {k: r.json[k] for k in r.json
+                                                                            if k.startswith('rejected')})
+            self.assertTrue(r.headers['Location'].endswith(r.json['status']))
+            r2 = poll(r.json['status'])
+            # too short, not asked for, stored already
+            r3 = self.client.post(url, data=json.dumps(BIBCODES[:1]), headers=prefer)
+            r4 = self.client.post(url, data=json.dumps(BIBCODES[2:4]))
+            r5 = self.client.post(url, data=json.dumps(BIBCODES[:2]), headers=prefer)
+            r6 = self.client.post(url, data=json.dumps(BIBCODES[1:4]), headers=prefer)
+            r7 = poll(r6.json['status'])
+
+        self.assertStatus(r2, 200)
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qid1', r2.json['redirect'])
+        self.assertEqual(['bibcode\n' + '\n'.join(BIBCODES[:2])], urlparse.parse_qs(calls[0])['bigquery'])
+        self.assertStatus(r3, 200)
+        self.assertStatus(r4, 200)
+        self.assertEqual(r2.json['redirect'], r5.json['redirect'])
+        self.assertStatus(r6, 202)
+        self.assertStatus(r7, 500)
+        self.assertEqual('failed', r7.json['state'])
+        self.assertEqual(4, len(calls))
+        self.assertStatus(self.client.get(url_for('redirectjobview', token='0-123')), 404)
+        stats = self.client.get(url_for('metricsview')).json['deferred_jobs']
+        self.assertEqual({'pending': 0, 'done': 1, 'failed': 1}, stats)
+        # the jobs held the bytes of their uploads after the 202, until they were done
+        self.assertTrue(held[0] > 0 and held[3] > 0)
+        for i in range(100):
+            if not admission.stats()['bytes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(0, admission.stats()['bytes'])
+
+    def test_batch(self):
+        """
+        Many lists are redirected in one call, their vault calls made concurrently and failing independently
+        """
+        url = url_for('batchredirectview')
+        self.app.config['DIRECT_REDIRECT_MAX_BIBCODES'] = 1
+        calls = []
+        in_flight = [0, 0]
+
+        @urlmatch(netloc=r'fakeapi\.query$')
+        def store(url, request):
+            bigquery = urlparse.parse_qs(request.body)['bigquery'][0]
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            time.sleep(0.1)
+            in_flight[0] -= 1
+            calls.append(bigquery)
+            if BIBCODES[4] in bigquery:
+                return {'status_code': 500, 'content': 'ERROR'}
+            return {'status_code': 200, 'content': {'qid': 'qid' + bigquery[-1]}}
+
+        batch = [
+            {'name': 'a', 'bibcodes': BIBCODES[:2]},
+            {'name': 'b', 'bibcodes': BIBCODES[2:4] + ['bib1']},
+            {'name': 'c', 'bibcodes': BIBCODES[3:]},
+            {'name': 'd', 'bibcodes': BIBCODES[:1]},
+            {'name': 'e', 'bibcodes': ['bib2']},
+            {'name': 'f', 'bibcodes': 'bib3'},
+            {'bibcodes': BIBCODES[:2]},
+        ]
+        with HTTMock(store):
+            r = self.client.post(url, data=json.dumps(batch))
+
+        self.assertStatus(r, 200)
+        results = r.json['results']
+        self.assertEqual(['a', 'b', 'c', 'd', 'e', 'f', 6], [result['name'] for result in results])
+        self.assertEqual([200, 200, 500, 200, 400, 400, 200], [result['status_code'] for result in results])
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qidH', results[0]['redirect'])
+        self.assertEqual(self.bumblebee_url + '/#search/q=*%3A*&__qid=qidJ', results[1]['redirect'])
+        self.assertEqual((['bib1'], 1), (results[1]['rejected'], results[1]['rejected_count']))
+        self.assertEqual('ERROR', results[2]['error'])
+        self.assertEqual(self.bumblebee_url + '/#search/q=bibcode%3A%28%222018ApJ...856..174K%22%29',
+                         results[3]['redirect'])
+        self.assertEqual('no bibcodes', results[4]['error'])
+        self.assertEqual(results[0]['redirect'], results[6]['redirect'])
+        # lists a and the unnamed one share a call
+        self.assertEqual(3, len(calls))
+        self.assertGreater(in_flight[1], 1)
+
+    def test_batch_limits(self):
+        """
+        Batches that are not a list, or have too many lists or bibcodes, are rejected
+        """
+        url = url_for('batchredirectview')
+        self.app.config['BATCH_MAX_LISTS'] = 2
+        self.app.config['UPLOAD_MAX_BIBCODES'] = 3
+        with HTTMock(vault_500):
+            r = self.client.post(url, data=json.dumps({'name': 'a', 'bibcodes': BIBCODES[:2]}))
+            r2 = self.client.post(url, data='[{"name": "a"')
+            r3 = self.client.post(url, data=json.dumps([{'bibcodes': BIBCODES[:1]}] * 3))
+            r4 = self.client.post(url, data=json.dumps([{'bibcodes': BIBCODES[:2]}] * 2))
+            r5 = self.client.post(url, data=zlib.compress(json.dumps([{'bibcodes': BIBCODES[:3]}])),
+                                  headers={'Content-Encoding': 'deflate'})
+        self.assertStatus(r, 400)
+        self.assertStatus(r2, 400)
+        self.assertStatus(r3, 413)
+        self.assertStatus(r4, 413)
+        self.assertStatus(r5, 200)
+        self.assertEqual(500, r5.json['results'][0]['status_code'])
+
+    def test_one_session_per_app(self):
+        """
+        Requests to vault share the application's pooled session
+        """
+        from tugboat.client import client
+        sessions = set()
+        for i in range(2):
+            with self.app.test_request_context():
+                sessions.add(id(client()))
+        self.assertEqual(1, len(sessions))
+        adapter = self.app.extensions['client'].adapter
+        self.assertEqual((self.app.config['CLIENT_CONNECT_TIMEOUT'], self.app.config['CLIENT_READ_TIMEOUT']),
+                         adapter.timeout)
+        stats = self.client.get(url_for('metricsview')).json['vault_client']
+        self.assertEqual(0, stats['reused'])
+
+    def test_metrics_of_redirect_pool(self):
+        """
+        The counters are also served under /redirect, which nginx sends to the redirect pool
+        """
+        r = self.client.get('/redirect/metrics')
+        self.assertStatus(r, 200)
+        self.assertEqual(sorted(self.client.get('/metrics').json), sorted(r.json))
+        self.assertIn('vault_breaker', r.json)
+
+
+class TestClassicSearchRedirectView(TestCase):
+    """
+    Test the classic search redirect end point
+    """
+
+    def create_app(self):
+        """
+        Create the wsgi application
+        """
+        app_ = create_app()
+        app_.config['BUMBLEBEE_URL'] = 'http://devui.adsabs.harvard.edu'
+        return app_
+
+    def test_translation_cache(self):
+        """
+        Equivalent classic queries are translated once
+        """
+        r = self.client.get('/classicSearchRedirect?db_key=AST&author=Huchra,+John&aut_logic=OR')
+        self.assertStatus(r, 302)
+        r2 = self.client.get('/classicSearchRedirect?aut_logic=OR&author=Huchra,+John&db_key=AST')
+        self.assertStatus(r2, 302)
+        self.assertEqual(r.headers['Location'], r2.headers['Location'])
+
+        stats = self.client.get(url_for('metricsview')).json['classic_translation_cache']
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['size'])
+
+    def test_form_not_cached(self):
+        """
+        Form values are translated too, so requests with a form body skip the cache
+        """
+        url = '/classicSearchRedirect?db_key=AST'
+        r = self.client.get(url, data={'author': 'Huchra, John'})
+        r2 = self.client.get(url, data={'author': 'Macri, Lucas'})
+        r3 = self.client.get(url)
+        for response in (r, r2, r3):
+            self.assertStatus(response, 302)
+        self.assertIn('Huchra', r.headers['Location'])
+        self.assertIn('Macri', r2.headers['Location'])
+        self.assertNotIn('author', r3.headers['Location'])
+        stats = self.client.get(url_for('metricsview')).json['classic_translation_cache']
+        self.assertEqual((0, 1, 1), (stats['hits'], stats['misses'], stats['size']))
+
+    def test_json_body(self):
+        """
+        Values of a json body are translated by both parsers, without the cache
+        """
+        url = '/classicSearchRedirect?db_key=AST'
+        for fast in (False, True):
+            self.app.config['CLASSIC_FAST_PARSER'] = fast
+            r = self.client.get(url, data=json.dumps({'author': 'Huchra, John'}), content_type='application/json')
+            r2 = self.client.get(url, data=json.dumps({'author': 'Macri, Lucas'}), content_type='application/json')
+            self.assertStatus(r, 302)
+            self.assertIn('Huchra', r.headers['Location'])
+            self.assertIn('Macri', r2.headers['Location'])
+        stats = self.client.get(url_for('metricsview')).json['classic_translation_cache']
+        self.assertEqual((0, 0), (stats['hits'], stats['misses']))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
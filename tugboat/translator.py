@@ -0,0 +1,1068 @@
+# encoding: utf-8
+"""
+Classic search to bumblebee translation engine
+
+Depends only on the standard library so it can be used outside the web
+application, for example to translate classic queries found in logs:
+
+    from tugboat.translator import translate
+    translate('author=Huchra,+John&db_key=AST')
+"""
+
+import re
+import urllib
+import urlparse
+import time
+from datetime import datetime, timedelta
+import calendar
+from collections import OrderedDict
+from itertools import imap
+
+
+class TranslationValue():
+    """simple container class to hold translation components while one query is translated
+
+    functions that translation specific parameters typically augment the TranslationValue
+    """
+
+    # consider adding field for sort order and other args
+    def __init__(self):
+        self.search = []
+        self.filter= []
+        self.error_message = []
+        self.warning_message = []
+        self.sort = ''
+
+
+class Translation(object):
+    """
+    immutable result of translating one classic query
+    """
+    __slots__ = ('search', 'filter', 'sort', 'error_message', 'warning_message', 'unprocessed')
+
+    def __init__(self, value, unprocessed):
+        """
+        :param value: TranslationValue holding the collected fragments
+        :param unprocessed: names of the classic parameters not translated
+        """
+        for name, fragments in (('search', value.search), ('filter', value.filter),
+                                ('error_message', value.error_message), ('warning_message', value.warning_message),
+                                ('unprocessed', unprocessed)):
+            object.__setattr__(self, name, tuple(fragments))
+        object.__setattr__(self, 'sort', value.sort)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Translation is immutable')
+
+    def query(self, compact=False):
+        """
+        combine translation fragments to ads/bumblebee parameter string
+        :param compact: shorter form, filters on the same facet are merged, the default sort is
+            dropped and characters bumblebee accepts in the url are not percent-encoded
+        """
+        search = self.search or ('*:*',)
+        filters = [encoded for name, clause, encoded in self.filter]
+        sort = self.sort
+        error_message = self.error_message
+        warning_message = self.warning_message
+        quote = urllib.quote
+        if compact:
+            search = map(compact_encoding, search)
+            filters = compact_filters(self.filter)
+            sort = compact_encoding(sort) if sort != SORT_DEFAULT else ''
+            error_message = map(compact_encoding, error_message)
+            warning_message = map(compact_encoding, warning_message)
+            quote = compact_quote
+        solr_query = 'q=' + ' '.join(search)
+        if len(filters) > 0:
+            solr_query += '&fq=' + '&fq='.join(filters)
+        if len(sort) > 0:
+            solr_query += '&sort=' + sort
+        if len(error_message) > 0:
+            solr_query += '&error_message=' + '&error_message='.join(error_message)
+        if len(warning_message):
+            solr_query += '&warning_message=' + '&warning_message='.join(warning_message)
+        if len(self.unprocessed):
+            # pass the names of unprocessed parameters out ads/bumblebee
+            solr_query += '&unprocessed_parameter=' + quote('Parameters not processed: ' + ' '.join(self.unprocessed))
+        return solr_query
+
+
+# all the parameters from classic, name => type of value
+# string parameters are unicode, others (typically integer fields) are left as given to allow None values
+# kept in the order they were declared in, webargs lists leftover parameters in the order of its schema
+CLASSIC_PARAMETERS = OrderedDict([
+    # the following we currently translate
+    ('article_sel', unicode),
+    ('aut_logic', unicode),
+    ('aut_xct', unicode),
+    ('author', unicode),
+    ('data_link', unicode),
+    ('db_key', unicode),
+    ('end_entry_day', object),
+    ('end_entry_mon', object),
+    ('end_entry_year', object),
+    ('end_mon', object),
+    ('end_year', object),
+    ('jou_pick', unicode),
+    ('obj_logic', unicode),
+    ('object', unicode),
+    ('open_link', unicode),
+    ('preprint_link', unicode),
+    ('qsearch', unicode),
+    ('return_req', unicode),
+    ('start_entry_day', object),
+    ('start_entry_mon', object),
+    ('start_entry_year', object),
+    ('start_mon', object),
+    ('start_year', object),
+    ('text', unicode),
+    ('txt_logic', unicode),
+    ('title', unicode),
+    ('ttl_logic', unicode),
+
+    # implementations for the following just create errors
+    # perhaps because there is no ads/bumbleebee support yet
+    ('nr_to_return', object),
+    ('start_nr', object),
+
+    # golnaz - 3/5/2018
+    ('article_link', unicode),
+    ('gif_link', unicode),
+    ('article', unicode),
+    ('simb_obj', unicode),
+    ('ned_obj', unicode),
+    ('data_and', unicode),
+    ('toc_link', unicode),
+    ('pds_link', unicode),
+    ('multimedia_link', unicode),
+    ('ref_link', unicode),
+    ('citation_link', unicode),
+    ('associated_link', unicode),
+    ('lib_link', unicode),
+    ('ar_link', unicode),
+    ('aut_note', unicode),
+    ('spires_link', unicode),
+    ('group_and', unicode),
+    ('group_sel', unicode),
+    ('abstract', unicode),
+    ('sort', unicode),
+    ('aut_wt', object),
+    ('obj_wt', object),
+    ('ttl_wt', object),
+    ('txt_wt', object),
+    ('aut_wgt', unicode),
+    ('obj_wgt', unicode),
+    ('ttl_wgt', unicode),
+    ('txt_wgt', unicode),
+    ('aut_syn', unicode),
+    ('ttl_syn', unicode),
+    ('txt_syn', unicode),
+    ('aut_sco', unicode),
+    ('ttl_sco', unicode),
+    ('txt_sco', unicode),
+    ('aut_req', unicode),
+    ('obj_req', unicode),
+    ('ttl_req', unicode),
+    ('txt_req', unicode),
+    ('ref_stems', unicode),
+    ('arxiv_sel', unicode),
+
+    # these can be ignored, at least for now
+    ('sim_query', unicode),
+    ('ned_query', unicode),
+    ('mail_link', unicode),
+    ('gpndb_obj', unicode),
+    ('min_score', unicode),
+    ('lpi_query', unicode),
+    ('iau_query', unicode),
+    ('data_type', unicode),
+    ('adsobj_query', unicode),
+
+    # and the following are not yet translated
+    ('kwd_wt', object),
+    ('full_wt', object),
+    ('aff_wt', object),
+    ('full_syn', unicode),
+    ('aff_syn', unicode),
+    ('kwd_wgt', unicode),
+    ('full_wgt', unicode),
+    ('aff_wgt', unicode),
+    ('kwd_sco', unicode),
+    ('full_sco', unicode),
+    ('aff_sco', unicode),
+    ('kwd_req', unicode),
+    ('full_req', unicode),
+    ('aff_req', unicode),
+    ('aut_logic', unicode),
+    ('obj_logic', unicode),
+    ('kwd_logic', unicode),
+    ('ttl_logic', unicode),
+    ('txt_logic', unicode),
+    ('full_logic', unicode),
+    ('aff_logic', unicode),
+])
+
+CLASSIC_NAMES = frozenset(CLASSIC_PARAMETERS)
+
+# position of each classic parameter in CLASSIC_PARAMETERS
+CLASSIC_RANKS = dict((name, rank) for rank, name in enumerate(CLASSIC_PARAMETERS))
+
+# classic parameters that can be repeated, their values are joined with commas
+MULTI_VALUED_PARAMETERS = frozenset(['group_sel', 'arxiv_sel'])
+
+# parameters whose values are unicode
+STRING_PARAMETERS = frozenset(name for name, kind in CLASSIC_PARAMETERS.iteritems() if kind is unicode)
+
+
+def iter_lists(location):
+    """
+    (name, list of values) pairs of a set of parameters, each name once
+    :param location: MultiDict, dict of values or lists of values, or url query string
+    """
+    if hasattr(location, 'iterlists'):
+        return location.iterlists()
+    if isinstance(location, basestring):
+        location = urlparse.parse_qsl(location.lstrip('?'), keep_blank_values=True)
+    if isinstance(location, dict):
+        return ((name, values if isinstance(values, (list, tuple)) else [values])
+                for name, values in location.iteritems())
+    grouped = {}
+    names = []
+    for name, value in location:
+        if name not in grouped:
+            names.append(name)
+        grouped.setdefault(name, []).append(value)
+    return ((name, grouped[name]) for name in names)
+
+
+class ClassicArgs(object):
+    """
+    classic parameters of one request, read without webargs in one pass
+
+    there is a slot per classic parameter, absent parameters are unset slots;
+    the dict methods used by the translate_* functions are supported so that
+    parameters are consumed with pop and the leftovers reported as unprocessed.
+    The leftovers are listed in the order a dict would list them after the same
+    insertions and pops, since that order depends on the history of the dict
+    and not only on the keys it holds
+    """
+    __slots__ = tuple(sorted(CLASSIC_PARAMETERS)) + ('_keys',)
+
+    def __init__(self):
+        self._keys = {}
+
+    @classmethod
+    def parse(cls, args, form=None, ranks=None, json=None):
+        """
+        read classic parameters from the query string, then the form, then the json body
+        :param args: query parameters, see iter_lists for the accepted types
+        :param form: optional form parameters, repeated values are not joined
+        :param ranks: optional dict of the position of each classic parameter, the
+                      parameters present are added in this order, by default the
+                      order of CLASSIC_PARAMETERS
+        :param json: optional dict decoded from a json body, repeated values are not joined
+        """
+        parsed = cls()
+        present = []
+        for location in (args, form, json):
+            if not location:
+                continue
+            for name, values in iter_lists(location):
+                if name not in CLASSIC_NAMES or name in parsed:
+                    continue
+                value = values[0]
+                if name in STRING_PARAMETERS and not isinstance(value, unicode):
+                    value = value.decode('utf-8') if isinstance(value, str) else unicode(value)
+                if name in MULTI_VALUED_PARAMETERS and location is args:
+                    joined = _str_values(values)
+                    if joined:
+                        value = ','.join(joined)
+                setattr(parsed, name, value)
+                present.append(name)
+        for name in sorted(present, key=(ranks or CLASSIC_RANKS).__getitem__):
+            parsed._keys[name] = None
+        return parsed
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+        self._keys[name] = None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def pop(self, name, default=None):
+        value = getattr(self, name, default)
+        if name in self._keys:
+            delattr(self, name)
+            del self._keys[name]
+        return value
+
+    def keys(self):
+        return self._keys.keys()
+
+
+def _str_values(values):
+    """values converted like MultiDict.getlist(name, type=str), failed conversions are skipped"""
+    converted = []
+    for value in values:
+        try:
+            converted.append(str(value))
+        except ValueError:
+            pass
+    return converted
+
+# weights classic sends by default, unchanged ones are dropped by translate_weights
+WEIGHT_DEFAULTS = {'aut_syn'  :  'YES',
+                   'ttl_syn'  :  'YES',
+                   'txt_syn'  :  'YES',
+                   'aut_wt'   :  '1.0',
+                   'obj_wt'   :  '1.0',
+                   'ttl_wt'   :  '0.3',
+                   'txt_wt'   :  '3.0',
+                   'aut_wgt'  :  'YES',
+                   'obj_wgt'  :  'YES',
+                   'ttl_wgt'  :  'YES',
+                   'txt_wgt'  :  'YES',
+                   'ttl_sco'  :  'YES',
+                   'txt_sco'  :  'YES',
+}
+# weights classic omits by default
+WEIGHT_DEFAULTS_ABSENT = {'aut_sco'  :  'YES',
+                          'aut_req'  :  'YES',
+                          'obj_req'  :  'YES',
+                          'ttl_req'  :  'YES',
+                          'txt_req'  :  'YES',
+}
+
+
+def canonical_query(args):
+    """
+    hashable canonical form of classic query parameters, see iter_lists for the accepted types
+
+    queries that translate identically share a key: parameters are sorted,
+    repeated group_sel/arxiv_sel are merged and default weights are dropped,
+    absent default weights are kept as None since they are reported as unprocessed
+    """
+    items = []
+    present = set()
+    for name, values in iter_lists(args):
+        if name not in CLASSIC_NAMES or name in present:
+            continue
+        present.add(name)
+        if name in MULTI_VALUED_PARAMETERS:
+            value = ','.join(_str_values(values))
+        else:
+            value = values[0]
+        if WEIGHT_DEFAULTS.get(name) != value:
+            items.append((name, value))
+    for name in WEIGHT_DEFAULTS:
+        if name not in present:
+            items.append((name, None))
+    return tuple(sorted(items))
+
+
+def date_dependency_expiry(query, now=None):
+    """
+    timestamp when the translation of a canonical query becomes stale, None if never
+
+    pubdate and entry date searches without an end year are closed with the
+    current month or day, so they are only valid until the month or day ends
+    """
+    params = dict(query)
+    supplied = lambda name: ClassicTranslator.supplied(params.get(name))
+    now = now or datetime.now()
+    expiry = []
+    if supplied('start_year') and not supplied('end_year'):
+        expiry.append(datetime(now.year + now.month // 12, now.month % 12 + 1, 1))
+    if supplied('start_entry_year') and not supplied('end_entry_year'):
+        tomorrow = now + timedelta(days=1)
+        expiry.append(datetime(tomorrow.year, tomorrow.month, tomorrow.day))
+    if expiry:
+        return time.mktime(min(expiry).timetuple())
+    return None
+
+
+# connector => percent-encoded connector, per quoting function
+_encoded_connectors = {}
+
+
+def classic_term(term):
+    """term of a classic field, quoted when it has spaces"""
+    if ' ' in term and not (term.startswith('"') and term.endswith('"')):
+        # value has space and is not already surrounded by double quotes so we add quotes
+        term = '"' + term + '"'
+    return term
+
+
+def classic_terms(value):
+    """
+    list of the normalized terms of a classic author, object, title or text field
+
+    the value is unquoted once, + becomes a space and it is split on the ; and
+    line break separators; str.split beats a regex driven generator here
+    """
+    value = urllib.unquote(value).replace('+', ' ')
+    return [classic_term(term) for term in value.replace('\r\n', ';').split(';')]
+
+
+def quote_join(terms, connector, quote=urllib.quote):
+    """
+    return quote(connector.join(terms)) built in a single pass
+
+    quoting works character by character, so each term is encoded once and
+    joined with the connector, which is encoded only the first time it is seen
+    """
+    key = (connector, quote)
+    encoded_connector = _encoded_connectors.get(key)
+    if encoded_connector is None:
+        encoded_connector = _encoded_connectors.setdefault(key, quote(connector))
+    return encoded_connector.join(imap(quote, terms))
+
+
+def aqp_filter_prefix(name):
+    """encoded start of a bumblebee filter, the filter clause and ')' follow"""
+    return urllib.quote('{') + '!' + urllib.quote('type=aqp v=$fq_{}}}'.format(name)) + '&fq_{}=('.format(name)
+
+
+def facet_filter(name, clause, encoded=None):
+    """
+    bumblebee filter as (facet name, solr clause, encoded fq value)
+    :param encoded: fq value of the verbose output, by default the aqp filter of the clause
+    """
+    if encoded is None:
+        encoded = aqp_filter_prefix(name) + urllib.quote(clause) + ')'
+    return name, clause, encoded
+
+
+# characters left as they are in compact output, they are allowed in the url fragment and have no
+# special meaning in the bumblebee query string, unlike & = + # ; and ?
+COMPACT_SAFE = "/:@!$'()*,~"
+_compact_escapes = re.compile('%(' + '|'.join('{:02X}'.format(ord(c)) for c in COMPACT_SAFE) + ')', re.IGNORECASE)
+
+
+def compact_quote(value):
+    """percent-encode for compact output"""
+    return urllib.quote(value, safe=COMPACT_SAFE)
+
+
+def compact_encoding(fragment):
+    """encoded fragment with the escapes of COMPACT_SAFE characters decoded, it still decodes to the same value"""
+    return _compact_escapes.sub(lambda match: chr(int(match.group(1), 16)), fragment)
+
+
+def compact_filters(filters):
+    """
+    compact fq values of facet_filter tuples
+
+    filters on the same facet are combined with AND into one aqp filter, in the order facets first appear
+    """
+    clauses = OrderedDict()
+    for name, clause, encoded in filters:
+        clauses.setdefault(name, []).append(clause)
+    merged = []
+    for name, facet_clauses in clauses.iteritems():
+        if len(facet_clauses) == 1:
+            clause = facet_clauses[0]
+        else:
+            clause = ' AND '.join('(' + c + ')' for c in facet_clauses)
+        merged.append(compact_quote('{!type=aqp v=$fq_' + name + '}') + '&fq_' + name + '=(' + compact_quote(clause) + ')')
+    return merged
+
+
+# static translation tables, built once at import with constant fragments already encoded
+
+# classic search parameter => its logic parameter
+LOGIC_PARAMETERS = {'author': 'aut_logic', 'title': 'ttl_logic',
+                    'text': 'txt_logic', 'object': 'obj_logic'}
+
+# classic db_key => database facet_filter
+DATABASE_FILTERS = dict((db, facet_filter('database', 'database:"{}"'.format(bbb_db)))
+                        for db, bbb_db in {'AST': 'astronomy', 'GEN': 'general', 'PHY': 'physics'}.iteritems())
+
+# classic jou_pick => property facet_filter, ALL is the default and adds no filter
+JOU_PICK_FILTERS = {
+    'ALL': None,
+    # only include refereed journals
+    'NO': facet_filter('property', 'property:"refereed"',
+                       urllib.quote('{!type=aqp v=$fq_property}&fq_property=(property:"refereed")')),
+    # only include non-refereed
+    'EXCL': facet_filter('property', 'property:"notrefereed"',
+                         urllib.quote('{!type=aqp v=$fq_property}&fq_property=(property:"notrefereed")')),
+}
+
+# (classic parameter, doctype facet_filter) in the order they are applied
+PROPERTY_FILTERS = tuple((key, facet_filter('doctype', 'doctype:"{}"'.format(value),
+                                            urllib.quote('{{!type=aqp v=$fq_doctype}}&fq_doctype=(doctype:"{}")'.format(value))))
+                         for key, value in {'article_sel': 'article', 'data_link': 'data',
+                                            'open_link': 'OPENACCESS', 'preprint_link': 'eprint'}.iteritems())
+
+# (classic data entry parameter, encoded search clause) in the order they are applied
+DATA_ENTRIES = tuple((classic, urllib.quote(bbb)) for classic, bbb in {
+    'article_link'    : 'esources:("PUB_PDF" OR "PUB_HTML" OR "AUTHOR_PDF" OR "AUTHOR_HTML" OR "ADS_PDF" OR "ADS_SCAN")',
+    'gif_link'        : 'esources:("ADS_SCAN")',
+    'article'         : 'esources:("PUB_PDF" OR "PUB_HTML")',
+    'preprint_link'   : 'esources:("EPRINT_HTML")',
+    'toc_link'        : 'property:("TOC")',
+    'ref_link'        : 'reference:(*)',
+    'citation_link'   : 'citation_count:[1 TO *]',
+    'associated_link' : 'property:("ASSOCIATED")',
+    'simb_obj'        : 'data:("simbad")',
+    'ned_obj'         : 'data:("ned")',
+    'pds_link'        : 'property:("PDS")',
+    'aut_note'        : 'property:("NOTE")',   # need to verify this later, it is being implemented 3/12
+    'lib_link'        : 'property:("LIBRARYCATALOG")',
+    'ar_link'         : 'read_count:[1 TO *]',
+    'multimedia_link' : 'property:("PRESENTATION")',
+    'spires_link'     : 'property:("INSPIRE")',
+    'abstract'        : 'abstract:(*)',
+}.iteritems())
+
+# classic data_and => operator between data entries
+DATA_AND_OPERATORS = {
+    'ALL': '',      # when 'A bibliographic entry' radio button is selected
+    'NO': 'OR',     # when 'At least one of the following (OR)' radio button is selected
+    'YES': 'AND',   # when 'All of the following (AND)' radio button is selected
+    'NOT': 'NOT',   # when 'None of the following (NOT)' radio button is selected
+}
+
+VALID_GROUP_SEL = frozenset(['ARI', 'CfA', 'CFHT', 'Chandra', 'ESO/Lib', 'ESO/Telescopes', 'Gemini', 'Herschel', 'HST',
+                             'ISO', 'IUE', 'JCMT', 'Keck', 'Leiden', 'LPI', 'Magellan', 'NOAO', 'NRAO', 'NRAO/Telescopes',
+                             'ROSAT', 'SDO', 'SMA', 'Spitzer', 'Subaru', 'Swift', 'UKIRT', 'USNO', 'VSGC', 'XMM'])
+
+# classic group_and => operator between groups, * includes every group
+GROUP_AND_OPERATORS = {
+    'ALL': '*',     # when 'All Groups' radio button is selected
+    'NO': 'OR',     # when 'At least one of the following groups (OR)' radio button is selected
+    'YES': 'AND',   # when 'All of the following groups (AND)' radio button is selected
+}
+
+ALL_GROUPS_SEARCH = urllib.quote('bibgroup:(*)')
+BIBGROUP_FILTER_PREFIX = aqp_filter_prefix('bibgroup_facet') + urllib.quote_plus('bibgroup_facet:(')
+BIBGROUP_FILTER_SUFFIX = urllib.quote_plus(')') + ')'
+
+# classic sort => encoded bumblebee sort
+SORT_DEFAULT = urllib.quote('date desc, bibcode desc')
+SORTS = dict((classic, urllib.quote(bbb)) for classic, bbb in {
+    'SCORE'      : 'date desc, bibcode desc',
+    'AUTHOR'     : 'first_author desc',
+    'NDATE'      : 'date desc',
+    'ODATE'      : 'date asc',
+    'BIBCODE'    : 'bibcode desc',
+    'RBIBCODE'   : 'bibcode asc',
+    'ENTRY'      : 'entry_date desc',
+    'CITATIONS'  : 'citation_count desc',
+    'AUTHOR_CNT' : 'author_count desc',
+    'SBIBCODE'   : 'bibcode desc',
+    'READS'      : 'read_count desc',
+    'AR_SCORE'   : 'read_count desc',
+    'NONE'       : '',
+}.iteritems())
+
+IGNORED_PARAMETERS = ('sim_query', 'ned_query', 'lpi_query', 'iau_query', 'min_score', 'mail_link', 'gpndb_obj',
+                      'data_type', # From Alberto 3/12 regarding data_type: we'll want it available for API queries, so it's for later
+                      'adsobj_query',
+                      )
+
+# arXiv class => (keyword facet clause, encoded clause)
+ARXIV_KEYWORDS = dict((classic, (clause, urllib.quote(clause))) for classic, clause in (
+    (classic, 'keyword_facet:"' + name.lower() + '"') for classic, name in {
+    'astro-ph'  :  'Astrophysics',
+    'cond-mat'  :  'Condensed Matter',
+    'cs'        :  'Computer Science',
+    'gr-qc'     :  'General Relativity and Quantum Cosmology',
+    'hep-ex'    :  'High Energy Physics - Experiment',
+    'hep-lat'   :  'High Energy Physics - Lattice',
+    'hep-ph'    :  'High Energy Physics - Phenomenology',
+    'hep-th'    :  'High Energy Physics - Theory',
+    'math'      :  'Mathematics',
+    'math-ph'   :  'Mathematical Physics',
+    'nlin'      :  'Nonlinear Sciences',
+    'nucl-ex'   :  'Nuclear Experiment',
+    'nucl-th'   :  'Nuclear Theory',
+    'physics'   :  'Physics',
+    'quant-ph'  :  'Quantum Physics',
+    'q-bio'     :  'Quantitative Biology',
+}.iteritems()))
+VALID_ARXIV_SEL = frozenset(ARXIV_KEYWORDS)
+ARXIV_FILTER_PREFIX = aqp_filter_prefix('keyword_facet')
+
+BIBSTEM_FILTER_PREFIX = aqp_filter_prefix('bibstem_facet') + urllib.quote('bibstem_facet:(')
+BIBSTEM_FILTER_SUFFIX = urllib.quote(')') + ')'
+
+ENCODED_OR = urllib.quote(' OR ')
+
+
+def rule(handler, params, always=False, **options):
+    """
+    entry of TRANSLATION_RULES
+    :param handler: name of the ClassicTranslator method applying the rule
+    :param params: classic parameters the rule consumes, any of them triggers it
+    :param always: run the rule even when none of its parameters are present
+    :param options: keyword arguments for the handler, such as its mapping table
+    """
+    return handler, tuple(params), always, options
+
+
+# how classic parameters translate, in the order the rules contribute to the bumblebee query
+TRANSLATION_RULES = (
+    rule('translate_authors', ('author', 'aut_logic', 'aut_xct')),
+    rule('translate_pubdate', ('start_year', 'end_year', 'start_mon', 'end_mon')),
+    rule('translate_entry_date', ('start_entry_year', 'end_entry_year', 'start_entry_mon', 'start_entry_day',
+                                  'end_entry_mon', 'end_entry_day')),
+    rule('translate_results_subset', ('nr_to_return', 'start_nr')),
+    rule('translate_return_req', ('return_req',)),
+    rule('translate_qsearch', ('qsearch',)),
+    rule('translate_enum', ('db_key',), param='db_key', values=DATABASE_FILTERS, target='filter', skip_empty=True,
+         invalid=('warning_message', 'invalid database from classic {}', False)),
+    rule('translate_property_filters', [key for key, f in PROPERTY_FILTERS]),
+    rule('translate_enum', ('jou_pick',), param='jou_pick', values=JOU_PICK_FILTERS, target='filter',
+         invalid=('error_message', 'Invalid value for jou_pick: {}', True)),
+    rule('translate_data_entries', ['data_and'] + [classic for classic, bbb in DATA_ENTRIES],
+         operators=DATA_AND_OPERATORS, entries=DATA_ENTRIES),
+    rule('translate_group_sel', ('group_and', 'group_sel'), operators=GROUP_AND_OPERATORS, valid=VALID_GROUP_SEL),
+    # without a sort parameter the default sort is used
+    rule('translate_enum', ('sort',), always=True, param='sort', values=SORTS, target='sort', default=SORT_DEFAULT,
+         invalid=('error_message', 'Invalid value for sort: {}', True)),
+    rule('translate_to_ignore', IGNORED_PARAMETERS, ignored=IGNORED_PARAMETERS),
+    # absent default weights are reported as unprocessed
+    rule('translate_weights', WEIGHT_DEFAULTS, always=True, defaults=WEIGHT_DEFAULTS),
+    rule('translate_arxiv_sel', ('arxiv_sel',), values=ARXIV_KEYWORDS, valid=VALID_ARXIV_SEL),
+    rule('translate_ref_stems', ('ref_stems',)),
+    # the simple cases where only parameter name changes
+    rule('translate_simple', ('object', 'obj_logic'), classic_param='object', bbb_param='object'),
+    rule('translate_simple', ('title', 'ttl_logic'), classic_param='title', bbb_param='title'),
+    rule('translate_simple', ('text', 'txt_logic'), classic_param='text', bbb_param='abs'),
+)
+
+
+def compile_rules(rules):
+    """
+    index rules by the parameters that trigger them
+    :return: dict of parameter => rule positions, and positions of the rules that always run
+    """
+    index = {}
+    always = []
+    for position, (handler, params, run_always, options) in enumerate(rules):
+        for name in params:
+            index.setdefault(name, []).append(position)
+        if run_always:
+            always.append(position)
+    return dict((name, tuple(positions)) for name, positions in index.iteritems()), frozenset(always)
+
+
+RULE_INDEX, ALWAYS_RULES = compile_rules(TRANSLATION_RULES)
+
+
+class ClassicTranslator(object):
+    """
+    Converts classic search parameters to a bumblebee query fragment
+
+    the translator holds no state, fragments are collected in a TranslationValue
+    created for each call, so one instance can be shared between threads
+    """
+    __slots__ = ()
+
+    def translate(self, args, compact=False):
+        """
+        Convert all classic search related parameters to ads/bumblebee
+        :param args: parsed classic parameters, a dict or ClassicArgs, consumed by the translation
+        :param compact: use the shorter output form, see Translation.query
+        :return: bumblebee query string
+        """
+        return self.build(args).query(compact)
+
+    def build(self, args):
+        """
+        run the rules triggered by the parameters present, in table order
+        :param args: parsed classic parameters of this call only, consumed by the translation
+        :return: Translation
+        """
+        translation = TranslationValue()
+        positions = ALWAYS_RULES.union(*[RULE_INDEX[name] for name in args.keys() if name in RULE_INDEX])
+        for position in sorted(positions):
+            handler, params, always, options = TRANSLATION_RULES[position]
+            getattr(self, handler)(args, translation, **options)
+        # the functions that translate individual parameters use pop to remove parameters from arg list,
+        # the remaining ones are unprocessed
+        return Translation(translation, args.keys())
+
+    @staticmethod
+    def author_exact(args):
+        """given an aut_xct value, is it true"""
+        value = args.pop('aut_xct', None)
+        if value:
+            if 'YES' == str(value).upper():
+                return True
+        return False
+
+    @staticmethod
+    def get_logic(classic_param, args):
+        """given a logic parameter, return its value canonical form"""
+        if classic_param in args:
+            logic_param = LOGIC_PARAMETERS[classic_param]
+            value = args.pop(logic_param, None)
+            if value:
+                value = value.upper()
+            return value
+        return ''
+
+    @staticmethod
+    def supplied(value):
+        """check html parameter to see if it is valid"""
+        if value is None or (isinstance(value, basestring) and len(value) == 0):
+            return False
+        return True
+
+    def translate_authors(self, args, translation):
+        """return string with all author search elements
+
+        classic ui allows different and/or between authors and objects so we handle 
+        just the author affecting elements here
+        """
+        connector = ' AND '
+        logic = self.get_logic('author', args)
+        exact = self.author_exact(args)
+        if logic == 'OR':
+            connector = ' OR '
+        author_field = 'author:'
+        if exact:
+            author_field = '=author:'
+        # one lone parameter should hold all authors from classic
+        authors_str = args.pop('author', None)
+        if authors_str:
+            search = urllib.quote(author_field) + '(' + quote_join(classic_terms(authors_str), connector) + ')'
+            translation.search.append(search)
+
+    def translate_simple(self, args, translation, classic_param, bbb_param):
+        """process easy to translate fields like title
+
+        simply change name of parameter and use boolean connector
+        """
+        connector = ' AND '
+        logic = self.get_logic(classic_param, args)
+        if logic == 'OR':
+            connector = ' OR '
+        # one lone parameter should hold all authors from classic
+        classic_str = args.pop(classic_param, None)
+        if classic_str:
+            search = urllib.quote(bbb_param + ':') + '(' + quote_join(classic_terms(classic_str), connector) + ')'
+            translation.search.append(search)
+
+    def translate_pubdate(self, args, translation):
+        """translate string with pubdate element
+
+        for pubdate date search, only start or end need be specified
+        at least one start year or end year must be provided
+        unlike entry date search, negative offsets are not supported
+        in classic, 2 digit years were permitted
+        bumblebee example: pubdate:[1990-01 TO 1990-02]
+        """
+
+        start_year = args.pop('start_year', None)
+        end_year = args.pop('end_year', None)
+        start_month = args.pop('start_mon', None)
+        end_month = args.pop('end_mon', None)
+
+        if self.supplied(start_year) is False and self.supplied(end_year) is False:
+            return
+
+        # if start is not provided, use beginning of time
+        if not self.supplied(start_year):
+            start_year = 0
+        if not self.supplied(start_month):
+            start_month = 1
+
+        # if end is not provided, use now
+        if not self.supplied(end_year):
+            tmp = datetime.now()
+            end_year = tmp.year
+            if not self.supplied(end_month):
+                end_month = tmp.month
+        else:
+            if not self.supplied(end_month):
+                end_month = 12
+
+        start_year = int(start_year)
+        start_month = int(start_month)
+        end_year = int(end_year)
+        end_month = int(end_month)
+        # Y10k problem, but for 2 digit years we want to be clear what years we are searching
+        search = 'pubdate' + urllib.quote(':[{:04d}-{:02d} TO {:04d}-{:02}]'.format(start_year, start_month,
+                                                                                    end_year, end_month))
+        translation.search.append(search)
+
+    def translate_entry_date(self, args, translation):
+        """ return string for pubdate element
+
+        like pubdate search, only start on end need be specified
+        bumblebee does not yet implement, assume to follow pubdate 
+        """
+        start_year = args.pop('start_entry_year', None)
+        end_year = args.pop('end_entry_year', None)
+        start_month = args.pop('start_entry_mon', None)
+        start_day = args.pop('start_entry_day', None)
+        end_month = args.pop('end_entry_mon', None)
+        end_day = args.pop('end_entry_day', None)
+
+        if self.supplied(start_year) is False and self.supplied(end_year) is False:
+            return  # nothing to do
+
+        # if start is not provided, use beginning of time
+        if not self.supplied(start_year):
+            start_year = 0
+        if not self.supplied(start_month):
+            start_month = 1
+        if not self.supplied(start_day):
+            start_day = 1
+
+        # if end is not provided, use now
+        if not self.supplied(end_year):
+            tmp = datetime.now()
+            end_year = tmp.year
+            if not self.supplied(end_month):
+                end_month = tmp.month
+            if not self.supplied(end_day):
+                end_day = tmp.day
+        else:
+            if not self.supplied(end_month):
+                end_month = 12
+            if not self.supplied(end_day):
+                # get last day of end month/year
+                end_day = calendar.monthrange(end_year, end_month)[1]
+
+        start_year = int(start_year)
+        start_month = int(start_month)
+        start_day = int(start_day)
+        end_year = int(end_year)
+        end_month = int(end_month)
+        end_day = int(end_day)
+        search = 'entry_date' + \
+            urllib.quote(':[{:04d}-{:02d}-{:02d} TO {:04d}-{:02}-{:02d}]'.format(start_year, start_month, start_day,
+                                                                                 end_year, end_month, end_day))
+        translation.search.append(search)
+            
+    def translate_results_subset(self, args, translation):
+        """subset/pagination currently not supported by bumblebee
+
+        provide error message if pagination request is present"""
+        number_to_return = args.pop('nr_to_return', None)
+        start_nr = args.pop('start_nr', None)
+        # golnaz: hold off for now
+        # if number_to_return or start_nr:
+        #     translation.error_message.append(urllib.quote('Result subset/pagination is not supported'))
+
+    def translate_enum(self, args, translation, param, values, target, invalid, default=None, skip_empty=False):
+        """translate a parameter with an enumerated set of values
+
+        values maps each classic value to its contribution, an encoded sort or a facet_filter,
+        None contributes nothing;
+        target is the TranslationValue list appended to, or sort;
+        invalid is (message list, message format, whether to quote it) for unrecognizable values
+        """
+        value = args.pop(param, None)
+        if value is None or (skip_empty and not value):
+            contribution = default
+        elif value in values:
+            contribution = values[value]
+        else:
+            # unrecognizable value
+            messages, message, quote = invalid
+            message = message.format(value)
+            getattr(translation, messages).append(urllib.quote(message) if quote else message)
+            return
+        if contribution is None:
+            return
+        if target == 'sort':
+            translation.sort = contribution
+        else:
+            getattr(translation, target).append(contribution)
+
+    def translate_data_entries(self, args, translation, operators, entries):
+        """ Convert all classic data entries search related parameters to ads/bumblebee """
+        operator = self.translate_data_and(args, translation, operators)
+        if operator is not None:
+            # each may contribute to translation
+            for classic,BBB in entries:
+                value = args.pop(classic, None)
+                if value is None:
+                    # if not provided, we do not need to include it in the result
+                    pass
+                elif value == 'YES':
+                    # include entry, first add the operator
+                    if (operator == 'NOT') or len(translation.search) > 0:
+                        translation.search.append(operator)
+                    translation.search.append(BBB)
+                else:
+                    # unrecognizable value
+                    translation.error_message.append(urllib.quote('Invalid value for {}: {}'.format(classic, value)))
+
+    def translate_data_and(self, args, translation, operators=DATA_AND_OPERATORS):
+        """ get bibliographic entries operator """
+        data_and = args.pop('data_and', None)
+        if data_and is None:
+            operator = None
+        elif data_and in operators:
+            operator = operators[data_and]
+        else:
+            operator = None
+            translation.error_message.append(urllib.quote('Invalid value for data_and: {}'.format(data_and)))
+        return operator
+
+    def validate_group_sel(self, group_sel, valid=VALID_GROUP_SEL):
+        if len(group_sel) == 0:
+            return False
+        return valid.issuperset(group_sel.split(','))
+
+    def translate_group_sel(self, args, translation, operators, valid):
+        """ Convert all classic group entries search related parameters to ads/bumblebee """
+        operator = self.translate_group_and(args, translation, operators)
+        if operator is not None:
+            value = args.pop('group_sel', None)
+            if value is None:
+                return
+            if operator == '*':
+                # if operator is ALL, whether any group_sel is provided, include everything
+                translation.search.append(ALL_GROUPS_SEARCH)
+            elif self.validate_group_sel(value, valid):
+                # if all entries are valid include them, adding in the selected operator
+                groups = ['"' + e + '"' for e in value.split(',')]
+                connector = ' ' + operator + ' '
+                group_sel = quote_join(groups, connector, urllib.quote_plus)
+                translation.filter.append(facet_filter('bibgroup_facet', 'bibgroup_facet:(' + connector.join(groups) + ')',
+                                                       BIBGROUP_FILTER_PREFIX + group_sel + BIBGROUP_FILTER_SUFFIX))
+            else:
+                # unrecognizable value
+                translation.error_message.append(urllib.quote('Invalid value for group_sel: {}'.format(value)))
+
+    def translate_group_and(self, args, translation, operators=GROUP_AND_OPERATORS):
+        """ set group entries operator """
+        group_and = args.pop('group_and', None)
+        if group_and is None:
+            operator = None
+        elif group_and in operators:
+            operator = operators[group_and]
+        else:
+            operator = None
+            translation.error_message.append(urllib.quote('Invalid value for group_and: {}'.format(group_and)))
+        return operator
+
+    def translate_return_req(self, args, translation):
+        """if return_req parameter is provided, it must be 'result' or None
+
+        return error if any other value is supplied
+
+        """
+        return_req = args.pop('return_req', None)
+        if return_req is None:
+            pass
+        elif return_req == 'result':
+            pass
+        else:
+            translation.error_message.append(urllib.quote('Invalid value for return_req({}), should be "result"'.format(return_req)))
+
+    def translate_property_filters(self, args, translation):
+        """filter query for property 
+
+        several search fields translate to a Bumblebee filter query with property
+        """
+        for key, f in PROPERTY_FILTERS:
+            if str(args.pop(key, None)).upper() == 'YES':
+                translation.filter.append(f)
+
+    def translate_qsearch(self, args, translation):
+        """translate qsearch parameter from single input form on classic_w_BBB_button.html
+
+        return nonfielded metadata search query
+        """
+        qsearch = args.pop('qsearch', None)
+        if qsearch:
+            translation.search.append(qsearch)
+
+    def translate_to_ignore(self, args, translation, ignored):
+        """ remove the fields that is being ignored """
+        for field in ignored:
+            args.pop(field, None)
+
+    def translate_weights(self, args, translation, defaults):
+        """ check the weight parameters """
+        # these weights are checked/present as default, if they are not present add them in,
+        # for ***_wt if the values have been changed, keep them in the args to be
+        # reported in the unprocessed parameters to BBB otherwise
+        # if they have stayed unchanged from default then remove them from args
+        # the defaults are in WEIGHT_DEFAULTS, passed in as defaults
+
+        # for completeness the default absented weights are listed in WEIGHT_DEFAULTS_ABSENT,
+        # basically, nothing needs to get done for absented weights, if they
+        # have been selected (not default) leave them in the args
+        # if they have stayed unchanged from default, they do not appear in args
+        for key,value in defaults.iteritems():
+            if key in args:
+                if args[key] == value:
+                    args.pop(key, None)
+            else:
+                args[key] = ''
+
+    def validate_arxiv_sel(self, arxiv_sel, valid=VALID_ARXIV_SEL):
+        """Validate arXiv selections"""
+        if len(arxiv_sel) == 0:
+            return False
+        return valid.issuperset(arxiv_sel.split(','))
+
+    def translate_arxiv_sel(self, args, translation, values, valid):
+        """Convert all classic arXiv entries search related parameters to ads/bumblebee"""
+        value = args.pop('arxiv_sel', None)
+        if value is None:
+            return
+        if self.validate_arxiv_sel(value, valid):
+            # if all entries are valid include them, adding in the selected operator
+            keywords = [values[e] for e in value.split(',')]
+            arxiv_sel = ENCODED_OR.join([encoded for clause, encoded in keywords])
+            translation.filter.append(facet_filter('keyword_facet', ' OR '.join([clause for clause, encoded in keywords]),
+                                                   ARXIV_FILTER_PREFIX + arxiv_sel + ')'))
+        else:
+            # unrecognizable value
+            translation.error_message.append(urllib.quote('Invalid value for arxiv_sel: {}'.format(value)))
+
+    def translate_ref_stems(self, args, translation):
+        """
+        BBB: bibstem:(ApJ.. OR AJ..); classic: ref_stems="ApJ..,AJ..."
+        list of comma-separated ADS bibstems to return, e.g. ref_stems="ApJ..,AJ..."
+        """
+        value = args.pop('ref_stems', None)
+        if value is None:
+            return
+        # not validating, just pass it to BBB, if any bibstem has been specified
+        if len(value) > 0:
+            stems = ['"' + e + '"' for e in value.split(',')]
+            ref_stems = quote_join(stems, ' OR ')
+            translation.filter.append(facet_filter('bibstem_facet', 'bibstem_facet:(' + ' OR '.join(stems) + ')',
+                                                   BIBSTEM_FILTER_PREFIX + ref_stems + BIBSTEM_FILTER_SUFFIX))
+
+    @staticmethod
+    def classic_field_to_array(value):
+        """ convert authors or objects from classic to list"""
+        return classic_terms(value)
+
+
+# shared by all threads, the translator holds no state
+TRANSLATOR = ClassicTranslator()
+
+
+def translate(query, form=None, compact=False):
+    """
+    translate a classic query to a bumblebee query fragment
+    :param query: url query string, MultiDict or dict of classic parameters
+    :param form: optional form parameters
+    :param compact: use the shorter output form, see Translation.query
+    """
+    return TRANSLATOR.translate(ClassicArgs.parse(query, form), compact)
@@ -0,0 +1,367 @@
+"""
+Reading lists of bibcodes uploaded to /redirect
+"""
+
+import re
+import json
+import itertools
+import tempfile
+import threading
+import zlib
+from flask import current_app, abort
+
+# size of the reads from the request stream
+CHUNK_SIZE = 64 * 1024
+# zlib window bits of the accepted Content-Encodings
+CONTENT_ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+# a complete json string, the start of one cut off by the end of the buffer,
+# and an array item: a string followed by its separator
+_string = re.compile(r'"([^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*)"', re.DOTALL)
+_string_start = re.compile(r'"[^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*\\?\Z', re.DOTALL)
+_item = re.compile(r'[ \t\n\r]*"([^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*)"[ \t\n\r]*([,\]])', re.DOTALL)
+# ADS bibcode: 4 digit year followed by journal, volume, page and author initial in 15 characters,
+# and a run of bibcode lines
+_bibcode = re.compile(r"\d{4}[A-Za-z0-9&.:'+-]{15}\Z")
+_bibcode_lines = re.compile(r"(?:\d{4}[A-Za-z0-9&.:'+-]{15}\n)*\d{4}[A-Za-z0-9&.:'+-]{15}\Z")
+# a run of items without escapes, and the strings in it
+_plain_items = re.compile(r'(?:[ \t\n\r]*"[^"\\\x00-\x1f]*"[ \t\n\r]*,)*')
+_plain_string = re.compile(r'"([^"]*)"')
+
+
+def decode_json_string(raw):
+    """utf-8 value of the content of a json string"""
+    if '\\' in raw:
+        return json.loads('"' + raw + '"').encode('utf-8')
+    return raw
+
+
+def _checked(items, max_item_size):
+    """the items, unless one is longer than max_item_size or not utf-8"""
+    if max(len(item) for item in items) > max_item_size:
+        raise ValueError('string longer than {} bytes'.format(max_item_size))
+    # raises UnicodeDecodeError, a ValueError
+    '\n'.join(items).decode('utf-8')
+    return items
+
+
+def iter_json_batches(chunks, max_item_size=1024):
+    """
+    yield the strings of a json array of strings as lists of utf-8 byte strings
+
+    the array is read incrementally from an iterable of byte strings, only the
+    current chunk is kept in memory, its items are matched in one pass when
+    they contain no escapes
+    :param max_item_size: longest accepted item in bytes
+    :raises ValueError: when the input is not a json array of utf-8 strings
+    """
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    # expected next: '[', a string or ']', a string, ',' or ']', end of input
+    state = 'start'
+    while True:
+        if state in ('first', 'item'):
+            end = _plain_items.match(buffer, pos).end()
+            if end > pos:
+                items = _plain_string.findall(buffer, pos, end)
+                pos = end
+                state = 'item'
+            else:
+                match = _item.match(buffer, pos)
+                if match is None:
+                    items = None
+                else:
+                    items = [decode_json_string(match.group(1))]
+                    pos = match.end()
+                    state = 'item' if match.group(2) == ',' else 'end'
+            if items:
+                yield _checked(items, max_item_size)
+                continue
+        pos = _whitespace.match(buffer, pos).end()
+        if pos == len(buffer) or (buffer[pos] == '"' and _string.match(buffer, pos) is None):
+            if pos < len(buffer) and (_string_start.match(buffer, pos) is None or len(buffer) - pos > max_item_size):
+                raise ValueError('invalid or too long string at byte {}'.format(pos))
+            chunk = next(chunks, '')
+            if not chunk:
+                if state == 'end' and pos == len(buffer):
+                    return
+                raise ValueError('unexpected end of input')
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        char = buffer[pos]
+        if state == 'start' and char == '[':
+            state = 'first'
+        elif state in ('first', 'item') and char == '"':
+            # an item whose separator is not read yet
+            match = _string.match(buffer, pos)
+            yield _checked([decode_json_string(match.group(1))], max_item_size)
+            pos = match.end() - 1
+            state = 'next'
+        elif state in ('first', 'next') and char == ']':
+            state = 'end'
+        elif state == 'next' and char == ',':
+            state = 'item'
+        else:
+            raise ValueError('unexpected {!r} at byte {}'.format(char, pos))
+        pos += 1
+
+
+def iter_text_batches(chunks, max_item_size=1024):
+    """
+    yield the lines of newline separated text as lists of utf-8 byte strings
+
+    line ends may be \\n or \\r\\n, empty lines and a leading 'bibcode' line, as in the
+    bigquery format, are skipped, the lines are split and forwarded without being decoded
+    :param max_item_size: longest accepted line in bytes
+    :raises ValueError: when a line is too long or not utf-8
+    """
+    rest = ''
+    header = True
+    for chunk in itertools.chain(chunks, ['\n']):
+        text = rest + chunk
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')
+        lines = text.split('\n')
+        rest = lines.pop()
+        if len(rest) > max_item_size:
+            raise ValueError('line longer than {} bytes'.format(max_item_size))
+        if '' in lines:
+            lines = filter(None, lines)
+        if header and lines:
+            header = False
+            if lines[0].strip() == 'bibcode':
+                del lines[0]
+        if lines:
+            yield _checked(lines, max_item_size)
+
+
+def decompress(chunks, encoding, max_bytes, chunk_size=CHUNK_SIZE):
+    """
+    yield the decompressed chunks of a gzip or deflate stream, abort with 413 once
+    more than max_bytes come out
+    :raises ValueError: when the stream is not valid for the encoding
+    """
+    decompressor = zlib.decompressobj(CONTENT_ENCODINGS[encoding])
+    size = 0
+    try:
+        for chunk in chunks:
+            while chunk:
+                data = decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+                size += len(data)
+                if size > max_bytes:
+                    current_app.logger.error('Upload larger than {} bytes once decompressed'.format(max_bytes))
+                    abort(413)
+                if data:
+                    yield data
+        yield decompressor.flush()
+    except zlib.error as e:
+        raise ValueError('invalid {} content: {}'.format(encoding, e))
+
+
+def read_stream(stream, max_bytes, chunk_size=CHUNK_SIZE):
+    """yield chunks of the stream, abort with 413 once more than max_bytes are read"""
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > max_bytes:
+            current_app.logger.error('Upload larger than {} bytes'.format(max_bytes))
+            abort(413)
+        yield chunk
+
+
+class BibcodeUpload(object):
+    """
+    bibcodes of one upload, kept as the bigquery text
+
+    entries are trimmed, those that are not bibcodes are rejected and repeated ones
+    dropped, keeping the order of their first appearance. The text is spooled to a
+    temporary file once it grows past spool_size, the distinct bibcodes are kept as
+    byte strings for the qid cache key and the first max_rejected rejected entries
+    for the response. Readers of the text each keep their own position, so it can be
+    sent by concurrent requests
+    """
+
+    def __init__(self, spool_size, max_rejected=100):
+        self.body = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self.body.write('bibcode')
+        self.unique = set()
+        self.count = 0
+        self.rejected = []
+        self.rejected_count = 0
+        self.max_rejected = max_rejected
+        self._lock = threading.Lock()
+
+    def extend(self, bibcodes):
+        """add a list of utf-8 entries"""
+        self.count += len(bibcodes)
+        # most lists are valid and without repeats, checked without a loop over the entries;
+        # an entry with a newline of its own would pass the match as two lines
+        lines = '\n'.join(bibcodes)
+        if (_bibcode_lines.match(lines) and lines.count('\n') == len(bibcodes) - 1
+                and len(set(bibcodes)) == len(bibcodes) and self.unique.isdisjoint(bibcodes)):
+            self.unique.update(bibcodes)
+        else:
+            bibcodes = self.accepted(bibcodes)
+        if bibcodes:
+            self.body.write('\n')
+            self.body.write('\n'.join(bibcodes))
+
+    def accepted(self, entries):
+        """the entries that are new bibcodes, trimmed, the others are counted and the first ones kept"""
+        bibcodes = []
+        for entry in entries:
+            bibcode = entry.strip()
+            if bibcode in self.unique:
+                continue
+            if _bibcode.match(bibcode):
+                self.unique.add(bibcode)
+                bibcodes.append(bibcode)
+                continue
+            self.rejected_count += 1
+            if len(self.rejected) < self.max_rejected:
+                self.rejected.append(entry.decode('utf-8'))
+        return bibcodes
+
+    def iter_bibcodes(self):
+        """yield the bibcodes in the order they were uploaded"""
+        self.body.seek(0)
+        self.body.readline()
+        for line in self.body:
+            yield line.rstrip('\n').decode('utf-8')
+
+    def bigquery(self):
+        """the bigquery text, 'bibcode' followed by one bibcode per line"""
+        with self._lock:
+            self.body.seek(0)
+            return self.body.read()
+
+    def iter_bigquery(self, chunk_size=CHUNK_SIZE):
+        """the bigquery text in chunks of chunk_size bytes"""
+        offset = 0
+        while True:
+            with self._lock:
+                self.body.seek(offset)
+                chunk = self.body.read(chunk_size)
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.body.close()
+
+
+def read_body(request):
+    """
+    yield the chunks of the decoded request body, aborts with 413 when it is larger than
+    UPLOAD_MAX_BYTES, before or after decompression, and with 415 for content encodings
+    other than gzip and deflate
+    """
+    max_bytes = current_app.config['UPLOAD_MAX_BYTES']
+    if request.content_length is not None and request.content_length > max_bytes:
+        current_app.logger.error('Upload of {} bytes rejected'.format(request.content_length))
+        abort(413)
+    encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    if encoding != 'identity' and encoding not in CONTENT_ENCODINGS:
+        current_app.logger.error('Upload with unsupported Content-Encoding {}'.format(encoding))
+        abort(415)
+
+    chunks = read_stream(request.stream, max_bytes)
+    if encoding != 'identity':
+        chunks = decompress(chunks, encoding, max_bytes)
+    return chunks
+
+
+def read_bibcodes(request):
+    """
+    read the bibcodes posted to /redirect without holding the body or the list in memory
+
+    the body is a json array of strings or, as text/plain, one bibcode per line,
+    optionally gzip or deflate encoded. aborts with 413 when the body is larger than
+    UPLOAD_MAX_BYTES, before or after decompression, or has more than UPLOAD_MAX_BIBCODES
+    entries, with 415 for other content encodings and with 400 when it cannot be read
+    :return: BibcodeUpload
+    """
+    config = current_app.config
+    max_bibcodes = config['UPLOAD_MAX_BIBCODES']
+    chunks = read_body(request)
+    if request.mimetype == 'text/plain':
+        batches = iter_text_batches(chunks)
+    else:
+        batches = iter_json_batches(chunks)
+
+    upload = BibcodeUpload(config['UPLOAD_SPOOL_SIZE'], config['UPLOAD_MAX_REJECTED'])
+    try:
+        for bibcodes in batches:
+            if upload.count + len(bibcodes) > max_bibcodes:
+                current_app.logger.error('Upload with more than {} bibcodes rejected'.format(max_bibcodes))
+                abort(413)
+            upload.extend(bibcodes)
+    except ValueError as e:
+        upload.close()
+        current_app.logger.error('User passed incorrect format: {}'.format(e))
+        abort(400)
+    except:
+        upload.close()
+        raise
+    return upload
+
+
+def read_batch(request):
+    """
+    read the named bibcode lists posted to /redirect/batch
+
+    the body is a json array of objects with a name and a list of bibcodes, optionally
+    gzip or deflate encoded. A list that is not of that form gets an error of its own,
+    the body is rejected with 400 when it is not a json array, with 413 when it is
+    larger than UPLOAD_MAX_BYTES, has more than BATCH_MAX_LISTS lists or more than
+    UPLOAD_MAX_BIBCODES entries altogether and with 415 for other content encodings
+    :return: list of (name, BibcodeUpload or None, error or None)
+    """
+    config = current_app.config
+    try:
+        items = current_app.extensions['json_decoder'](''.join(read_body(request)))
+    except ValueError as e:
+        current_app.logger.error('User passed incorrect format: {}'.format(e))
+        abort(400)
+    if not isinstance(items, list):
+        current_app.logger.error('User passed incorrect format: not a list of bibcode lists')
+        abort(400)
+    if len(items) > config['BATCH_MAX_LISTS']:
+        current_app.logger.error('Batch of {} lists rejected'.format(len(items)))
+        abort(413)
+    if sum(len(item['bibcodes']) for item in items
+           if isinstance(item, dict) and isinstance(item.get('bibcodes'), list)) > config['UPLOAD_MAX_BIBCODES']:
+        current_app.logger.error('Batch with more than {} bibcodes rejected'.format(config['UPLOAD_MAX_BIBCODES']))
+        abort(413)
+
+    lists = []
+    try:
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                lists.append((index, None, 'not an object with a name and a list of bibcodes'))
+                continue
+            name = item.get('name', index)
+            bibcodes = item.get('bibcodes')
+            if not isinstance(bibcodes, list) or not all(isinstance(b, basestring) for b in bibcodes):
+                lists.append((name, None, 'bibcodes is not a list of strings'))
+                continue
+            upload = BibcodeUpload(config['UPLOAD_SPOOL_SIZE'], config['UPLOAD_MAX_REJECTED'])
+            lists.append((name, upload, None))
+            upload.extend([bibcode.encode('utf-8') for bibcode in bibcodes])
+    except:
+        for name, upload, error in lists:
+            if upload is not None:
+                upload.close()
+        raise
+    return lists
@@ -0,0 +1,293 @@
+"""
+Storing lists of bibcodes as vault queries
+"""
+
+import time
+import hashlib
+import threading
+import urllib
+import uuid
+import zlib
+import requests
+from flask import current_app, abort
+from client import client
+from admission import Overloaded, VAULT_CALLS
+from cache import WaitTimeout
+
+
+def bibcode_digest(bibcodes):
+    """
+    key of a list of unicode or utf-8 bibcodes, lists with the same bibcodes
+    in any order or repeated share a key since the stored query is the same set
+    """
+    normalized = sorted(set((bibcode.encode('utf-8') if isinstance(bibcode, unicode) else bibcode).strip()
+                            for bibcode in bibcodes))
+    return hashlib.sha1('\n'.join(normalized)).hexdigest()
+
+
+def bibcode_search_url(bibcodes, bbb_url, max_bibcodes, max_length):
+    """
+    bumblebee search url selecting the bibcodes directly, without a stored query
+    :return: url, None when there are more than max_bibcodes distinct bibcodes
+        or the url would be longer than max_length
+    """
+    unique = []
+    for bibcode in bibcodes:
+        bibcode = bibcode.strip()
+        if bibcode and bibcode not in unique:
+            unique.append(bibcode)
+            if len(unique) > max_bibcodes:
+                return None
+    if not unique:
+        return None
+    clause = 'bibcode:(' + ' OR '.join('"' + bibcode + '"' for bibcode in unique) + ')'
+    url = bbb_url + '/#search/q=' + urllib.quote(clause.encode('utf-8'))
+    if len(url) > max_length:
+        return None
+    return url
+
+
+def query_id_url(query_id, bbb_url):
+    """bumblebee search url of a query stored in vault"""
+    return '{BBB_URL}/#search/q=*%3A*&__qid={query_id}'.format(BBB_URL=bbb_url, query_id=query_id)
+
+
+class VaultUnavailable(Exception):
+    """
+    vault is not called while the circuit breaker is open or too many calls are in flight
+    """
+    def __init__(self, retry_after, reason='vault/query circuit breaker open'):
+        super(VaultUnavailable, self).__init__(reason)
+        self.retry_after = retry_after
+
+
+class VaultError(Exception):
+    """
+    vault/query did not return a qid, its response is passed on to the user
+    """
+    def __init__(self, text, status_code, headers):
+        super(VaultError, self).__init__(text)
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers
+
+
+def multipart_chunks(fields, name, chunks, boundary):
+    """multipart/form-data body of the fields followed by the chunks as the file part name"""
+    for key, value in fields:
+        yield '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(boundary, key, value)
+    yield ('--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{1}"\r\n'
+           'Content-Type: text/plain; charset=utf-8\r\n\r\n').format(boundary, name)
+    for chunk in chunks:
+        yield chunk
+    yield '\r\n--{}--\r\n'.format(boundary)
+
+
+def gzip_chunks(chunks, level):
+    """gzip compress a sequence of chunks as it is consumed"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class AttemptCancelled(Exception):
+    """
+    the body of a call to vault is no longer needed, another attempt was answered
+    """
+
+
+def cancellable_chunks(chunks, cancelled):
+    """
+    the chunks of a generator until the cancelled event is set, then the generator is
+    closed and AttemptCancelled abandons the request
+    """
+    for chunk in chunks:
+        if cancelled.is_set():
+            chunks.close()
+            raise AttemptCancelled('vault/query attempt cancelled')
+        yield chunk
+
+
+def bigquery_request(upload, config, cancelled=None):
+    """
+    keyword arguments of the post of the uploaded bibcodes to vault/query
+
+    VAULT_TRANSPORT 'form' urlencodes the bigquery with q and fq, as vault has always
+    received it, 'multipart' sends it as a file part and 'raw' as the text/plain body
+    with q and fq in the url, both streamed from the upload in chunks.
+    VAULT_GZIP_LEVEL above 0 compresses the body with Content-Encoding gzip
+    :param upload: BibcodeUpload
+    :param cancelled: optional event, once set a body streamed from the upload stops
+                      and the request is abandoned
+    """
+    transport = config.get('VAULT_TRANSPORT', 'form')
+    level = config.get('VAULT_GZIP_LEVEL', 0)
+    fields = [('q', '*:*'), ('fq', '{!bitset}')]
+    kwargs = {}
+    chunks = upload.iter_bigquery()
+    if cancelled is not None:
+        chunks = cancellable_chunks(chunks, cancelled)
+    if transport == 'form':
+        bigquery_data = {
+            'bigquery': [upload.bigquery()],
+            'q': ['*:*'],
+            'fq': ['{!bitset}']
+        }
+        if not level:
+            return {'data': bigquery_data}
+        body = [urllib.urlencode(bigquery_data, doseq=True)]
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    elif transport == 'multipart':
+        boundary = uuid.uuid4().hex
+        body = multipart_chunks(fields, 'bigquery', chunks, boundary)
+        headers = {'Content-Type': 'multipart/form-data; boundary=' + boundary}
+    elif transport == 'raw':
+        kwargs['params'] = fields
+        body = chunks
+        headers = {'Content-Type': 'text/plain; charset=utf-8'}
+    else:
+        raise ValueError('unknown VAULT_TRANSPORT {}'.format(transport))
+    if level:
+        body = gzip_chunks(body, level)
+        headers['Content-Encoding'] = 'gzip'
+    kwargs.update(data=body, headers=headers)
+    return kwargs
+
+
+def deadline_timeout(deadline, config):
+    """
+    (connect, read) timeout of a call to vault that must end by the deadline,
+    the read timeout bounds each wait for data rather than the whole response
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        current_app.logger.error('vault/query not called, request deadline passed')
+        abort(504)
+    return (min(config['CLIENT_CONNECT_TIMEOUT'], remaining), min(config['CLIENT_READ_TIMEOUT'], remaining))
+
+
+def store_query(upload, deadline=None):
+    """
+    store the bibcodes as a bigquery in vault
+
+    the call counts against the admission budget of vault calls in flight and
+    is not made when that is exhausted. Timeouts, connection errors and 5xx
+    responses count as failures of the circuit breaker, while it is open vault
+    is not called. With VAULT_HEDGE set a slow call is sent a second time,
+    vault returns the same qid for both; the second request takes a vault call
+    of its own and is not sent when none is left, the request that loses stops
+    streaming the upload once the call returns
+    :param upload: BibcodeUpload
+    :param deadline: timestamp by which the call must be done
+    :raises VaultUnavailable: when the circuit breaker is open or too many calls are in flight
+    :return: query id
+    """
+    config = current_app.config
+    timeout = deadline_timeout(deadline, config)
+    admission = current_app.extensions['admission']
+    try:
+        admission.acquire(VAULT_CALLS)
+    except Overloaded as e:
+        raise VaultUnavailable(e.retry_after, 'too many vault/query calls in flight')
+    try:
+        return _store_query(upload, config, timeout, admission)
+    finally:
+        admission.release(VAULT_CALLS)
+
+
+def _store_query(upload, config, timeout, admission):
+    """store_query once the call is admitted"""
+    breaker = current_app.extensions['vault_breaker']
+    if not breaker.allow():
+        raise VaultUnavailable(breaker.retry_after())
+    session = client()
+    # set once the call returns, a hedged attempt that lost stops streaming the upload
+    # that the caller closes
+    done = threading.Event()
+
+    def post():
+        # POST the query
+        # https://api.adsabs.harvard.edu/v1/vault/query
+        return session.post(
+            config['VAULT_QUERY_URL'],
+            timeout=timeout,
+            **bigquery_request(upload, config, done)
+        )
+
+    def admit_hedge():
+        try:
+            admission.acquire(VAULT_CALLS)
+        except Overloaded:
+            return False
+        return True
+
+    current_app.logger.info('Contacting vault/query ' + str(config['TESTING']))
+    try:
+        if config.get('VAULT_HEDGE'):
+            r = current_app.extensions['vault_hedger'].call(post, admit_hedge, lambda: admission.release(VAULT_CALLS))
+        else:
+            r = post()
+    except requests.exceptions.Timeout as e:
+        breaker.record(False)
+        current_app.logger.error('vault/query timed out: {}'.format(e))
+        abort(504)
+    except requests.exceptions.ConnectionError as e:
+        breaker.record(False)
+        current_app.logger.error('vault/query could not be reached: {}'.format(e))
+        abort(502)
+    finally:
+        done.set()
+    breaker.record(r.status_code < 500)
+
+    if r.status_code != 200:
+        current_app.logger.warning(
+            'vault/query returned non-200 exit status: {}'.format(r.text)
+        )
+        raise VaultError(r.text, r.status_code, r.headers.items())
+
+    # Get back a query id, decoded once
+    try:
+        result = current_app.extensions['json_decoder'](r.content)
+    except ValueError:
+        current_app.logger.error('vault/query returned invalid json: {}'.format(r.text))
+        raise VaultError(r.text, 502, r.headers.items())
+    current_app.logger.info('vault/query returned: {}'.format(result))
+    return result['qid']
+
+
+def cached_query_id(upload):
+    """query id of the uploaded bibcodes when the same list was stored recently, else None"""
+    return current_app.extensions['qid_cache'].get(bibcode_digest(upload.unique))
+
+
+def query_id(upload, deadline=None):
+    """
+    query id of the uploaded bibcodes, vault is skipped when the same list was stored recently
+
+    concurrent requests with the same list wait for one call to vault and share its qid or error,
+    a request that waits for the call of another one aborts with 504 at its own deadline
+    :param upload: BibcodeUpload
+    :param deadline: timestamp by which the call to vault must be done
+    """
+    cache = current_app.extensions['qid_cache']
+    key = bibcode_digest(upload.unique)
+    qid = cache.get(key)
+    if qid is None:
+        def store():
+            qid = store_query(upload, deadline)
+            cache.set(key, qid)
+            return qid
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        try:
+            qid = current_app.extensions['vault_single_flight'].do(key, store, timeout)
+        except WaitTimeout:
+            current_app.logger.error('vault/query of the same list still in flight at the request deadline')
+            abort(504)
+    else:
+        current_app.logger.info('qid cache hit for {} bibcodes: {}'.format(len(upload.unique), qid))
+    return qid
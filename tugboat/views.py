@@ -3,15 +3,21 @@
 Views
 """
 
-from client import client
+import time
 import traceback
-from flask import redirect, current_app, request, abort, render_template
+from functools import wraps
+from flask import redirect, current_app, request, render_template, has_app_context, url_for, g
+from werkzeug.exceptions import HTTPException
 from flask_restful import Resource
-from webargs import fields
+import marshmallow as ma
+from webargs import fields, ValidationError
+from webargs.core import argmap2schema, is_json
 from webargs.flaskparser import parser
-import urllib
-from datetime import datetime
-import calendar
+import vault
+from admission import Overloaded, BYTES
+from upload import read_bibcodes, read_batch
+from translator import CLASSIC_PARAMETERS, ClassicArgs, TRANSLATOR, canonical_query, date_dependency_expiry
+
 
 class IndexView(Resource):
     """
@@ -37,19 +43,74 @@ class ComplexClassicView(Resource):
         return current_app.send_static_file('fielded_classic_w_BBB_button.html')
 
 
-class TranslationValue():
-    """simple singleton container class to hold translation components
+# webargs fields of the classic parameters
+CLASSIC_API = dict((name, fields.Str(required=False) if kind is unicode else fields.Field(required=False))
+                   for name, kind in CLASSIC_PARAMETERS.iteritems())
+
+
+def request_json(request):
+    """
+    dict decoded from the json body of the request, None without one
 
-    functions that translation specific parameters typically augment the TranslationValue
+    like webargs, the body is decoded for json mimetypes and a body that does
+    not decode is ignored
     """
+    if not hasattr(request, 'get_json'):
+        return None
+    data = request.get_json(force=is_json(request.mimetype), silent=True)
+    return data if isinstance(data, dict) else None
+
+
+class CompiledSchema(object):
+    """classic parameter schema, resolved once at import
+
+    webargs builds a new marshmallow schema class from an argmap dict on every
+    parser.parse call and then visits every field, here only the parameters
+    actually present in the request are looked up and deserialized. They are
+    added to the result in the order of the webargs schema fields, as webargs
+    does, so the leftover keys the translator reports as unprocessed come out
+    in the same order
+    """
+    __slots__ = ('_fields', 'ranks', 'names')
+
+    def __init__(self, argmap):
+        object.__setattr__(self, '_fields', dict(argmap))
+        object.__setattr__(self, 'ranks', dict((name, rank) for rank, name in
+                                                enumerate(argmap2schema(argmap)().fields)))
+        object.__setattr__(self, 'names', frozenset(argmap))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledSchema is immutable')
+
+    def parse(self, request):
+        """return dict of deserialized parameters present in the request
+
+        like webargs, query string values take precedence over form values, form
+        values over the json body, and invalid values abort the request with a 422
+        """
+        values = {}
+        errors = {}
+        for location in (getattr(request, 'args', None), getattr(request, 'form', None), request_json(request)):
+            if not location:
+                continue
+            for name in location:
+                if name in values or name not in self.names:
+                    continue
+                try:
+                    values[name] = self._fields[name].deserialize(location.get(name))
+                except ma.ValidationError as e:
+                    errors[name] = e.messages
+        if errors:
+            parser.handle_error(ValidationError(errors))
+        # the order keys are added in decides the order of a dict
+        args = {}
+        for name in sorted(values, key=self.ranks.__getitem__):
+            args[name] = values[name]
+        return args
+
+
+CLASSIC_SCHEMA = CompiledSchema(CLASSIC_API)
 
-    # consider adding field for sort order and other args
-    def __init__(self):
-        self.search = []
-        self.filter= []
-        self.error_message = []
-        self.warning_message = []
-        self.sort = ''
 
 class ClassicSearchRedirectView(Resource):
     """
@@ -58,128 +119,6 @@ class ClassicSearchRedirectView(Resource):
     Where possible, returned query should be human readable and illustrate what a good query looks like
     """
 
-    def __init__(self):
-        super(ClassicSearchRedirectView, self).__init__()
-        self.translation = TranslationValue()
-
-
-        # all the parameters from classic
-        # typically integer fields must be represented by Field to allow None values
-        # some of these need use type fields.List
-        self.api = {
-            # the following we currently translate
-            'article_sel': fields.Str(required=False),
-            'aut_logic': fields.Str(required=False),
-            'aut_xct': fields.Str(required=False),
-            'author': fields.Str(required=False),
-            'data_link': fields.Str(required=False),
-            'db_key': fields.Str(required=False),
-            'end_entry_day': fields.Field(required=False),
-            'end_entry_mon': fields.Field(required=False),
-            'end_entry_year': fields.Field(required=False),
-            'end_mon': fields.Field(required=False),
-            'end_year': fields.Field(required=False),
-            'jou_pick': fields.Str(required=False),
-            'obj_logic': fields.Str(required=False),
-            'object': fields.Str(required=False),
-            'open_link': fields.Str(required=False),
-            'preprint_link': fields.Str(required=False),
-            'qsearch': fields.Str(required=False),
-            'return_req': fields.Str(required=False),
-            'start_entry_day': fields.Field(required=False),
-            'start_entry_mon': fields.Field(required=False),
-            'start_entry_year': fields.Field(required=False),
-            'start_mon': fields.Field(required=False),
-            'start_year': fields.Field(required=False),
-            'text': fields.Str(required=False),
-            'txt_logic': fields.Str(required=False),
-            'title': fields.Str(required=False),
-            'ttl_logic': fields.Str(required=False),
-
-            # implementations for the following just create errors
-            # perhaps because there is no ads/bumbleebee support yet
-            'nr_to_return': fields.Field(required=False),
-            'start_nr': fields.Field(required=False),
-
-            # golnaz - 3/5/2018
-            'article_link': fields.Str(required=False),
-            'gif_link': fields.Str(required=False),
-            'article': fields.Str(required=False),
-            'simb_obj': fields.Str(required=False),
-            'ned_obj': fields.Str(required=False),
-            'data_and': fields.Str(required=False),
-            'toc_link': fields.Str(required=False),
-            'pds_link': fields.Str(required=False),
-            'multimedia_link': fields.Str(required=False),
-            'ref_link': fields.Str(required=False),
-            'citation_link': fields.Str(required=False),
-            'associated_link': fields.Str(required=False),
-            'lib_link': fields.Str(required=False),
-            'ar_link': fields.Str(required=False),
-            'aut_note': fields.Str(required=False),
-            'spires_link': fields.Str(required=False),
-            'group_and': fields.Str(required=False),
-            'group_sel': fields.Str(required=False),
-            'abstract': fields.Str(required=False),
-            'sort': fields.Str(required=False),
-            'aut_wt': fields.Field(required=False),
-            'obj_wt': fields.Field(required=False),
-            'ttl_wt': fields.Field(required=False),
-            'txt_wt': fields.Field(required=False),
-            'aut_wgt': fields.Str(required=False),
-            'obj_wgt': fields.Str(required=False),
-            'ttl_wgt': fields.Str(required=False),
-            'txt_wgt': fields.Str(required=False),
-            'aut_syn': fields.Str(required=False),
-            'ttl_syn': fields.Str(required=False),
-            'txt_syn': fields.Str(required=False),
-            'aut_sco': fields.Str(required=False),
-            'ttl_sco': fields.Str(required=False),
-            'txt_sco': fields.Str(required=False),
-            'aut_req': fields.Str(required=False),
-            'obj_req': fields.Str(required=False),
-            'ttl_req': fields.Str(required=False),
-            'txt_req': fields.Str(required=False),
-            'ref_stems': fields.Str(required=False),
-            'arxiv_sel': fields.Str(required=False),
-
-            # these can be ignored, at least for now
-            'sim_query': fields.Str(required=False),
-            'ned_query': fields.Str(required=False),
-            'mail_link': fields.Str(required=False),
-            'gpndb_obj': fields.Str(required=False),
-            'min_score': fields.Str(required=False),
-            'lpi_query': fields.Str(required=False),
-            'iau_query': fields.Str(required=False),
-            'data_type': fields.Str(required=False),
-            'adsobj_query': fields.Str(required=False),
-
-            # and the following are not yet translated
-            'kwd_wt': fields.Field(required=False),
-            'full_wt': fields.Field(required=False),
-            'aff_wt': fields.Field(required=False),
-            'full_syn': fields.Str(required=False),
-            'aff_syn': fields.Str(required=False),
-            'kwd_wgt': fields.Str(required=False),
-            'full_wgt': fields.Str(required=False),
-            'aff_wgt': fields.Str(required=False),
-            'kwd_sco': fields.Str(required=False),
-            'full_sco': fields.Str(required=False),
-            'aff_sco': fields.Str(required=False),
-            'kwd_req': fields.Str(required=False),
-            'full_req': fields.Str(required=False),
-            'aff_req': fields.Str(required=False),
-            'aut_logic': fields.Str(required=False),
-            'obj_logic': fields.Str(required=False),
-            'kwd_logic': fields.Str(required=False),
-            'ttl_logic': fields.Str(required=False),
-            'txt_logic': fields.Str(required=False),
-            'full_logic': fields.Str(required=False),
-            'aff_logic': fields.Str(required=False),
-
-            }
-
-
     def get(self):
         """
         return 302 to bumblebee
@@ -187,7 +126,7 @@ class ClassicSearchRedirectView(Resource):
         try:
             current_app.logger.info('Classic search redirect received data, headers: {}'.format(request.headers))
             bbb_url=current_app.config['BUMBLEBEE_URL']
-            bbb_query = self.translate(request)
+            bbb_query = self.cached_translate(request)
             redirect_url = bbb_url + '/#search/'+ bbb_query
             current_app.logger.info('translated classic {} to bumblebee {}, {}'.format(request, bbb_query, redirect_url))
             # golnaz 3/11/2018
@@ -204,11 +143,33 @@ class ClassicSearchRedirectView(Resource):
             return '<html><body><h2>Error translating classic query</h2> ' + e.message + '<p>' + traceback.format_exc() + '<p>' + str(request) + '</body></html>'
 
 
+    def cached_translate(self, request):
+        """
+        Translate, reusing the result of an earlier canonically identical query
+
+        the key is built from the query string only, a request with a form or
+        json body is translated without the cache
+        """
+        if getattr(request, 'form', None) or request_json(request) is not None:
+            return self.translate(request)
+        cache = current_app.extensions['classic_translation_cache']
+        key = canonical_query(request.args)
+        bbb_query = cache.get(key)
+        if bbb_query is None:
+            bbb_query = self.translate(request)
+            cache.set(key, bbb_query, expires=date_dependency_expiry(key))
+        return bbb_query
+
     def parse(self, request):
         """
         Parse the input parameter
+
+        with CLASSIC_FAST_PARSER set, webargs is skipped and a ClassicArgs is returned
         """
-        args = parser.parse(self.api, request)
+        if has_app_context() and current_app.config.get('CLASSIC_FAST_PARSER'):
+            return ClassicArgs.parse(request.args, getattr(request, 'form', None), CLASSIC_SCHEMA.ranks,
+                                     request_json(request))
+        args = CLASSIC_SCHEMA.parse(request)
         # group_sel is a special case since we could have repeated entries, (i.e., &group_sel=ARI&group_sel=ESO%2FLib&group_sel=HST)
         # hence need to extract them to a list, and then turn it to a string, since calling parser.parse only parses the first element
         group_sel = request.args.getlist('group_sel', type=str)
@@ -223,604 +184,146 @@ class ClassicSearchRedirectView(Resource):
     def translate(self, request):
         """
         Convert all classic search related parameters to ads/bumblebee
-        """
-        args = self.parse(request)
-        # functions to translate/process specific parameters
-        # consider using reflection to obtain this list
-        funcs = [self.translate_authors, self.translate_pubdate,
-                 self.translate_entry_date, self.translate_results_subset,
-                 self.translate_return_req, self.translate_qsearch,
-                 self.translate_database, self.translate_property_filters,
-                 self.translate_jou_pick, self.translate_data_entries,
-                 self.translate_group_sel, self.translate_sort,
-                 self.translate_to_ignore, self.translate_weights,
-                 self.translate_arxiv_sel, self.translate_ref_stems,
-                 ]
-        for f in funcs:
-            f(args)  # each may contribute to self.translation singleton
-
-        # functions to deal with the simple cases where only parameter name changes
-        self.translate_simple(args, 'object', 'object')
-        self.translate_simple(args, 'title', 'title')
-        self.translate_simple(args, 'text', 'abs')
-
-        # combine translation fragments in self.translation to ads/bumblebee parameter string
-        if len(self.translation.search) == 0:
-            self.translation.search = ['*:*']
-        solr_query = 'q=' + ' '.join(self.translation.search)
-        if len(self.translation.filter) > 0:
-            solr_query += '&fq=' + '&fq='.join(self.translation.filter)
-        if len(self.translation.sort) > 0:
-            solr_query += '&sort=' + self.translation.sort
-        if len(self.translation.error_message) > 0:
-            solr_query += '&error_message=' + '&error_message='.join(self.translation.error_message)
-        if len(self.translation.warning_message):
-            solr_query += '&warning_message=' + '&warning_message='.join(self.translation.warning_message)
-        if len(args.keys()):
-            # the functions that translate individual parameters use pop to remove parameters from arg list
-            # here if there are unprocessed parameters
-            # pass their names out ads/bumblebee
-            solr_query += '&unprocessed_parameter=' + urllib.quote('Parameters not processed: ' + ' '.join(args.keys()))
-
-        return solr_query
-
-
-    @staticmethod
-    def author_exact(args):
-        """given an aut_xct value, is it true"""
-        value = args.pop('aut_xct', None)
-        if value:
-            if 'YES' == str(value).upper():
-                return True
-        return False
 
-    @staticmethod
-    def get_logic(classic_param, args):
-        """given a logic parameter, return its value canonical form"""
-        classic_param_to_logic = {'author': 'aut_logic', 'title': 'ttl_logic',
-                                  'text': 'txt_logic', 'object': 'obj_logic'}
-        if classic_param in args:
-            logic_param = classic_param_to_logic[classic_param]
-            value = args.pop(logic_param, None)
-            if value:
-                value = value.upper()
-            return value
-        return ''
+        with CLASSIC_COMPACT_URLS set, the shorter output form is returned
+        """
+        compact = has_app_context() and current_app.config.get('CLASSIC_COMPACT_URLS', False)
+        return TRANSLATOR.translate(self.parse(request), compact)
 
-    @staticmethod
-    def supplied(value):
-        """check html parameter to see if it is valid"""
-        if value is None or (isinstance(value, basestring) and len(value) == 0):
-            return False
-        return True
 
-    def translate_authors(self, args):
-        """return string with all author search elements
+class MetricsView(Resource):
+    """
+    Counters of the in-process caches and connection pools, for monitoring
 
-        classic ui allows different and/or between authors and objects so we handle 
-        just the author affecting elements here
-        """
-        connector = ' AND '
-        search = ''
-        logic = self.get_logic('author', args)
-        exact = self.author_exact(args)
-        if logic == 'OR':
-            connector = ' OR '
-        author_field = 'author:'
-        if exact:
-            author_field = '=author:'
-        # one lone parameter should hold all authors from classic
-        authors_str = args.pop('author', None)
-        if authors_str:
-            authors = self.classic_field_to_array(authors_str)
-            search += urllib.quote(author_field) + '('
-            for author in authors:
-                search += urllib.quote(author + connector)
-            search = search[:-len(urllib.quote(connector))]  # remove final
-            search += ')'
-            self.translation.search.append(search)
-
-    def translate_simple(self, args, classic_param, bbb_param):
-        """process easy to translate fields like title
-
-        simply change name of parameter and use boolean connector
+    served at /metrics and /redirect/metrics, behind nginx the first is answered by
+    the sync workers and the second by the redirect pool that sheds uploads
+    """
+    def get(self):
         """
-        connector = ' AND '
-        search = ''
-        logic = self.get_logic(classic_param, args)
-        if logic == 'OR':
-            connector = ' OR '
-        # one lone parameter should hold all authors from classic
-        classic_str = args.pop(classic_param, None)
-        if classic_str:
-            terms = ClassicSearchRedirectView.classic_field_to_array(classic_str)
-            search += urllib.quote(bbb_param + ':') + '('
-            for term in terms:
-                search += urllib.quote(term + connector)
-            search = search[:-len(urllib.quote(connector))]  # remove final connector
-            search += ')'
-            self.translation.search.append(search)
-
-    def translate_pubdate(self, args):
-        """translate string with pubdate element
-
-        for pubdate date search, only start or end need be specified
-        at least one start year or end year must be provided
-        unlike entry date search, negative offsets are not supported
-        in classic, 2 digit years were permitted
-        bumblebee example: pubdate:[1990-01 TO 1990-02]
+        HTTP GET request
+        :return: dict of counters
         """
+        return {
+            'classic_translation_cache': current_app.extensions['classic_translation_cache'].stats(),
+            'vault_client': current_app.extensions['client'].stats(),
+            'qid_cache': current_app.extensions['qid_cache'].stats(),
+            'vault_single_flight': current_app.extensions['vault_single_flight'].stats(),
+            'vault_breaker': current_app.extensions['vault_breaker'].stats(),
+            'vault_hedger': current_app.extensions['vault_hedger'].stats(),
+            'deferred_jobs': current_app.extensions['deferred_jobs'].stats(),
+            'admission': current_app.extensions['admission'].stats()
+        }, 200
+
+
+def admitted(view):
+    """
+    sheds an upload with 503 and Retry-After, before its body is read, when its
+    size does not fit in the admission budget of payload bytes in flight; a body
+    without Content-Length counts as UPLOAD_MAX_BYTES. The bytes are released once
+    the view returns, unless it popped g.admitted_bytes to hand them to a deferred job
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        max_bytes = current_app.config['UPLOAD_MAX_BYTES']
+        size = min(request.content_length or max_bytes, max_bytes)
+        admission = current_app.extensions['admission']
+        try:
+            admission.acquire(BYTES, size)
+        except Overloaded as e:
+            current_app.logger.warning('Shed upload of {} bytes: {}'.format(size, e))
+            return {'error': 'overloaded'}, 503, {'Retry-After': str(e.retry_after)}
+        g.admitted_bytes = size
+        try:
+            return view(*args, **kwargs)
+        finally:
+            size = g.pop('admitted_bytes', 0)
+            if size:
+                admission.release(BYTES, size)
+    return wrapper
+
+
+def direct_redirect_url(upload):
+    """bibcode:(...) search url of a list of at most DIRECT_REDIRECT_MAX_BIBCODES bibcodes, else None"""
+    if len(upload.unique) > current_app.config['DIRECT_REDIRECT_MAX_BIBCODES']:
+        return None
+    # a few bibcodes are searched for directly
+    return vault.bibcode_search_url(
+        upload.iter_bibcodes(),
+        current_app.config['BUMBLEBEE_URL'],
+        current_app.config['DIRECT_REDIRECT_MAX_BIBCODES'],
+        current_app.config['DIRECT_REDIRECT_MAX_URL_LENGTH']
+    )
+
+
+def stored_redirect_url(upload, deadline):
+    """
+    url of the bibcodes stored as a query in vault, or of a bibcode:(...) search of
+    at most BREAKER_FALLBACK_MAX_BIBCODES bibcodes while vault is unavailable
+    :raises VaultError: vault/query did not return a qid
+    :raises VaultUnavailable: vault is unavailable and the list is too long to search for
+    """
+    try:
+        query_id = vault.query_id(upload, deadline)
+    except vault.VaultUnavailable as e:
+        current_app.logger.warning('vault/query unavailable: {}'.format(e))
+        redirect_url = vault.bibcode_search_url(
+            upload.iter_bibcodes(),
+            current_app.config['BUMBLEBEE_URL'],
+            current_app.config['BREAKER_FALLBACK_MAX_BIBCODES'],
+            current_app.config['DIRECT_REDIRECT_MAX_URL_LENGTH']
+        )
+        if redirect_url is None:
+            raise
+        return redirect_url
+    # Formulate the url based on the query id
+    return vault.query_id_url(query_id, current_app.config['BUMBLEBEE_URL'])
 
-        start_year = args.pop('start_year', None)
-        end_year = args.pop('end_year', None)
-        start_month = args.pop('start_mon', None)
-        end_month = args.pop('end_mon', None)
-
-        if self.supplied(start_year) is False and self.supplied(end_year) is False:
-            return
-
-        # if start is not provided, use beginning of time
-        if not self.supplied(start_year):
-            start_year = 0
-        if not self.supplied(start_month):
-            start_month = 1
-
-        # if end is not provided, use now
-        if not self.supplied(end_year):
-            tmp = datetime.now()
-            end_year = tmp.year
-            if not self.supplied(end_month):
-                end_month = tmp.month
-        else:
-            if not self.supplied(end_month):
-                end_month = 12
-
-        start_year = int(start_year)
-        start_month = int(start_month)
-        end_year = int(end_year)
-        end_month = int(end_month)
-        # Y10k problem, but for 2 digit years we want to be clear what years we are searching
-        search = 'pubdate' + urllib.quote(':[{:04d}-{:02d} TO {:04d}-{:02}]'.format(start_year, start_month,
-                                                                                    end_year, end_month))
-        self.translation.search.append(search)
-
-    def translate_entry_date(self, args):
-        """ return string for pubdate element
-
-        like pubdate search, only start on end need be specified
-        bumblebee does not yet implement, assume to follow pubdate 
-        """
-        start_year = args.pop('start_entry_year', None)
-        end_year = args.pop('end_entry_year', None)
-        start_month = args.pop('start_entry_mon', None)
-        start_day = args.pop('start_entry_day', None)
-        end_month = args.pop('end_entry_mon', None)
-        end_day = args.pop('end_entry_day', None)
-
-        if self.supplied(start_year) is False and self.supplied(end_year) is False:
-            return  # nothing to do
-
-        # if start is not provided, use beginning of time
-        if not self.supplied(start_year):
-            start_year = 0
-        if not self.supplied(start_month):
-            start_month = 1
-        if not self.supplied(start_day):
-            start_day = 1
-
-        # if end is not provided, use now
-        if not self.supplied(end_year):
-            tmp = datetime.now()
-            end_year = tmp.year
-            if not self.supplied(end_month):
-                end_month = tmp.month
-            if not self.supplied(end_day):
-                end_day = tmp.day
-        else:
-            if not self.supplied(end_month):
-                end_month = 12
-            if not self.supplied(end_day):
-                # get last day of end month/year
-                end_day = calendar.monthrange(end_year, end_month)[1]
-
-        start_year = int(start_year)
-        start_month = int(start_month)
-        start_day = int(start_day)
-        end_year = int(end_year)
-        end_month = int(end_month)
-        end_day = int(end_day)
-        search = 'entry_date' + \
-            urllib.quote(':[{:04d}-{:02d}-{:02d} TO {:04d}-{:02}-{:02d}]'.format(start_year, start_month, start_day,
-                                                                                 end_year, end_month, end_day))
-        self.translation.search.append(search)
-            
-    def translate_database(self, args):
-        """translate which database to use
-
-        only support for ast and phy, bbb does not support arxiv value, classic does not support general
-        no support to select multiple dbs
-        """
-        db = args.pop('db_key', None)
-        filter = []
-        classic_db_to_bbb = {'AST': 'astronomy', 'GEN': 'general', 'PHY': 'physics'}
-        if db:
-            bbb_db = classic_db_to_bbb.pop(db, None)
-            if bbb_db:
-                f = urllib.quote('{') + '!' + urllib.quote('type=aqp v=$fq_database}') + \
-                    '&fq_database=(' + urllib.quote('database:"{}"'.format(bbb_db)) + ')'
-                self.translation.filter.append(f)
-            else:
-                self.translation.warning_message.append('invalid database from classic {}'.format(db))
-
-    def translate_results_subset(self, args):
-        """subset/pagination currently not supported by bumblebee
-
-        provide error message if pagination request is present"""
-        number_to_return = args.pop('nr_to_return', None)
-        start_nr = args.pop('start_nr', None)
-        # golnaz: hold off for now
-        # if number_to_return or start_nr:
-        #     self.translation.error_message.append(urllib.quote('Result subset/pagination is not supported'))
-
-    def translate_jou_pick(self, args):
-        """translate for refereed, non-refereed"""
-        jou_pick = args.pop('jou_pick', None)
-        if jou_pick is None:
-            # if not provided, include everything in results, which is default
-            pass
-        elif jou_pick == 'ALL':
-            # include everything in results, which is default
-            pass
-        elif jou_pick == 'NO':
-            # only include refereed journals
-            self.translation.filter.append(urllib.quote('{!type=aqp v=$fq_property}&fq_property=(property:"refereed")'))
-        elif jou_pick == 'EXCL':
-            # only include non-refereed
-            self.translation.filter.append(urllib.quote('{!type=aqp v=$fq_property}&fq_property=(property:"notrefereed")'))
-        else:
-            self.translation.error_message.append(urllib.quote('Invalid value for jou_pick: {}'.format(jou_pick)))
-
-    def translate_data_entries(self, args):
-        """ Convert all classic data entries search related parameters to ads/bumblebee """
-        dict_entries = {'article_link'    : 'esources:("PUB_PDF" OR "PUB_HTML" OR "AUTHOR_PDF" OR "AUTHOR_HTML" OR "ADS_PDF" OR "ADS_SCAN")',
-                        'gif_link'        : 'esources:("ADS_SCAN")',
-                        'article'         : 'esources:("PUB_PDF" OR "PUB_HTML")',
-                        'preprint_link'   : 'esources:("EPRINT_HTML")',
-                        'toc_link'        : 'property:("TOC")',
-                        'ref_link'        : 'reference:(*)',
-                        'citation_link'   : 'citation_count:[1 TO *]',
-                        'associated_link' : 'property:("ASSOCIATED")',
-                        'simb_obj'        : 'data:("simbad")',
-                        'ned_obj'         : 'data:("ned")',
-                        'pds_link'        : 'property:("PDS")',
-                        'aut_note'        : 'property:("NOTE")',   # need to verify this later, it is being implemented 3/12
-                        'lib_link'        : 'property:("LIBRARYCATALOG")',
-                        'ar_link'         : 'read_count:[1 TO *]',
-                        'multimedia_link' : 'property:("PRESENTATION")',
-                        'spires_link'     : 'property:("INSPIRE")',
-                        'abstract'        : 'abstract:(*)',
-        }
-
-        operator = self.translate_data_and(args)
-        if operator is not None:
-            # each may contribute to self.translation singleton
-            for classic,BBB in dict_entries.iteritems():
-                value = args.pop(classic, None)
-                if value is None:
-                    # if not provided, we do not need to include it in the result
-                    pass
-                elif value == 'YES':
-                    # include entry, first add the operator
-                    if (operator == 'NOT') or len(self.translation.search) > 0:
-                        self.translation.search.append(operator)
-                    self.translation.search.append(urllib.quote(BBB))
-                else:
-                    # unrecognizable value
-                    self.translation.error_message.append(urllib.quote('Invalid value for {}: {}'.format(classic, value)))
-
-    def translate_data_and(self, args):
-        """ get bibliographic entries operator """
-        data_and = args.pop('data_and', None)
-        if data_and is None:
-            operator = None
-        elif data_and == 'ALL':
-            # when 'A bibliographic entry' radio button is selected
-            operator = ''
-        elif data_and == 'NO':
-            # when 'At least one of the following (OR)' radio button is selected
-            operator = 'OR'
-        elif data_and == 'YES':
-            # when 'All of the following (AND)' radio button is selected
-            operator = 'AND'
-        elif data_and == 'NOT':
-            # when 'None of the following (NOT)' radio button is selected
-            operator = 'NOT'
-        else:
-            operator = None
-            self.translation.error_message.append(urllib.quote('Invalid value for data_and: {}'.format(data_and)))
-        return operator
-
-    def validate_group_sel(self, group_sel):
-        valid_group_sel = ['ARI', 'CfA', 'CFHT', 'Chandra', 'ESO/Lib', 'ESO/Telescopes', 'Gemini', 'Herschel', 'HST',
-                           'ISO', 'IUE', 'JCMT', 'Keck', 'Leiden', 'LPI', 'Magellan', 'NOAO', 'NRAO', 'NRAO/Telescopes',
-                           'ROSAT', 'SDO', 'SMA', 'Spitzer', 'Subaru', 'Swift', 'UKIRT', 'USNO', 'VSGC', 'XMM']
-        if len(group_sel) == 0:
-            return False
-        entry = group_sel.split(',')
-        for e in entry:
-            if e not in valid_group_sel:
-                return False
-        return True
-
-    def translate_group_sel(self, args):
-        """ Convert all classic group entries search related parameters to ads/bumblebee """
-        operator = self.translate_group_and(args)
-        if operator is not None:
-            value = args.pop('group_sel', None)
-            if value is None:
-                return
-            if operator == '*':
-                # if operator is ALL, whether any group_sel is provided, include everything
-                self.translation.search.append(urllib.quote('bibgroup:(*)'))
-            elif self.validate_group_sel(value):
-                # if all entries are valid include them, adding in the selected operator
-                group_sel = ''
-                entry = value.split(',')
-                for e in entry:
-                    if (operator == 'NOT') or len(group_sel) > 0:
-                        group_sel += ' ' + operator + ' '
-                    group_sel += '"' + e + '"'
-                if len(group_sel) > 0:
-                    self.translation.filter.append(urllib.quote('{') + '!' + urllib.quote('type=aqp v=$fq_bibgroup_facet}') + \
-                        '&fq_bibgroup_facet=(' + urllib.quote_plus('bibgroup_facet:({})'.format(group_sel)) + ')')
-            else:
-                # unrecognizable value
-                self.translation.error_message.append(urllib.quote('Invalid value for group_sel: {}'.format(value)))
-
-    def translate_group_and(self, args):
-        """ set group entries operator """
-        group_and = args.pop('group_and', None)
-        if group_and is None:
-            operator = None
-        elif group_and == 'ALL':
-            # when 'All Groups' radio button is selected
-            operator = '*'
-        elif group_and == 'NO':
-            # when 'At least one of the following groups (OR)' radio button is selected
-            operator = 'OR'
-        elif group_and == 'YES':
-            # when 'All of the following groups (AND)' radio button is selected
-            operator = 'AND'
-        else:
-            operator = None
-            self.translation.error_message.append(urllib.quote('Invalid value for group_and: {}'.format(group_and)))
-        return operator
-
-    def translate_return_req(self, args):
-        """if return_req parameter is provided, it must be 'result' or None
-
-        return error if any other value is supplied
 
-        """
-        return_req = args.pop('return_req', None)
-        if return_req is None:
-            pass
-        elif return_req == 'result':
-            pass
-        else:
-            self.translation.error_message.append(urllib.quote('Invalid value for return_req({}), should be "result"'.format(return_req)))
-
-    def translate_property_filters(self, args):
-        """filter query for property 
-
-        several search fields translate to a Bumblebee filter query with property
-        """
-        to_bbb_property = {'article_sel': 'article', 'data_link': 'data',
-                           'open_link': 'OPENACCESS', 'preprint_link': 'eprint'}
-        clauses = []
-        for key in to_bbb_property.keys():
-            if str(args.pop(key, None)).upper() == 'YES':
-                value = to_bbb_property[key]
-                self.translation.filter.append(urllib.quote('{{!type=aqp v=$fq_doctype}}&fq_doctype=(doctype:"{}")'.format(to_bbb_property.get(key))))
-
-    def translate_qsearch(self, args):
-        """translate qsearch parameter from single input form on classic_w_BBB_button.html
-
-        return nonfielded metadata search query
-        """
-        qsearch = args.pop('qsearch', None)
-        if qsearch:
-            self.translation.search.append(qsearch)
-
-    def translate_sort(self, args):
-        """ translate sort parameter """
-        dict_sort = {'SCORE'      : 'date desc, bibcode desc',
-                     'AUTHOR'     : 'first_author desc',
-                     'NDATE'      : 'date desc',
-                     'ODATE'      : 'date asc',
-                     'BIBCODE'    : 'bibcode desc',
-                     'RBIBCODE'   : 'bibcode asc',
-                     'ENTRY'      : 'entry_date desc',
-                     'CITATIONS'  : 'citation_count desc',
-                     'AUTHOR_CNT' : 'author_count desc',
-                     'SBIBCODE'   : 'bibcode desc',
-                     'READS'      : 'read_count desc',
-                     'AR_SCORE'   : 'read_count desc',
-                     'NONE'       : '',
-        }
-
-        value = args.pop('sort', None)
-        if value is None:
-            self.translation.sort = urllib.quote('date desc, bibcode desc')
-            return
-
-        for classic,BBB in dict_sort.iteritems():
-            if value == classic:
-                self.translation.sort = urllib.quote(BBB)
-                return
-
-        # unrecognizable value
-        self.translation.error_message.append(urllib.quote('Invalid value for sort: {}'.format(value)))
-
-    def translate_to_ignore(self, args):
-        """ remove the fields that is being ignored """
-        classic_ignored_fields = ['sim_query', 'ned_query', 'lpi_query', 'iau_query', 'min_score', 'mail_link', 'gpndb_obj',
-                                  'data_type', # From Alberto 3/12 regarding data_type: we'll want it available for API queries, so it's for later
-                                  'adsobj_query',
-                                 ]
-        for field in classic_ignored_fields:
-            args.pop(field, None)
-
-    def translate_weights(self, args):
-        """ check the weight parameters """
-        # these weights are checked/present as default, if they are not present add them in,
-        # for ***_wt if the values have been changed, keep them in the args to be
-        # reported in the unprocessed parameters to BBB otherwise
-        # if they have stayed unchanged from default then remove them from args
-        dict_weights_default_present = {'aut_syn'  :  'YES',
-                                        'ttl_syn'  :  'YES',
-                                        'txt_syn'  :  'YES',
-                                        'aut_wt'   :  '1.0',
-                                        'obj_wt'   :  '1.0',
-                                        'ttl_wt'   :  '0.3',
-                                        'txt_wt'   :  '3.0',
-                                        'aut_wgt'  :  'YES',
-                                        'obj_wgt'  :  'YES',
-                                        'ttl_wgt'  :  'YES',
-                                        'txt_wgt'  :  'YES',
-                                        'ttl_sco'  :  'YES',
-                                        'txt_sco'  :  'YES',
-        }
-        # for completeness the default absented weights are listed here,
-        # basically, nothing needs to get done for absented weights, if they
-        # have been selected (not default) leave them in the args
-        # if they have stayed unchanged from default, they do not appear in args
-        dict_weights_default_absent = {'aut_sco'  :  'YES',
-                                       'aut_req'  :  'YES',
-                                       'obj_req'  :  'YES',
-                                       'ttl_req'  :  'YES',
-                                       'txt_req'  :  'YES',
-        }
-        for key,value in dict_weights_default_present.iteritems():
-            if key in args:
-                if args[key] == value:
-                    args.pop(key, None)
-            else:
-                args[key] = ''
-
-    def validate_arxiv_sel(self, arxiv_sel):
-        """Validate arXiv selections"""
-        valid_arxiv_sel = ['astro-ph', 'cond-mat', 'cs', 'gr-qc', 'hep-ex', 'hep-lat', 'hep-ph', 'hep-th',
-                           'math', 'math-ph', 'nlin', 'nucl-ex', 'nucl-th', 'physics', 'quant-ph', 'q-bio']
-        if len(arxiv_sel) == 0:
-            return False
-        entry = arxiv_sel.split(',')
-        for e in entry:
-            if e not in valid_arxiv_sel:
-                return False
-        return True
-
-    def translate_arxiv_sel(self, args):
-        """Convert all classic arXiv entries search related parameters to ads/bumblebee"""
-        dict_arxiv = {'astro-ph'  :  'Astrophysics',
-                      'cond-mat'  :  'Condensed Matter',
-                      'cs'        :  'Computer Science',
-                      'gr-qc'     :  'General Relativity and Quantum Cosmology',
-                      'hep-ex'    :  'High Energy Physics - Experiment',
-                      'hep-lat'   :  'High Energy Physics - Lattice',
-                      'hep-ph'    :  'High Energy Physics - Phenomenology',
-                      'hep-th'    :  'High Energy Physics - Theory',
-                      'math'      :  'Mathematics',
-                      'math-ph'   :  'Mathematical Physics',
-                      'nlin'      :  'Nonlinear Sciences',
-                      'nucl-ex'   :  'Nuclear Experiment',
-                      'nucl-th'   :  'Nuclear Theory',
-                      'physics'   :  'Physics',
-                      'quant-ph'  :  'Quantum Physics',
-                      'q-bio'     :  'Quantitative Biology',
-        }
-        value = args.pop('arxiv_sel', None)
-        if value is None:
-            return
-        if self.validate_arxiv_sel(value):
-            # if all entries are valid include them, adding in the selected operator
-            arxiv_sel = ''
-            entry = value.split(',')
-            for e in entry:
-                if len(arxiv_sel) > 0:
-                    arxiv_sel += ' OR '
-                arxiv_sel += 'keyword_facet:"' + dict_arxiv[e].lower() + '"'
-            if len(arxiv_sel) > 0:
-                self.translation.filter.append(urllib.quote('{') + '!' + urllib.quote('type=aqp v=$fq_keyword_facet}') + \
-                                               '&fq_keyword_facet=(' + urllib.quote(arxiv_sel) + ')')
-        else:
-            # unrecognizable value
-            self.translation.error_message.append(urllib.quote('Invalid value for arxiv_sel: {}'.format(value)))
-
-    def translate_ref_stems(self, args):
-        """
-        BBB: bibstem:(ApJ.. OR AJ..); classic: ref_stems="ApJ..,AJ..."
-        list of comma-separated ADS bibstems to return, e.g. ref_stems="ApJ..,AJ..."
-        """
-        value = args.pop('ref_stems', None)
-        if value is None:
-            return
-        # not validating, just pass it to BBB, if any bibstem has been specified
-        ref_stems = ''
-        if len(value) > 0:
-            entry = value.split(',')
-            for e in entry:
-                if len(ref_stems) > 0:
-                    ref_stems += ' OR '
-                ref_stems += '"' + e + '"'
-            if len(ref_stems) > 0:
-                self.translation.filter.append(urllib.quote('{') + '!' + urllib.quote('type=aqp v=$fq_bibstem_facet}') + \
-                                               '&fq_bibstem_facet=(' + urllib.quote('bibstem_facet:({})'.format(ref_stems)) + ')')
+def store_deferred(app, token, upload, deadline, admitted_bytes=0):
+    """
+    store the uploaded bibcodes in vault from the deferred executor and record
+    the qid or the failure in the job, then release the admitted bytes of the
+    upload, held until the job no longer needs it
+    """
+    jobs = app.extensions['deferred_jobs']
+    with app.app_context():
+        try:
+            jobs.finish(token, vault.query_id(upload, deadline))
+        except vault.VaultError as e:
+            jobs.fail(token, e.status_code, e.text)
+        except vault.VaultUnavailable:
+            jobs.fail(token, 503, 'vault unavailable')
+        except HTTPException as e:
+            jobs.fail(token, e.code, e.name)
+        except Exception:
+            app.logger.error('deferred job {} failed: {}'.format(token, traceback.format_exc()))
+            jobs.fail(token, 500, 'internal error')
+        finally:
+            upload.close()
+            if admitted_bytes:
+                app.extensions['admission'].release(BYTES, admitted_bytes)
+
 
-    @staticmethod
-    def classic_field_to_array(value):
-        """ convert authors or objects from classic to list"""
-        value = urllib.unquote(value)
-        value = value.replace('\r\n', ';')
-        values = value.split(';')
-        for i in range(0, len(values)):
-            values[i] = values[i].replace('+', ' ')
-            if ' ' in values[i] and (values[i].startswith('"') and values[i].endswith('"')) is False:
-                # value has space and is not already surrounded by double quotes so we add quotes
-                values[i] = '"' + values[i] + '"'
-        return values
-
-
-    
-    
 class BumblebeeView(Resource):
     """
     End point that is used to forward a search result page from ADS Classic
     to ADS Bumblebee
     """
-
-    def get_post_data(self, request):
-        """
-        Attempt to coerce POST json data from the request, falling
-        back to the raw data if json could not be coerced.
-        :param request: flask.request
-
-        :return: dict
-        """
-        try:
-            post_data = request.get_json(force=True)
-        except:
-            post_data = request.values
-
-        return post_data
+    method_decorators = [admitted]
 
     def post(self):
         """
         HTTP GET request
 
-        There are two simple steps:
+        The bibcodes, a json list or one per line as text/plain, optionally gzip
+        or deflate encoded, are read from the request stream in chunks. Entries
+        are trimmed, repeated ones dropped and those that are not bibcodes are
+        rejected and listed in the response.
+        Lists of at most DIRECT_REDIRECT_MAX_BIBCODES bibcodes are returned as a
+        bibcode:(...) search URL without contacting vault, otherwise there are two simple steps:
             1. Send a query to myads-service in 'store-query' that contains
-               the list of bibcodes in the user's ADS Classic search
+               the list of bibcodes in the user's ADS Classic search, unless
+               the same list was stored recently and its queryid is cached
             2. Return a URL with the relevant queryid that the user can be
                forwarded to
 
@@ -829,57 +332,182 @@ class BumblebeeView(Resource):
 
         Returns:
         302: redirect to the relevant URL
+        400: the body is not a json list of strings or utf-8 text, or has no bibcodes
+        413: more than UPLOAD_MAX_BYTES bytes or UPLOAD_MAX_BIBCODES bibcodes
+        415: Content-Encoding is not gzip or deflate
+        502, 504: vault/query could not be reached or did not respond by VAULT_DEADLINE
+        503: vault/query is failing and the list is too long for a bibcode:(...) search, or the
+             admission budget of payload bytes or vault calls in flight is exhausted
+
+        A request with the header Prefer: respond-async and at least DEFERRED_MIN_BIBCODES
+        bibcodes that are not in the qid cache is answered with 202 and the job and status
+        url of the call to vault, which is made in the background; the status url returns
+        the redirect once the qid is known.
+
+        While vault is failing its circuit breaker is open, vault is not called and lists of up
+        to BREAKER_FALLBACK_MAX_BIBCODES bibcodes are redirected to a bibcode:(...) search.
 
         :return: str
         """
 
         # Setup the data
+        deadline = time.time() + current_app.config['VAULT_DEADLINE']
         current_app.logger.info('Received data, headers: {}'.format(request.headers))
-        data = self.get_post_data(request)
-
-        if not isinstance(data, list):
-            current_app.logger.error(
-                'User passed incorrect format: {}, {}'.format(type(data), data)
-            )
-            abort(400)
-        elif not all([isinstance(i, unicode) for i in data]):
-            current_app.logger.error(
-                'List contains non-unicode characters: {}'.format(data)
-            )
-            abort(400)
-
-        bigquery_data = {
-            'bigquery': ['bibcode\n' + '\n'.join(data)],
-            'q': ['*:*'],
-            'fq': ['{!bitset}']
-        }
-
-        # POST the query
-        # https://api.adsabs.harvard.edu/v1/vault/query
-        current_app.logger.info('Contacting vault/query ' + str(current_app.config['TESTING']))
-        r = client().post(
-        current_app.config['VAULT_QUERY_URL'],
-        data=bigquery_data
-        )
+        upload = read_bibcodes(request)
+        rejected = {'rejected': upload.rejected, 'rejected_count': upload.rejected_count}
+        if upload.rejected_count:
+            current_app.logger.warning('Rejected {} entries that are not bibcodes'.format(upload.rejected_count))
 
-        if r.status_code != 200:
-            current_app.logger.warning(
-                'vault/query returned non-200 exit status: {}'.format(r.text)
-            )
-            return r.text, r.status_code, r.headers.items()
-
-        # Get back a query id
-        current_app.logger.info('vault/query returned: {}'.format(r.json()))
-        query_id = r.json()['qid']
-
-        # Formulate the url based on the query id
-        redirect_url = '{BBB_URL}/#search/q=*%3A*&__qid={query_id}'.format(
-            BBB_URL=current_app.config['BUMBLEBEE_URL'],
-            query_id=query_id
-        )
+        deferred = False
+        try:
+            if not upload.unique:
+                return dict(rejected, error='no bibcodes'), 400
+            redirect_url = direct_redirect_url(upload)
+
+            if redirect_url is None and self.prefers_deferred(upload):
+                token = current_app.extensions['deferred_jobs'].create()
+                if token is not None:
+                    current_app.extensions['deferred_executor'].submit(
+                        store_deferred, current_app._get_current_object(), token, upload,
+                        time.time() + current_app.config['DEFERRED_DEADLINE'], g.get('admitted_bytes', 0)
+                    )
+                    # the job releases the bytes of the upload it holds
+                    g.pop('admitted_bytes', None)
+                    deferred = True
+                    status_url = url_for('redirectjobview', token=token)
+                    current_app.logger.info('Deferred storing {} bibcodes as job {}'.format(len(upload.unique), token))
+                    return dict(rejected, job=token, status=status_url), 202, {
+                        'Location': status_url, 'Retry-After': str(current_app.config['DEFERRED_POLL_SECONDS'])}
+                current_app.logger.warning('Deferred job store full, storing {} bibcodes now'.format(
+                    len(upload.unique)))
+
+            if redirect_url is None:
+                try:
+                    redirect_url = stored_redirect_url(upload, deadline)
+                except vault.VaultError as e:
+                    return e.text, e.status_code, e.headers
+                except vault.VaultUnavailable as e:
+                    return dict(rejected, error='vault unavailable'), 503, {'Retry-After': str(e.retry_after)}
+        finally:
+            # a deferred job closes the upload once vault has it
+            if not deferred:
+                upload.close()
         current_app.logger.info(
             'Returning redirect: {}'.format(redirect_url)
         )
 
         # Return the query id to the user
-        return {'redirect': redirect_url}, 200
+        return dict(rejected, redirect=redirect_url), 200
+
+    @staticmethod
+    def prefers_deferred(upload):
+        """whether the client asked for the list to be stored in the background and it is worth it"""
+        min_bibcodes = current_app.config['DEFERRED_MIN_BIBCODES']
+        return (
+            'respond-async' in request.headers.get('Prefer', '')
+            and 0 < min_bibcodes <= len(upload.unique)
+            and vault.cached_query_id(upload) is None
+        )
+
+
+class RedirectJobView(Resource):
+    """
+    Status of a list of bibcodes stored in vault in the background
+    """
+
+    def get(self, token):
+        """
+        HTTP GET request
+
+        Returns:
+        200: the redirect, once vault returned the qid
+        202: the job is still pending, poll again after Retry-After seconds
+        404: unknown or expired job
+        the status code and error of vault, or 500 when the job failed otherwise
+
+        :return: dict
+        """
+        job = current_app.extensions['deferred_jobs'].get(token)
+        if job is None:
+            return {'error': 'unknown job'}, 404
+        if job['state'] == 'pending':
+            return {'job': token, 'state': 'pending'}, 202, {
+                'Retry-After': str(current_app.config['DEFERRED_POLL_SECONDS'])}
+        if job['state'] == 'failed':
+            headers = {}
+            if job['status_code'] == 503:
+                headers['Retry-After'] = str(current_app.extensions['vault_breaker'].retry_after())
+            return {'job': token, 'state': 'failed', 'error': job['error']}, job['status_code'], headers
+        return {'job': token, 'state': 'done',
+                'redirect': vault.query_id_url(job['qid'], current_app.config['BUMBLEBEE_URL'])}, 200
+
+
+def batch_item(app, name, upload, deadline):
+    """
+    the redirect of one list of a batch, or its error, stored from the batch executor
+    """
+    result = {'name': name, 'rejected': upload.rejected, 'rejected_count': upload.rejected_count}
+    with app.app_context():
+        try:
+            if not upload.unique:
+                return dict(result, error='no bibcodes', status_code=400)
+            redirect_url = direct_redirect_url(upload) or stored_redirect_url(upload, deadline)
+        except vault.VaultError as e:
+            return dict(result, error=e.text, status_code=e.status_code)
+        except vault.VaultUnavailable as e:
+            return dict(result, error='vault unavailable', status_code=503, retry_after=e.retry_after)
+        except HTTPException as e:
+            return dict(result, error=e.name, status_code=e.code)
+        except Exception:
+            app.logger.error('batch list {} failed: {}'.format(name, traceback.format_exc()))
+            return dict(result, error='internal error', status_code=500)
+    return dict(result, redirect=redirect_url, status_code=200)
+
+
+class BatchRedirectView(Resource):
+    """
+    Redirects of many bibcode lists in one call, for exports of saved classic result sets
+    """
+    method_decorators = [admitted]
+
+    def post(self):
+        """
+        HTTP POST request
+
+        The body is a json array of {"name": ..., "bibcodes": [...]} objects,
+        optionally gzip or deflate encoded. Each list is validated and redirected
+        as by /redirect, the calls to vault are made concurrently by the
+        BATCH_CONCURRENCY threads of the worker, sharing its pooled session, until
+        BATCH_DEADLINE. A list that fails does not fail the others.
+
+        Returns:
+        200: {"results": [...]} in the order of the lists, each with its name,
+             rejected entries, status_code and redirect or error
+        400: the body is not a json array
+        413: more than UPLOAD_MAX_BYTES bytes, BATCH_MAX_LISTS lists or UPLOAD_MAX_BIBCODES bibcodes
+        415: Content-Encoding is not gzip or deflate
+        503: the admission budget of payload bytes in flight is exhausted
+
+        :return: dict
+        """
+        deadline = time.time() + current_app.config['BATCH_DEADLINE']
+        lists = read_batch(request)
+        current_app.logger.info('Received a batch of {} bibcode lists'.format(len(lists)))
+        app = current_app._get_current_object()
+        executor = current_app.extensions['batch_executor']
+        try:
+            futures = [
+                executor.submit(batch_item, app, name, upload, deadline) if upload is not None
+                else None
+                for name, upload, error in lists
+            ]
+            results = [
+                future.result() if future is not None
+                else {'name': name, 'error': error, 'status_code': 400}
+                for future, (name, upload, error) in zip(futures, lists)
+            ]
+        finally:
+            for name, upload, error in lists:
+                if upload is not None:
+                    upload.close()
+        return {'results': results}, 200
@@ -0,0 +1,15 @@
+"""
+Helpers about the worker processes that share state in memory
+"""
+
+import os
+import errno
+
+
+def process_alive(pid):
+    """whether a process with this pid exists"""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True